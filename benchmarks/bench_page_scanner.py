@@ -0,0 +1,110 @@
+"""
+Micro-benchmark: qombol.com page scanning
+Compares the original re.findall cascade with page_scanner over the saved
+HTML fixtures, checks both find the same URLs, and prints per-page times.
+
+    python benchmarks/bench_page_scanner.py [--rounds N]
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import page_scanner
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# The cascade resolve_qombol_page used before page_scanner
+LEGACY_VIDEO = [
+    r'<video[^>]*src=["\']([^"\']+)["\']',
+    r'<source[^>]*src=["\']([^"\']+)["\']',
+    r'file:\s*["\']([^"\']+\.(?:mp4|avi|mkv|mov|wmv|flv|webm|m3u8))["\']',
+    r'src:\s*["\']([^"\']+\.(?:mp4|avi|mkv|mov|wmv|flv|webm|m3u8))["\']',
+    r'video_url["\']?\s*:\s*["\']([^"\']+)["\']',
+    r'videoUrl["\']?\s*:\s*["\']([^"\']+)["\']',
+    r'mp4["\']?\s*:\s*["\']([^"\']+)["\']',
+    r'https?://[^"\'\s]*\.b-cdn\.net/[^"\'\s]*\.(?:mp4|avi|mkv|mov|wmv|flv|webm)',
+    r'https?://[^"\'\s]*cdn[^"\'\s]*\.(?:mp4|avi|mkv|mov|wmv|flv|webm)',
+    r'https?://[^"\'\s]+\.(?:mp4|avi|mkv|mov|wmv|flv|webm|m3u8)',
+    r'wp-content/uploads/[^"\'\s]*\.(?:mp4|avi|mkv|mov|wmv|flv|webm)',
+]
+LEGACY_EMBED = [
+    r'<iframe[^>]*src=["\']([^"\']+)["\']',
+    r'<embed[^>]*src=["\']([^"\']+)["\']',
+    r'embed_url["\']?\s*:\s*["\']([^"\']+)["\']',
+    r'player["\']?\s*:\s*["\']([^"\']+)["\']',
+]
+LEGACY_MEDIA = [
+    r'(https?://[^"\'\s]*(?:video|media|stream)[^"\'\s]*\.(?:mp4|avi|mkv|mov|wmv|flv|webm))',
+    r'(https?://[^"\'\s]*\.(?:mp4|avi|mkv|mov|wmv|flv|webm)[^"\'\s]*)',
+]
+
+
+def legacy_scan(html: str) -> dict:
+    """Worst case of the old code path: every stage runs when no direct video is found"""
+    for pattern in LEGACY_VIDEO:
+        matches = re.findall(pattern, html, re.IGNORECASE)
+        if matches:
+            return {'video': matches[0], 'embeds': [], 'media': None}
+    embeds = []
+    for pattern in LEGACY_EMBED:
+        matches = re.findall(pattern, html, re.IGNORECASE)
+        if matches:
+            embeds.append(matches[0])
+    media = None
+    for pattern in LEGACY_MEDIA:
+        matches = re.findall(pattern, html, re.IGNORECASE)
+        if matches:
+            media = matches[0]
+            break
+    # ...and the iframe rescan before giving up
+    re.findall(LEGACY_EMBED[0], html, re.IGNORECASE)
+    return {'video': None, 'embeds': embeds, 'media': media}
+
+
+def scanner_scan(html: str) -> dict:
+    found = page_scanner.scan_qombol_page(page_scanner.Page(html))
+    return {
+        'video': found['video'][1],
+        'embeds': [url for _, url in found['embeds']],
+        'media': found['media'][1],
+    }
+
+
+def timed(func, html: str, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(html)
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'fixture':<32} {'size':>8} {'legacy':>10} {'scanner':>10} {'speedup':>8}")
+    for name in sorted(os.listdir(FIXTURES)):
+        if not name.endswith('.html'):
+            continue
+        with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+            html = f.read()
+
+        expected = legacy_scan(html)
+        actual = scanner_scan(html)
+        if expected != actual:
+            print(f"❌ {name}: results differ\n   legacy:  {expected}\n   scanner: {actual}")
+            sys.exit(1)
+
+        legacy_ms = timed(legacy_scan, html, args.rounds)
+        scanner_ms = timed(scanner_scan, html, args.rounds)
+        print(f"{name:<32} {len(html) // 1024:>6}KB {legacy_ms:>8.2f}ms {scanner_ms:>8.2f}ms "
+              f"{legacy_ms / scanner_ms:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
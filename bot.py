@@ -4,32 +4,102 @@ import aiohttp
 import tempfile
 import time
 import re
-import subprocess
 import logging
 import shutil
+import uuid
 from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlparse
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from reddit_auth import reddit_auth, start_auth_server
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, Message, InputFile, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
 from telegram.constants import ParseMode
 from telegram.request import HTTPXRequest
 from telegram.error import Conflict, BadRequest, Forbidden
-import yt_dlp
 from config import (
     BOT_TOKEN,
     BOT_API_BASE_URL,
+    BOT_API_LOCAL_MODE,
+    BOT_API_SHARED_DIR,
     BOT_API_BASE_FILE_URL,
     TG_SESSION_STRING,
     BRIDGE_CHANNEL_ID,
     AUTHORIZED_USERS as CFG_AUTH_USERS,
     ALLOW_ALL,
+    DOWNLOAD_CONNECTIONS,
+    DOWNLOAD_SEGMENT_RETRIES,
+    PARTIAL_DOWNLOAD_TTL_HOURS,
+    MAX_CONCURRENT_DOWNLOADS,
+    MAX_DOWNLOADS_PER_USER,
+    MAX_QUEUED_PER_USER,
+    YTDLP_WORKERS,
+    YTDLP_RECYCLE_AFTER,
+    MEDIA_CACHE_PATH,
+    MEDIA_CACHE_TTL_DAYS,
+    MEDIA_CACHE_MAX_ENTRIES,
+    EXTRACTION_CACHE_TTL,
+    EXTRACTION_CACHE_MAX_ENTRIES,
+    EXTRACTION_CACHE_PATH,
+    MEDIADELIVERY_PROBE_CONCURRENCY,
+    STREAM_RELAY,
+    STREAM_RELAY_BUFFER_CHUNKS,
+    PROGRESS_EDITS_PER_SECOND,
+    PROGRESS_EDIT_INTERVAL,
+    FFPROBE_CONCURRENCY,
+    VIDEO_FASTSTART,
+    VIDEO_THUMBNAILS,
+    FFMPEG_CONCURRENCY,
+    MAX_UPLOAD_SIZE_MB,
+    DEFAULT_VIDEO_HEIGHT,
+    YTDLP_CONCURRENT_FRAGMENTS,
+    YTDLP_EXTERNAL_DOWNLOADER,
+    YTDLP_ARIA2C_CONNECTIONS,
+    YTDLP_MIN_TIMEOUT,
+    YTDLP_MAX_TIMEOUT,
+    YTDLP_STALL_TIMEOUT,
+    YTDLP_MIN_SPEED_KBPS,
+    BRIDGE_WARMUP,
+    BRIDGE_KEEPALIVE_INTERVAL,
 )
+from downloader import RangedDownload, partial_path, remove_partial, clean_stale_partials
+from http_sessions import session_registry
+from scheduler import DownloadScheduler, QueueFull, QUEUED
+import ytdlp_pool
+from ytdlp_pool import YtdlpPool, DownloadWatchdog, DownloadStalled
+import media_cache
+from media_cache import MediaCache
+from extraction_cache import ExtractionCache, info_media_urls
+from single_flight import SingleFlight
+import page_scanner
+import site_handlers
+from site_handlers import site_registry
+from stream_relay import StreamRelay, RelayError
+from transfer_progress import TransferProgress, ProgressReader, upload_throughput
+from progress_dispatcher import ProgressDispatcher
+from media_probe import MediaProbe
+from video_prep import VideoPrep
+import file_splitter
+import format_planner
+import metrics
 try:
-    from uploader import upload_to_bridge
+    from uploader import upload_to_bridge, get_pool as get_bridge_pool
 except Exception:
     upload_to_bridge = None
+    get_bridge_pool = None
+
+# Direct media URL layouts behind a mediadelivery.net embed, most preferred first
+MEDIADELIVERY_CANDIDATES = [
+    ('mp4-720p', "https://vz-{library_id}.b-cdn.net/{video_id}/play_720p.mp4"),
+    ('mp4-480p', "https://vz-{library_id}.b-cdn.net/{video_id}/play_480p.mp4"),
+    ('mp4-360p', "https://vz-{library_id}.b-cdn.net/{video_id}/play_360p.mp4"),
+    ('mp4-240p', "https://vz-{library_id}.b-cdn.net/{video_id}/play_240p.mp4"),
+    ('hls', "https://vz-{library_id}.b-cdn.net/{video_id}/playlist.m3u8"),
+    ('iframe-play', "https://iframe.mediadelivery.net/play/{library_id}/{video_id}"),
+    ('cloudflare-hls', "https://customer-{library_id}.cloudflarestream.com/{video_id}/manifest/video.m3u8"),
+    ('videodelivery-mp4', "https://videodelivery.net/{video_id}/mp4/download"),
+]
 
 class TelegramDownloadBot:
     def __init__(self):
@@ -62,11 +132,102 @@ class TelegramDownloadBot:
                 media_write_timeout=None,
             )
             builder = builder.request(req).get_updates_request(req)
+            if BOT_API_LOCAL_MODE:
+                # Server started with --local: local files are sent as file:// paths
+                builder = builder.local_mode(True)
+                if BOT_API_SHARED_DIR:
+                    # Every download path comes from tempfile.gettempdir()
+                    os.makedirs(BOT_API_SHARED_DIR, exist_ok=True)
+                    tempfile.tempdir = BOT_API_SHARED_DIR
             application = builder.build()
-            print(f"🔗 Using Local Bot API server: {BOT_API_BASE_URL}")
+            print(f"🔗 Using Local Bot API server: {BOT_API_BASE_URL}" + (" (local mode)" if BOT_API_LOCAL_MODE else ""))
+
+        # Shared aiohttp sessions for downloads, scraping and Reddit
+        self.sessions = session_registry
+        
+        # Downloads run from a bounded worker pool, not inside the update handler
+        self.scheduler = DownloadScheduler(
+            max_concurrent=MAX_CONCURRENT_DOWNLOADS,
+            max_per_user=MAX_DOWNLOADS_PER_USER,
+            max_queued_per_user=MAX_QUEUED_PER_USER,
+        )
+        # Status messages of queued jobs, refreshed as the queue moves
+        self.queued_messages = {}  # job -> status message
+        self.scheduler.on_change = self.refresh_queue_positions
+        
+        # yt-dlp runs in worker processes, recycled after a number of jobs
+        self.ytdlp_pool = YtdlpPool(workers=YTDLP_WORKERS, recycle_after=YTDLP_RECYCLE_AFTER)
+        
+        # Already-delivered media, reused by file_id / bridge copy on repeat links
+        self.media_cache = MediaCache(
+            MEDIA_CACHE_PATH,
+            ttl_seconds=MEDIA_CACHE_TTL_DAYS * 86400,
+            max_entries=MEDIA_CACHE_MAX_ENTRIES,
+        )
+        
+        # Recent page extraction results, so repeat links skip re-scraping
+        self.extraction_cache = ExtractionCache(
+            max_entries=EXTRACTION_CACHE_MAX_ENTRIES,
+            default_ttl=EXTRACTION_CACHE_TTL,
+            disk_path=EXTRACTION_CACHE_PATH or None,
+        )
+        
+        # Progress edits from every job share one rate-limited, coalescing queue
+        self.progress = ProgressDispatcher(
+            edits_per_second=PROGRESS_EDITS_PER_SECOND,
+            min_interval=PROGRESS_EDIT_INTERVAL,
+        )
+        
+        # Video width/height/duration for uploads, without blocking the event loop
+        self.media_probe = MediaProbe(concurrency=FFPROBE_CONCURRENCY)
+        
+        # ffmpeg post-processing of videos (faststart remux, thumbnails)
+        self.video_prep = VideoPrep(concurrency=FFMPEG_CONCURRENCY)
+        
+        # Which handler (custom extractor, yt-dlp or direct) serves each site
+        self.sites = site_registry
+        
+        # Downloads in progress, so the same link requested twice is fetched once
+        self.flights = SingleFlight()
+        
+        # mediadelivery library ID -> name of the URL layout that worked for it last time
+        self.mediadelivery_patterns = {}
+        
+        # Per-user maximum video height chosen with /quality
+        self.quality_prefs = {}
+        # Separate video+audio formats can only be merged with ffmpeg
+        self.can_merge_formats = shutil.which('ffmpeg') is not None
+        # External downloader for yt-dlp, only if it is actually installed
+        self.external_downloader = None
+        if YTDLP_EXTERNAL_DOWNLOADER:
+            if shutil.which(YTDLP_EXTERNAL_DOWNLOADER):
+                self.external_downloader = YTDLP_EXTERNAL_DOWNLOADER
+                print(f"🧲 yt-dlp external downloader: {YTDLP_EXTERNAL_DOWNLOADER}")
+            else:
+                print(f"⚠️ {YTDLP_EXTERNAL_DOWNLOADER} not found; yt-dlp uses its native downloader")
+
+        # Bridge accounts (user sessions for large uploads), connected in post_init
+        self.bridge_pool = None
+        if TG_SESSION_STRING and BRIDGE_CHANNEL_ID != 0 and get_bridge_pool is not None:
+            self.bridge_pool = get_bridge_pool()
+        self.bridge_warmup = None
+        
+        # State the components already track is read when /metrics is scraped
+        metrics.registry.add_collector(self.collect_metrics)
+        self.loop = None  # set in post_init; the health server's thread reads state through it
 
         # Define a post_init hook to run after application initialization
         async def _post_init(app):
+            self.loop = asyncio.get_running_loop()
+            await self.sessions.open()
+            await self.scheduler.start()
+            await self.progress.start()
+            # Partial downloads left by crashes or users who never resent the link
+            await self.clean_partial_downloads()
+            if self.bridge_pool and BRIDGE_WARMUP:
+                # Handshake/auth now rather than on the first large upload; don't hold up polling
+                self.bridge_warmup = asyncio.create_task(self.bridge_pool.start(BRIDGE_KEEPALIVE_INTERVAL))
+            
             try:
                 await app.bot.delete_webhook(drop_pending_updates=True)
                 print("🔧 Webhook removed; polling enabled.")
@@ -74,7 +235,6 @@ class TelegramDownloadBot:
                 print(f"⚠️ Webhook removal failed: {e}")
             
             # Add retry mechanism for get_me() to handle flood control
-            import asyncio
             from telegram.error import RetryAfter
             
             for attempt in range(3):
@@ -98,8 +258,23 @@ class TelegramDownloadBot:
                         print(f"⚠️ Bot verification failed: {e}")
                         break
         
-        # Set the post_init hook
+        # Close pooled HTTP connections when the application stops
+        async def _post_shutdown(app):
+            await self.scheduler.stop()
+            if self.bridge_warmup:
+                self.bridge_warmup.cancel()
+            if self.bridge_pool:
+                await self.bridge_pool.stop()
+            await self.progress.stop()
+            self.ytdlp_pool.shutdown()
+            self.media_cache.close()
+            self.extraction_cache.close()
+            await self.sessions.close()
+            print("🔌 HTTP sessions closed")
+        
+        # Set the post_init / post_shutdown hooks
         application.post_init = _post_init
+        application.post_shutdown = _post_shutdown
         self.app = application
         
         # Load authorized users from config
@@ -118,6 +293,7 @@ class TelegramDownloadBot:
         self.app.add_handler(CommandHandler("help", self.help_command))
         self.app.add_handler(CommandHandler("id", self.id_command))
         self.app.add_handler(CommandHandler("reddit_login", self.reddit_login_command))
+        self.app.add_handler(CommandHandler("quality", self.quality_command))
         self.app.add_handler(CallbackQueryHandler(self.handle_callback_query))
         self.app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_link))
         # Centralized error handler (e.g., for 409 Conflict)
@@ -184,6 +360,23 @@ class TelegramDownloadBot:
                 "⚠️ این فرآیند فقط یک بار لازم است.",
                 reply_markup=reply_markup
             )
+        elif query.data.startswith("quality_"):
+            height = int(query.data.split("_")[-1])
+            user = query.from_user
+            if not self.is_authorized_user(user.id):
+                return
+            self.quality_prefs[user.id] = height
+            print(f"🎞️ {user.first_name} set video quality to {format_planner.quality_label(height)}")
+            
+            try:
+                await query.edit_message_text(
+                    f"✅ کیفیت ویدیو تنظیم شد: {self.quality_text(height)}",
+                    reply_markup=self.quality_keyboard(height)
+                )
+            except BadRequest as e:
+                if 'not modified' not in str(e):
+                    raise
+                # same choice tapped again: message not modified
 
     async def error_handler(self, update: object, context: ContextTypes.DEFAULT_TYPE):
         """Log errors globally to avoid noisy tracebacks and explain common cases."""
@@ -193,6 +386,71 @@ class TelegramDownloadBot:
             return
         print(f"⚠️ Unhandled error: {err}")
     
+    def on_event_loop(self, func, timeout: float = 5):
+        """Call func on the bot's event loop from another thread and return its result
+        
+        Component state (queues, dicts) is only changed on the loop; iterating it
+        from the health server's thread can fail with 'dictionary changed size'.
+        """
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            raise RuntimeError("bot event loop is not running")
+        
+        async def call():
+            return func()
+        return asyncio.run_coroutine_threadsafe(call(), loop).result(timeout)
+    
+    def bridge_status(self) -> dict:
+        """Bridge connection state for the health server (called from its thread)"""
+        if not self.bridge_pool:
+            return {'configured': False}
+        return self.on_event_loop(lambda: dict(self.bridge_pool.stats(), configured=True))
+    
+    def collect_metrics(self) -> list:
+        """Scrape-time metrics from the bot's components (called from the health server's thread)"""
+        return self.on_event_loop(lambda: list(self._collect_metrics()))
+    
+    def _collect_metrics(self):
+        """Metric families read from component state; runs on the event loop"""
+        scheduler = self.scheduler.stats()
+        yield 'jobs_running', 'gauge', 'Downloads running now', [({}, scheduler['running'])]
+        yield 'jobs_queued', 'gauge', 'Downloads waiting in the queue', [({}, scheduler['queued'])]
+        yield 'jobs_in_flight', 'gauge', 'Distinct links being downloaded (shared by identical requests)', [({}, len(self.flights))]
+        
+        caches = {'extraction': self.extraction_cache, 'media': self.media_cache}
+        yield 'cache_hits_total', 'counter', 'Cache hits', [({'cache': name}, c.hits) for name, c in caches.items()]
+        yield 'cache_misses_total', 'counter', 'Cache misses', [({'cache': name}, c.misses) for name, c in caches.items()]
+        
+        yield 'upload_rate_bytes', 'gauge', 'Moving average of measured upload speed', [
+            ({'path': path}, tracker.average_rate) for path, tracker in upload_throughput.items()
+        ]
+        
+        progress = self.progress.stats()
+        yield 'progress_edits_total', 'counter', 'Progress message edits sent', [({}, progress['edits'])]
+        yield 'progress_edits_skipped_total', 'counter', 'Progress edits coalesced or unchanged', [({}, progress['skipped'])]
+        yield 'progress_edits_pending', 'gauge', 'Progress edits waiting for the rate limit', [({}, progress['pending'])]
+        
+        yield 'media_probe_total', 'counter', 'Video metadata lookups by method', [
+            ({'method': 'mp4_header'}, self.media_probe.fast_path_hits),
+            ({'method': 'ffprobe'}, self.media_probe.ffprobe_runs),
+        ]
+        yield 'faststart_total', 'counter', 'Fast-start checks by outcome', [
+            ({'outcome': 'remuxed'}, self.video_prep.remuxed),
+            ({'outcome': 'skipped'}, self.video_prep.skipped),
+        ]
+        
+        if self.bridge_pool:
+            clients = self.bridge_pool.stats()['clients']
+            yield 'bridge_account_up', 'gauge', 'Bridge account connected (1) or not (0)', [
+                ({'account': c['name'], 'state': c['state']}, int(c['state'] == 'connected')) for c in clients
+            ]
+            yield 'bridge_account_uploads_active', 'gauge', 'Uploads running per bridge account', [
+                ({'account': c['name']}, c['active']) for c in clients
+            ]
+            yield 'bridge_account_reconnects_total', 'counter', 'Bridge reconnects', [
+                ({'account': c['name']}, c['reconnects']) for c in clients
+            ]
+    
     def is_authorized_user(self, user_id: int) -> bool:
         """Check if user is authorized to use the bot"""
         if self.allow_all:
@@ -249,6 +507,7 @@ class TelegramDownloadBot:
 • `/help` - نمایش این راهنما
 • `/id` - نمایش شناسه کاربری
 • `/reddit_login` - ورود به Reddit
+• `/quality` - انتخاب کیفیت ویدیو
 • تمام فرمت‌های فایل
 • بدون محدودیت حجم فایل
 
@@ -262,6 +521,38 @@ https://example.com/image.jpg
         await update.message.reply_text(help_message)
         print(f"✅ Help message sent to {user.first_name}")
     
+    def quality_text(self, height: int) -> str:
+        return f"حداکثر {height}p" if height else "بهترین کیفیت ممکن"
+    
+    def quality_keyboard(self, current: int) -> InlineKeyboardMarkup:
+        buttons = [
+            InlineKeyboardButton(
+                ("✅ " if height == current else "") + (f"{height}p" if height else "بهترین"),
+                callback_data=f"quality_{height}"
+            )
+            for height in format_planner.QUALITY_CHOICES
+        ]
+        return InlineKeyboardMarkup([buttons[:3], buttons[3:]])
+    
+    def video_quality(self, user_id: int) -> int:
+        """Maximum video height for a user's yt-dlp downloads (0 = best that fits)"""
+        return self.quality_prefs.get(user_id, DEFAULT_VIDEO_HEIGHT)
+    
+    async def quality_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /quality command: pick the maximum video height"""
+        user = update.effective_user
+        print(f"🎞️ /quality command received from {user.first_name} - ID: {user.id}")
+        if not self.is_authorized_user(user.id):
+            return
+        
+        current = self.video_quality(user.id)
+        await update.message.reply_text(
+            f"🎞️ کیفیت ویدیوهای دانلودی را انتخاب کنید.\n"
+            f"کیفیت فعلی: {self.quality_text(current)}\n\n"
+            f"اگر حجم ویدیو از سقف آپلود بیشتر باشد، بهترین کیفیتی که جا شود انتخاب می‌شود.",
+            reply_markup=self.quality_keyboard(current)
+        )
+    
     async def id_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Return user's Telegram ID for whitelisting"""
         user = update.effective_user
@@ -290,58 +581,221 @@ https://example.com/image.jpg
             await update.message.reply_text("❌ لینک نامعتبر است! لطفاً یک لینک مستقیم دانلود یا لینک ویدیو ارسال کنید.")
             return
         
-        # Send processing message
-        print(f"⏳ Starting download process for {user.first_name}")
-        processing_msg = await update.message.reply_text("⏳ در حال دانلود فایل...")
+        await self.enqueue_link(update, context, url)
+    
+    async def enqueue_link(self, update: Update, context: ContextTypes.DEFAULT_TYPE, url: str, status_msg=None):
+        """Queue a link for download, or attach to an identical download already in progress"""
+        user = update.effective_user
+        key = self.link_key(url, user.id)
         
-        try:
-            # Check if it's qombol.com - handle specially
-            if 'qombol.com' in url.lower():
-                print(f"🎬 Detected qombol.com URL, using custom handler: {url}")
-                result = await self.download_qombol_content(url, processing_msg, user.first_name)
-                if result == (None, None, None):
-                    # Handler provided user message, no further action needed
-                    return
-                file_path, filename, file_size = result
-            # Check if it's Instagram - handle specially
-            elif 'instagram.com' in url.lower():
-                print(f"📸 Detected Instagram URL, using custom handler: {url}")
-                result = await self.download_instagram_content(url, processing_msg, user.first_name)
-                if result == (None, None, None):
+        # Same link already downloading for someone: wait for it instead of downloading twice
+        flight = self.flights.get(key)
+        if flight:
+            print(f"🔗 {user.first_name} joined the in-flight download of {url}")
+            text = "🔗 این لینک همین حالا در حال دانلود است؛ پس از اتمام برای شما هم ارسال می‌شود."
+            if status_msg:
+                await status_msg.edit_text(text)
+            else:
+                status_msg = await update.message.reply_text(text)
+            flight.attach(status_msg)
+            asyncio.create_task(self.follow_flight(update, context, url, flight, status_msg))
+            return
+        
+        # Hand the download to the scheduler; the handler returns right away
+        holder = {'msg': status_msg, 'queued': False}
+        ready = asyncio.Event()
+        flight = None
+        
+        async def run_job():
+            # A worker may pick the job up before the status reply has been sent
+            await ready.wait()
+            processing_msg = holder['msg']
+            entry, error = None, None
+            started = time.monotonic()
+            try:
+                if processing_msg is None:
                     return
-                file_path, filename, file_size = result
-            # Check if it's Reddit - handle specially  
-            elif 'reddit.com' in url:
-                print(f"🔴 Detected Reddit URL, using custom handler: {url}")
-                file_path, filename, file_size = await self.download_reddit_content(url, processing_msg, user.first_name, user.id)
-            # Check if it's a video site URL that needs yt-dlp
-            elif self.is_video_site_url(url):
-                print(f"📹 Detected video site URL, using yt-dlp: {url}")
-                file_path, filename, file_size = await self.download_video_with_ytdlp(url, processing_msg, user.first_name)
+                if self.queued_messages.pop(job, None) is not None:
+                    # A queue position refresh may still be pending for this message
+                    self.progress.discard(processing_msg)
+                if holder['queued']:
+                    try:
+                        await processing_msg.edit_text("⏳ در حال دانلود فایل...")
+                    except:
+                        pass
+                entry = await self.process_link(update, context, url, flight.progress(processing_msg))
+                metrics.jobs.inc(result='ok')
+                metrics.job_seconds.observe(time.monotonic() - started)
+            except Exception as e:
+                error = e
+                metrics.jobs.inc(result='error')
+                print(f"❌ Error processing request from {user.first_name}: {str(e)}")
+                await processing_msg.edit_text(f"❌ خطا در دانلود فایل: {str(e)}")
+            finally:
+                self.flights.finish(flight, entry, error)
+        
+        try:
+            job = self.scheduler.submit(user.id, run_job, label=url)
+        except QueueFull:
+            print(f"🚫 Queue full for {user.first_name} (ID: {user.id})")
+            text = f"🚫 شما در حال حاضر {MAX_QUEUED_PER_USER} دانلود در صف دارید. لطفاً صبر کنید تا تمام شوند."
+            if status_msg:
+                await status_msg.edit_text(text)
             else:
-                # Download the file with progress
-                print(f"📥 Downloading file from: {url}")
-                file_path, filename, file_size = await self.download_file(url, processing_msg, user.first_name)
-            print(f"✅ File downloaded successfully: {filename} ({self.format_file_size(file_size)})")
-            
-            # No file size limit - removed all restrictions
-            
-            # Upload with progress tracking - detect file type
-            print(f"📤 Uploading file to Telegram for {user.first_name}")
-            await self.upload_with_progress(update, context, processing_msg, file_path, filename, file_size, user.first_name)
-            
-            print(f"✅ File successfully sent to {user.first_name}: {filename}")
-            
-            # Delete processing message
-            await processing_msg.delete()
-            
-            # Schedule file deletion after 20 seconds
-            print(f"🗑️ Scheduled file cleanup in 20 seconds: {filename}")
-            asyncio.create_task(self.delayed_file_cleanup(file_path, 20))
-            
+                await update.message.reply_text(text)
+            return
+        flight = self.flights.begin(key)
+        
+        try:
+            holder['queued'] = self.scheduler.will_wait(job)
+            if holder['queued']:
+                position = self.scheduler.position(job)
+                print(f"🕒 Queued job #{job.id} for {user.first_name} at position {position}")
+                text = self.queue_position_text(position)
+            else:
+                print(f"⏳ Starting download process for {user.first_name}")
+                text = "⏳ در حال دانلود فایل..."
+            if holder['msg']:
+                await holder['msg'].edit_text(text)
+            else:
+                holder['msg'] = await update.message.reply_text(text)
+            if holder['queued'] and job.state == QUEUED:
+                self.queued_messages[job] = holder['msg']
+        finally:
+            ready.set()
+    
+    def queue_position_text(self, position: int) -> str:
+        return f"🕒 درخواست شما در صف دانلود قرار گرفت.\n📍 جایگاه شما در صف: {position}"
+    
+    def refresh_queue_positions(self):
+        """Scheduler hook: show queued jobs their new place after a job starts or finishes"""
+        for job, message in list(self.queued_messages.items()):
+            position = self.scheduler.position(job)
+            if position:
+                # Coalesced and deduplicated by the dispatcher: unchanged positions cost no edit
+                self.progress.submit(message, self.queue_position_text(position))
+    
+    def link_key(self, url: str, user_id: int) -> str:
+        """Cache/flight key for a link; yt-dlp links also depend on the user's quality setting
+
+        Handlers that download with the user's own credentials (Reddit) are keyed
+        per user, so nobody is served media their account couldn't fetch.
+        """
+        key = media_cache.url_key(url)
+        handler = self.sites.resolve(url)
+        if handler.needs_user:
+            key += f":u{user_id}"
+        if handler.capability == site_handlers.YTDLP:
+            key += f":{format_planner.quality_label(self.video_quality(user_id))}"
+        return key
+    
+    async def follow_flight(self, update: Update, context: ContextTypes.DEFAULT_TYPE, url: str, flight, status_msg):
+        """Wait for another request's download of the same link, then send its result"""
+        try:
+            entry = await flight.wait()
         except Exception as e:
-            print(f"❌ Error processing request from {user.first_name}: {str(e)}")
-            await processing_msg.edit_text(f"❌ خطا در دانلود فایل: {str(e)}")
+            try:
+                await status_msg.edit_text(f"❌ خطا در دانلود فایل: {str(e)}")
+            except BadRequest as e:
+                if 'not modified' not in str(e):
+                    raise
+                # the mirrored progress already shows this text: message not modified
+            return
+        finally:
+            flight.detach(status_msg)
+        
+        if entry and await self.send_cached(update, context, self.link_key(url, update.effective_user.id), status_msg):
+            return
+        # Nothing reusable came out of it (e.g. the upload fell back to a text reply): try ourselves
+        await self.enqueue_link(update, context, url, status_msg)
+    
+    async def process_link(self, update: Update, context: ContextTypes.DEFAULT_TYPE, url: str, processing_msg):
+        """Download a link and upload the result; runs on a scheduler worker
+        
+        Returns the delivered media entry (None if nothing reusable was sent).
+        """
+        user = update.effective_user
+        # Served before? Resend by file_id / bridge copy without downloading
+        cache_keys = [self.link_key(url, user.id)]
+        entry = await self.send_cached(update, context, cache_keys[0], processing_msg)
+        if entry:
+            return entry
+        
+        # Route by registered domain: site-specific extractor, yt-dlp or direct download
+        handler = self.sites.resolve(url)
+        if handler.capability == site_handlers.CUSTOM:
+            print(f"{handler.emoji} Detected {handler.name} URL, using custom handler: {url}")
+            download = getattr(self, handler.extractor)
+            extra = {'user_id': user.id} if handler.needs_user else {}
+            result = await download(url, processing_msg, user.first_name, **extra)
+            if result == (None, None, None):
+                # Handler provided user message, no further action needed
+                return
+            file_path, filename, file_size = result
+        elif handler.capability == site_handlers.YTDLP:
+            print(f"{handler.emoji} Detected {handler.name} URL, using yt-dlp: {url}")
+            # Different links to the same video share one cache entry
+            info = await self.extract_video_info(url)
+            # Best format for the upload ceiling and the user's quality setting
+            plan = format_planner.plan_format(
+                info, self.upload_ceiling(), self.video_quality(user.id), can_merge=self.can_merge_formats
+            )
+            if plan:
+                print(f"🎞️ Format plan for {user.first_name}: {plan}")
+            cache_keys.append(media_cache.video_key(info, plan.spec if plan else None))
+            entry = await self.send_cached(update, context, cache_keys[-1], processing_msg)
+            if entry:
+                self.media_cache.put(cache_keys[:1], entry)
+                return entry
+            expected_size = plan.size if plan and plan.size else self.expected_video_size(info)
+            await self.preflight_size(expected_size, processing_msg)
+            file_path, filename, file_size = await self.download_video_with_ytdlp(
+                url, processing_msg, user.first_name, info=info,
+                format_spec=plan.spec if plan else None, expected_size=expected_size
+            )
+        else:
+            # With a Local Bot API server, stream straight through instead of via a temp file
+            if STREAM_RELAY and BOT_API_BASE_URL:
+                delivered = await self.relay_file(update, context, url, processing_msg, user.first_name)
+                if delivered:
+                    if delivered.get('file_id'):
+                        self.media_cache.put(cache_keys, delivered)
+                    print(f"✅ File relayed to {user.first_name}: {delivered['filename']}")
+                    try:
+                        await processing_msg.delete()
+                    except:
+                        pass
+                    return delivered
+            # Download the file with progress
+            print(f"📥 Downloading file from: {url}")
+            file_path, filename, file_size = await self.download_file(url, processing_msg, user.first_name)
+        print(f"✅ File downloaded successfully: {filename} ({self.format_file_size(file_size)})")
+        
+        # No file size limit - removed all restrictions
+        
+        # Upload with progress tracking - detect file type
+        print(f"📤 Uploading file to Telegram for {user.first_name}")
+        if file_size > self.upload_ceiling():
+            # Parts aren't one reusable file_id, so nothing is cached
+            delivered = await self.upload_in_parts(update, context, processing_msg, file_path, filename, file_size, user.first_name)
+        else:
+            delivered = await self.upload_with_progress(update, context, processing_msg, file_path, filename, file_size, user.first_name)
+        if delivered:
+            delivered.update(filename=filename, file_size=file_size)
+            self.media_cache.put(cache_keys, delivered)
+        
+        print(f"✅ File successfully sent to {user.first_name}: {filename}")
+        
+        # Delete processing message
+        try:
+            await processing_msg.delete()
+        except:
+            pass
+        
+        # Schedule file deletion after 20 seconds
+        print(f"🗑️ Scheduled file cleanup in 20 seconds: {filename}")
+        asyncio.create_task(self.delayed_file_cleanup(file_path, 20))
+        return delivered
     
     def is_valid_url(self, url: str) -> bool:
         """Check if the provided string is a valid URL"""
@@ -353,146 +807,51 @@ https://example.com/image.jpg
     
     def is_video_site_url(self, url: str) -> bool:
         """Check if URL is from supported video sites"""
-        video_sites = [
-            'pornhub.com', 'www.pornhub.com',
-            'youtube.com', 'www.youtube.com', 'youtu.be',
-            'xvideos.com', 'www.xvideos.com',
-            'xnxx.com', 'www.xnxx.com',
-            'porn300.com', 'www.porn300.com',
-            'xvv1deos.com', 'www.xvv1deos.com',
-            'motherless.com', 'www.motherless.com'
-        ]
-        try:
-            parsed = urlparse(url.lower())
-            return any(site in parsed.netloc for site in video_sites)
-        except:
-            return False
+        return self.sites.resolve(url).capability == site_handlers.YTDLP
     
     async def extract_mediadelivery_video(self, embed_url: str) -> str:
-        """Extract direct video URL from mediadelivery.net embed"""
+        """Extract direct video URL from mediadelivery.net embed (cached until the URL expires)"""
+        return await self.extraction_cache.get_or_compute(
+            f"mediadelivery:{embed_url}",
+            lambda: self.measure_extraction('mediadelivery', self._extract_mediadelivery_video(embed_url)),
+            urls=lambda video_url: [video_url],
+        )
+    
+    async def _extract_mediadelivery_video(self, embed_url: str) -> str:
         try:
             print(f"🔍 Extracting from mediadelivery embed: {embed_url}")
             
             # Fetch the embed page
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Referer': 'https://www.qombol.com/',
-            }
-            
-            timeout = aiohttp.ClientTimeout(total=30, connect=10)
-            async with aiohttp.ClientSession(timeout=timeout, headers=headers) as session:
-                async with session.get(embed_url) as response:
-                    if response.status != 200:
-                        raise Exception(f"HTTP {response.status}")
-                    
-                    embed_content = await response.text()
+            session = self.sessions.get('browser')
+            headers = {'Referer': 'https://www.qombol.com/'}
+            async with session.get(embed_url, headers=headers) as response:
+                if response.status != 200:
+                    raise Exception(f"HTTP {response.status}")
+                
+                embed_content = await response.text()
             
             print(f"📄 Embed page content length: {len(embed_content)}")
             
             # Look for video URLs in the embed page
-            import re
-            video_patterns = [
-                r'"src":\s*"([^"]*\.mp4[^"]*)"',
-                r'"file":\s*"([^"]*\.mp4[^"]*)"',
-                r'"url":\s*"([^"]*\.mp4[^"]*)"',
-                r'src:\s*"([^"]*\.mp4[^"]*)"',
-                r'file:\s*"([^"]*\.mp4[^"]*)"',
-                r'https://[^"\s]*\.b-cdn\.net/[^"\s]*\.mp4',
-                r'https://[^"\s]*bunnycdn[^"\s]*\.mp4',
-                r'https://[^"\s]*mediadelivery[^"\s]*\.mp4',
-            ]
-            
-            for i, pattern in enumerate(video_patterns):
-                matches = re.findall(pattern, embed_content, re.IGNORECASE)
-                if matches:
-                    video_url = matches[0]
-                    print(f"✅ Found video URL with pattern {i+1}: {video_url}")
-                    
-                    # Clean up the URL (remove escape characters)
-                    video_url = video_url.replace('\\/', '/')
-                    return video_url
+            i, video_url = await page_scanner.scan(page_scanner.MEDIADELIVERY_VIDEO.first, embed_content)
+            if video_url:
+                print(f"✅ Found video URL with pattern {i+1}: {video_url}")
+                
+                # Clean up the URL (remove escape characters)
+                video_url = video_url.replace('\\/', '/')
+                return video_url
             
             # If no direct video found, try to construct the URL from embed parameters
             # Extract video ID from embed URL
-            import re
             video_id_match = re.search(r'/embed/(\d+)/([a-f0-9-]+)', embed_url)
             if video_id_match:
                 library_id = video_id_match.group(1)
                 video_id = video_id_match.group(2)
                 print(f"📋 Extracted IDs - Library: {library_id}, Video: {video_id}")
                 
-                # Try common BunnyCDN/MediaDelivery URL patterns
-                possible_urls = [
-                    f"https://vz-{library_id}.b-cdn.net/{video_id}/playlist.m3u8",
-                    f"https://vz-{library_id}.b-cdn.net/{video_id}/play_720p.mp4",
-                    f"https://vz-{library_id}.b-cdn.net/{video_id}/play_480p.mp4",
-                    f"https://vz-{library_id}.b-cdn.net/{video_id}/play_360p.mp4",
-                    f"https://vz-{library_id}.b-cdn.net/{video_id}/play_240p.mp4",
-                    f"https://iframe.mediadelivery.net/play/{library_id}/{video_id}",
-                    f"https://customer-{library_id}.cloudflarestream.com/{video_id}/manifest/video.m3u8",
-                    f"https://videodelivery.net/{video_id}/mp4/download",
-                ]
-                
-                # Create a new session for testing URLs with proper authentication headers
-                auth_headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                    'Referer': embed_url,
-                    'Origin': 'https://iframe.mediadelivery.net',
-                    'Accept': '*/*',
-                    'Accept-Language': 'en-US,en;q=0.9',
-                    'Accept-Encoding': 'gzip, deflate, br',
-                    'Connection': 'keep-alive',
-                    'Sec-Fetch-Dest': 'video',
-                    'Sec-Fetch-Mode': 'cors',
-                    'Sec-Fetch-Site': 'cross-site',
-                }
-                
-                test_timeout = aiohttp.ClientTimeout(total=10, connect=5)
-                async with aiohttp.ClientSession(timeout=test_timeout, headers=auth_headers) as test_session:
-                    for i, test_url in enumerate(possible_urls):
-                        try:
-                            print(f"🔍 Testing URL {i+1}: {test_url}")
-                            
-                            # Try both HEAD and GET requests
-                            for method in ['HEAD', 'GET']:
-                                try:
-                                    if method == 'HEAD':
-                                        async with test_session.head(test_url, allow_redirects=True) as test_response:
-                                            status = test_response.status
-                                    else:
-                                        # For GET, only read first few bytes to check if it's valid
-                                        async with test_session.get(test_url, allow_redirects=True) as test_response:
-                                            status = test_response.status
-                                            if status == 200:
-                                                # Read first few bytes to verify it's a video
-                                                chunk = await test_response.content.read(1024)
-                                                if chunk and (b'ftyp' in chunk or b'moov' in chunk or b'#EXTM3U' in chunk):
-                                                    print(f"✅ Verified video content in URL: {test_url}")
-                                                    return test_url
-                                    
-                                    print(f"   {method} Response: {status}")
-                                    if status == 200:
-                                        print(f"✅ Found working video URL: {test_url}")
-                                        return test_url
-                                    elif status in [302, 301]:
-                                        # Follow redirect
-                                        redirect_url = str(test_response.headers.get('Location', ''))
-                                        if redirect_url and any(ext in redirect_url for ext in ['.mp4', '.m3u8']):
-                                            print(f"✅ Found redirect video URL: {redirect_url}")
-                                            return redirect_url
-                                    elif status == 403:
-                                        # 403 might mean the URL exists but needs different auth
-                                        continue
-                                    else:
-                                        break  # Try next URL
-                                        
-                                except Exception as e:
-                                    print(f"   {method} Error: {e}")
-                                    continue
-                                    
-                        except Exception as e:
-                            print(f"   Error: {e}")
-                            continue
+                video_url = await self.probe_mediadelivery_candidates(embed_url, library_id, video_id)
+                if video_url:
+                    return video_url
             
             print("⚠️ Could not extract direct video URL from mediadelivery embed")
             return None
@@ -501,6 +860,99 @@ https://example.com/image.jpg
             print(f"❌ Error extracting mediadelivery video: {e}")
             return None
     
+    async def probe_mediadelivery_candidates(self, embed_url: str, library_id: str, video_id: str) -> str:
+        """Probe the known CDN URL layouts concurrently; the most preferred one that works wins"""
+        candidates = [
+            (name, template.format(library_id=library_id, video_id=video_id))
+            for name, template in MEDIADELIVERY_CANDIDATES
+        ]
+        
+        # Videos from one library are served the same way: try last time's winner alone first
+        known = self.mediadelivery_patterns.get(library_id)
+        if known:
+            url = dict(candidates)[known]
+            video_url = await self.probe_media_url(url, embed_url)
+            if video_url:
+                print(f"⚡ Library {library_id} uses {known}: {video_url}")
+                return video_url
+            print(f"⚠️ Remembered pattern {known} failed for library {library_id}, probing all")
+            del self.mediadelivery_patterns[library_id]
+        
+        semaphore = asyncio.Semaphore(MEDIADELIVERY_PROBE_CONCURRENCY)
+        
+        async def probe(url):
+            async with semaphore:
+                return await self.probe_media_url(url, embed_url)
+        
+        tasks = [asyncio.create_task(probe(url)) for _, url in candidates]
+        try:
+            # Results are taken in preference order: candidate i wins once it has
+            # succeeded and every candidate before it has failed
+            best = 0
+            while best < len(tasks):
+                if not tasks[best].done():
+                    await asyncio.wait(tasks[best:], return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                video_url = tasks[best].result()
+                if video_url:
+                    name = candidates[best][0]
+                    self.mediadelivery_patterns[library_id] = name
+                    print(f"✅ Found working video URL ({name}): {video_url}")
+                    return video_url
+                best += 1
+            return None
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def probe_media_url(self, test_url: str, embed_url: str) -> str:
+        """Check a candidate media URL like a player would; returns the playable URL or None"""
+        test_session = self.sessions.get('media')
+        auth_headers = {
+            'Referer': embed_url,
+            'Origin': 'https://iframe.mediadelivery.net',
+        }
+        print(f"🔍 Testing URL: {test_url}")
+        
+        # Try both HEAD and GET requests
+        for method in ['HEAD', 'GET']:
+            try:
+                if method == 'HEAD':
+                    async with test_session.head(test_url, headers=auth_headers, allow_redirects=True) as test_response:
+                        status = test_response.status
+                else:
+                    # For GET, only read first few bytes to check if it's valid
+                    async with test_session.get(test_url, headers=auth_headers, allow_redirects=True) as test_response:
+                        status = test_response.status
+                        if status == 200:
+                            # Read first few bytes to verify it's a video
+                            chunk = await test_response.content.read(1024)
+                            if chunk and (b'ftyp' in chunk or b'moov' in chunk or b'#EXTM3U' in chunk):
+                                print(f"✅ Verified video content in URL: {test_url}")
+                                return test_url
+                
+                print(f"   {method} Response: {status}")
+                if status == 200:
+                    return test_url
+                elif status in [302, 301]:
+                    # Follow redirect
+                    redirect_url = str(test_response.headers.get('Location', ''))
+                    if redirect_url and any(ext in redirect_url for ext in ['.mp4', '.m3u8']):
+                        print(f"✅ Found redirect video URL: {redirect_url}")
+                        return redirect_url
+                elif status == 403:
+                    # 403 might mean the URL exists but needs different auth
+                    continue
+                else:
+                    break  # Try next URL
+                    
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"   {method} Error: {e}")
+                continue
+        return None
+    
     async def download_instagram_content(self, url: str, progress_msg=None, user_name: str = "") -> tuple:
         """Handle Instagram downloads with fallback message"""
         try:
@@ -551,20 +1003,18 @@ https://example.com/image.jpg
                 # This is a share URL, we need to resolve it first
                 token = reddit_auth.get_user_token(user_id)
                 headers = {
-                    'User-Agent': 'TelegramDownloadBot/1.0',
                     'Authorization': f'Bearer {token}',
                     'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
                 }
                 
-                timeout = aiohttp.ClientTimeout(total=30, connect=10)
-                async with aiohttp.ClientSession(timeout=timeout, headers=headers) as session:
-                    async with session.get(url, allow_redirects=True) as response:
-                        if response.status == 200:
-                            final_url = str(response.url)
-                            print(f"🔗 Resolved Reddit URL: {final_url}")
-                            url = final_url
-                        else:
-                            raise Exception(f"HTTP {response.status}")
+                session = self.sessions.get('reddit')
+                async with session.get(url, headers=headers, allow_redirects=True) as response:
+                    if response.status == 200:
+                        final_url = str(response.url)
+                        print(f"🔗 Resolved Reddit URL: {final_url}")
+                        url = final_url
+                    else:
+                        raise Exception(f"HTTP {response.status}")
             
             # Try to extract video using yt-dlp with authenticated session
             import tempfile
@@ -574,7 +1024,8 @@ https://example.com/image.jpg
             token = reddit_auth.get_user_token(user_id)
             
             ydl_opts = {
-                'outtmpl': os.path.join(temp_dir, '%(title)s.%(ext)s'),
+                'outtmpl': os.path.join(temp_dir, '%(title).100s [%(id)s].%(format_id)s.%(ext)s'),
+                'windowsfilenames': True,
                 'format': 'best[height<=720]/best',
                 'user_agent': 'TelegramDownloadBot/1.0',
                 'http_headers': {
@@ -590,31 +1041,13 @@ https://example.com/image.jpg
             if progress_msg:
                 await progress_msg.edit_text("⏬ در حال دانلود از Reddit...")
             
-            loop = asyncio.get_event_loop()
-            
-            def download_sync():
-                import yt_dlp
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(url, download=False)
-                    safe_title = "".join(c for c in info.get('title', 'reddit_video') if c.isalnum() or c in (' ', '-', '_')).rstrip()
-                    
-                    # Download
-                    with yt_dlp.YoutubeDL(ydl_opts) as ydl_download:
-                        ydl_download.download([url])
-                    
-                    return safe_title, info.get('filesize', 0)
-            
             try:
-                safe_title, file_size = await loop.run_in_executor(None, download_sync)
-                
-                # Find the downloaded file
-                for file in os.listdir(temp_dir):
-                    if safe_title in file and any(ext in file.lower() for ext in ['.mp4', '.webm', '.mkv', '.avi']):
-                        file_path = os.path.join(temp_dir, file)
-                        actual_size = os.path.getsize(file_path)
-                        return file_path, file, actual_size
-                        
-                raise Exception("Downloaded file not found")
+                # Extract once, then download from the same info dict
+                info = await self.ytdlp_pool.run(ytdlp_pool.extract_info, url, ydl_opts)
+                file_path = await self.ytdlp_pool.run(ytdlp_pool.download_info, info, ydl_opts)
+                if not os.path.exists(file_path):
+                    raise Exception("Downloaded file not found")
+                return file_path, os.path.basename(file_path), os.path.getsize(file_path)
                 
             except Exception as e:
                 print(f"⚠️ yt-dlp failed for Reddit: {e}")
@@ -634,9 +1067,6 @@ https://example.com/image.jpg
     
     async def download_qombol_content(self, url: str, progress_msg=None, user_name: str = "") -> tuple:
         """Download content from qombol.com by extracting video URLs from the page"""
-        import re
-        import tempfile
-        
         try:
             # Update progress message
             if progress_msg:
@@ -645,141 +1075,35 @@ https://example.com/image.jpg
                 except:
                     pass
             
-            # Fetch the webpage content with proper headers
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.5',
-                'Accept-Encoding': 'gzip, deflate',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-            }
-            
-            timeout = aiohttp.ClientTimeout(total=30, connect=10)
-            async with aiohttp.ClientSession(timeout=timeout, headers=headers) as session:
-                async with session.get(url) as response:
-                    if response.status != 200:
-                        raise Exception(f"HTTP {response.status}")
-                    
-                    html_content = await response.text()
-            
-            print(f"🔍 Analyzing HTML content (length: {len(html_content)})")
-            
-            # Enhanced patterns for qombol.com specifically
-            video_patterns = [
-                # Direct video tags
-                r'<video[^>]*src=["\']([^"\']+)["\']',
-                r'<source[^>]*src=["\']([^"\']+)["\']',
-                # JavaScript video URLs
-                r'file:\s*["\']([^"\']+\.(?:mp4|avi|mkv|mov|wmv|flv|webm|m3u8))["\']',
-                r'src:\s*["\']([^"\']+\.(?:mp4|avi|mkv|mov|wmv|flv|webm|m3u8))["\']',
-                r'video_url["\']?\s*:\s*["\']([^"\']+)["\']',
-                r'videoUrl["\']?\s*:\s*["\']([^"\']+)["\']',
-                r'mp4["\']?\s*:\s*["\']([^"\']+)["\']',
-                # CDN patterns common in adult sites
-                r'https?://[^"\'\s]*\.b-cdn\.net/[^"\'\s]*\.(?:mp4|avi|mkv|mov|wmv|flv|webm)',
-                r'https?://[^"\'\s]*cdn[^"\'\s]*\.(?:mp4|avi|mkv|mov|wmv|flv|webm)',
-                # Generic video file URLs
-                r'https?://[^"\'\s]+\.(?:mp4|avi|mkv|mov|wmv|flv|webm|m3u8)',
-                # WordPress media URLs
-                r'wp-content/uploads/[^"\'\s]*\.(?:mp4|avi|mkv|mov|wmv|flv|webm)',
-            ]
-            
-            video_url = None
-            for i, pattern in enumerate(video_patterns):
-                matches = re.findall(pattern, html_content, re.IGNORECASE)
-                if matches:
-                    print(f"✅ Found video with pattern {i+1}: {matches[0]}")
-                    video_url = matches[0]
-                    break
-            
-            if not video_url:
-                # Try to find embedded players
-                embed_patterns = [
-                    r'<iframe[^>]*src=["\']([^"\']+)["\']',
-                    r'<embed[^>]*src=["\']([^"\']+)["\']',
-                    r'embed_url["\']?\s*:\s*["\']([^"\']+)["\']',
-                    # Look for player URLs
-                    r'player["\']?\s*:\s*["\']([^"\']+)["\']',
-                ]
-                
-                for i, pattern in enumerate(embed_patterns):
-                    matches = re.findall(pattern, html_content, re.IGNORECASE)
-                    if matches:
-                        embed_url = matches[0]
-                        print(f"🔗 Found embed with pattern {i+1}: {embed_url}")
-                        
-                        # Check if it's a known video platform or streaming service
-                        if any(domain in embed_url.lower() for domain in ['youtube.com', 'vimeo.com', 'dailymotion.com', 'pornhub.com', 'xvideos.com', 'mediadelivery.net', 'bunnycdn.com', 'jwplayer.com']):
-                            print(f"🎯 Recognized video service: {embed_url}")
-                            # For mediadelivery.net, try to extract direct video URL
-                            if 'mediadelivery.net' in embed_url.lower():
-                                try:
-                                    video_url = await self.extract_mediadelivery_video(embed_url)
-                                    if video_url:
-                                        break
-                                except Exception as e:
-                                    print(f"⚠️ Failed to extract from mediadelivery: {e}")
-                            else:
-                                video_url = embed_url
-                                break
-                        # Or if it contains video file extension
-                        elif any(ext in embed_url.lower() for ext in ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm']):
-                            video_url = embed_url
-                            break
-            
-            if not video_url:
-                # Last resort: look for any media URLs in the page
-                media_patterns = [
-                    r'(https?://[^"\'\s]*(?:video|media|stream)[^"\'\s]*\.(?:mp4|avi|mkv|mov|wmv|flv|webm))',
-                    r'(https?://[^"\'\s]*\.(?:mp4|avi|mkv|mov|wmv|flv|webm)[^"\'\s]*)',
-                ]
-                
-                for pattern in media_patterns:
-                    matches = re.findall(pattern, html_content, re.IGNORECASE)
-                    if matches:
-                        video_url = matches[0]
-                        print(f"📹 Found media URL: {video_url}")
-                        break
+            # Repeat and simultaneous requests for the same page share one extraction
+            resolved = await self.extraction_cache.get_or_compute(
+                f"qombol:{media_cache.normalize_url(url)}",
+                lambda: self.measure_extraction('qombol', self.resolve_qombol_page(url)),
+                urls=lambda r: [r['video_url']] if r.get('video_url') else [],
+            )
+            video_url = resolved.get('video_url')
             
             if not video_url:
-                # Last resort: try yt-dlp on the embed URL if we found one
-                embed_patterns = [r'<iframe[^>]*src=["\']([^"\']+)["\']']
-                for pattern in embed_patterns:
-                    matches = re.findall(pattern, html_content, re.IGNORECASE)
-                    if matches:
-                        embed_url = matches[0]
-                        if 'mediadelivery.net' in embed_url or 'iframe' in embed_url:
-                            print(f"🎯 Last resort: trying yt-dlp on embed URL: {embed_url}")
-                            try:
-                                return await self.download_video_with_ytdlp(embed_url, progress_msg, user_name)
-                            except Exception as e:
-                                print(f"⚠️ yt-dlp also failed: {e}")
-                                
-                                # Final fallback: provide the embed URL to user
-                                if progress_msg:
-                                    try:
-                                        await progress_msg.edit_text(
-                                            f"⚠️ نتوانستم ویدیو را مستقیماً دانلود کنم.\n\n"
-                                            f"🔗 لینک پخش ویدیو:\n{embed_url}\n\n"
-                                            f"💡 می‌توانید این لینک را در مرورگر باز کنید و ویدیو را مشاهده کنید."
-                                        )
-                                        return None, None, None  # Signal that we handled it with a message
-                                    except:
-                                        pass
-                                break
-                
-                # Debug: Show some HTML content to understand the structure
-                print("🔍 No video found. HTML sample:")
-                print(html_content[:1000] + "..." if len(html_content) > 1000 else html_content)
-                raise Exception("لینک ویدیو در صفحه پیدا نشد - ممکن است نیاز به روش دیگری باشد")
-            
-            # Make sure URL is absolute
-            if video_url.startswith('//'):
-                video_url = 'https:' + video_url
-            elif video_url.startswith('/'):
-                from urllib.parse import urljoin
-                video_url = urljoin(url, video_url)
+                # Last resort: try yt-dlp on the embed URL we found
+                embed_url = resolved['embed_url']
+                print(f"🎯 Last resort: trying yt-dlp on embed URL: {embed_url}")
+                try:
+                    return await self.download_video_with_ytdlp(embed_url, progress_msg, user_name)
+                except Exception as e:
+                    print(f"⚠️ yt-dlp also failed: {e}")
+                    
+                    # Final fallback: provide the embed URL to user
+                    if progress_msg:
+                        try:
+                            await progress_msg.edit_text(
+                                f"⚠️ نتوانستم ویدیو را مستقیماً دانلود کنم.\n\n"
+                                f"🔗 لینک پخش ویدیو:\n{embed_url}\n\n"
+                                f"💡 می‌توانید این لینک را در مرورگر باز کنید و ویدیو را مشاهده کنید."
+                            )
+                            return None, None, None  # Signal that we handled it with a message
+                        except:
+                            pass
+                    raise Exception("لینک ویدیو در صفحه پیدا نشد - ممکن است نیاز به روش دیگری باشد")
             
             print(f"📹 Final video URL: {video_url}")
             
@@ -798,72 +1122,349 @@ https://example.com/image.jpg
             print(f"❌ {error_msg}")
             raise Exception(error_msg)
     
-    async def download_file(self, url: str, progress_msg=None, user_name: str = "") -> tuple:
-        """Download file from URL with progress tracking"""
-        # Configure session with no size limits
-        timeout = aiohttp.ClientTimeout(total=None, connect=30)
-        connector = aiohttp.TCPConnector(limit=0, limit_per_host=0)
+    async def resolve_qombol_page(self, url: str) -> dict:
+        """Find the video on a qombol.com page: {'video_url': ...} or, failing that, {'embed_url': ...}"""
+        # Fetch the webpage content with browser-like headers
+        session = self.sessions.get('browser')
+        async with session.get(url) as response:
+            if response.status != 200:
+                raise Exception(f"HTTP {response.status}")
+            
+            html_content = await response.text()
         
-        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
-            async with session.get(url, allow_redirects=True) as response:
-                if response.status != 200:
-                    raise Exception(f"HTTP {response.status}: نمی‌توان فایل را دانلود کرد")
-                
-                # Get filename and total size
-                filename = self.get_filename_from_response(response, url)
-                total_size = int(response.headers.get('content-length', 0))
-                
-                # Create temporary file
-                temp_dir = tempfile.gettempdir()
-                file_path = os.path.join(temp_dir, filename)
-                
-                # Download with progress tracking - no size limits
-                downloaded = 0
-                start_time = time.time()
-                last_update = 0
+        print(f"🔍 Analyzing HTML content (length: {len(html_content)})")
+        
+        # One scan finds the video, embed and media candidates (off-thread for big pages)
+        found = await page_scanner.scan(page_scanner.scan_qombol_page, html_content)
+        i, video_url = found['video']
+        if video_url:
+            print(f"✅ Found video with pattern {i+1}: {video_url}")
+        
+        if not video_url:
+            # Try to find embedded players
+            for i, embed_url in found['embeds']:
+                print(f"🔗 Found embed with pattern {i+1}: {embed_url}")
                 
-                with open(file_path, 'wb') as file:
-                    async for chunk in response.content.iter_chunked(1024 * 1024):  # 1MB chunks for large files
-                        file.write(chunk)
-                        downloaded += len(chunk)
-                        
-                        # Update progress every 2 seconds or if no total size
-                        current_time = time.time()
-                        if current_time - last_update >= 2 and progress_msg:
-                            elapsed_time = current_time - start_time
-                            speed = downloaded / elapsed_time if elapsed_time > 0 else 0
-                            
-                            if total_size > 0:
-                                percentage = (downloaded / total_size) * 100
-                                progress_text = self.create_progress_text(
-                                    "📥 دانلود", percentage, speed, downloaded, total_size
-                                )
-                            else:
-                                # Show progress without percentage for unknown size
-                                progress_text = f"""📥 دانلود در حال انجام...
+                # Check if it's a known video platform or streaming service
+                if any(domain in embed_url.lower() for domain in ['youtube.com', 'vimeo.com', 'dailymotion.com', 'pornhub.com', 'xvideos.com', 'mediadelivery.net', 'bunnycdn.com', 'jwplayer.com']):
+                    print(f"🎯 Recognized video service: {embed_url}")
+                    # For mediadelivery.net, try to extract direct video URL
+                    if 'mediadelivery.net' in embed_url.lower():
+                        try:
+                            video_url = await self.extract_mediadelivery_video(embed_url)
+                            if video_url:
+                                break
+                        except Exception as e:
+                            print(f"⚠️ Failed to extract from mediadelivery: {e}")
+                    else:
+                        video_url = embed_url
+                        break
+                # Or if it contains video file extension
+                elif any(ext in embed_url.lower() for ext in ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm']):
+                    video_url = embed_url
+                    break
+        
+        if not video_url:
+            # Last resort: look for any media URLs in the page
+            _, video_url = found['media']
+            if video_url:
+                print(f"📹 Found media URL: {video_url}")
+        
+        if not video_url:
+            # Last resort: an iframe embed we can hand to yt-dlp
+            iframe_url = dict(found['embeds']).get(0)
+            if iframe_url and ('mediadelivery.net' in iframe_url or 'iframe' in iframe_url):
+                return {'embed_url': iframe_url}
+            
+            # Debug: Show some HTML content to understand the structure
+            print("🔍 No video found. HTML sample:")
+            print(html_content[:1000] + "..." if len(html_content) > 1000 else html_content)
+            raise Exception("لینک ویدیو در صفحه پیدا نشد - ممکن است نیاز به روش دیگری باشد")
+        
+        # Make sure URL is absolute
+        if video_url.startswith('//'):
+            video_url = 'https:' + video_url
+        elif video_url.startswith('/'):
+            from urllib.parse import urljoin
+            video_url = urljoin(url, video_url)
+        
+        return {'video_url': video_url}
+    
+    async def download_file(self, url: str, progress_msg=None, user_name: str = "") -> tuple:
+        """Download file from URL with progress tracking, using parallel ranges when possible"""
+        session = self.sessions.get('download')
+        download = RangedDownload(
+            session, url,
+            connections=DOWNLOAD_CONNECTIONS,
+            retries=DOWNLOAD_SEGMENT_RETRIES,
+        )
+        try:
+            await download.probe()
+            if download.status not in (200, 206):
+                raise Exception(f"HTTP {download.status}: نمی‌توان فایل را دانلود کرد")
+            
+            # Get filename and total size
+            filename = self.get_filename_from_response(download, url)
+            
+            # Plan for the upload limit (and disk space) before fetching anything
+            await self.preflight_size(download.total_size, progress_msg)
+            
+            # Stable per-URL temp path so an interrupted download can resume
+            temp_dir = tempfile.gettempdir()
+            file_path = partial_path(temp_dir, url, filename)
+            
+            reporter = None
+            if progress_msg:
+                reporter = asyncio.create_task(
+                    self.report_download_progress(download, progress_msg, user_name)
+                )
+            started = time.monotonic()
+            try:
+                downloaded = await download.fetch(file_path)
+            except Exception:
+                metrics.downloads.inc(kind='direct', result='error')
+                if not download.accept_ranges:
+                    # A single stream has no journal and can't be resumed
+                    remove_partial(file_path)
+                await self.clean_partial_downloads()
+                raise
+            finally:
+                if reporter:
+                    reporter.cancel()
+            self.record_download('direct', downloaded, time.monotonic() - started)
+        finally:
+            download.close()
+        
+        # The partial path is shared by every request for this URL: deliver the finished
+        # file under its own name, so a resend can't download into it before it's cleaned up
+        finished_path = os.path.join(temp_dir, f"{uuid.uuid4().hex[:8]}_{filename}")
+        os.replace(file_path, finished_path)
+        return finished_path, filename, downloaded
+    
+    async def clean_partial_downloads(self):
+        """Drop resumable partial downloads older than PARTIAL_DOWNLOAD_TTL_HOURS"""
+        if PARTIAL_DOWNLOAD_TTL_HOURS <= 0:
+            return
+        removed = await asyncio.to_thread(
+            clean_stale_partials, tempfile.gettempdir(), PARTIAL_DOWNLOAD_TTL_HOURS * 3600
+        )
+        if removed:
+            print(f"🧹 Removed {removed} stale partial download(s)")
+    
+    async def relay_file(self, update, context, url: str, progress_msg=None, user_name: str = "") -> dict:
+        """Stream a direct link into a Local Bot API upload without a temp file
+
+        Returns the delivered media entry, or None if the source can't be relayed
+        (unknown size, ranged/compressed response, a video) or the relay broke
+        mid-stream, and the file must be downloaded first.
+        """
+        relay = StreamRelay(
+            self.sessions.get('download'), url,
+            buffer_chunks=STREAM_RELAY_BUFFER_CHUNKS,
+        )
+        try:
+            await relay.open()
+            if not relay.relayable or relay.total_size > self.upload_ceiling():
+                return None
+            
+            filename = self.get_filename_from_response(relay, url)
+            if self.is_video_file(filename):
+                # Videos need the file on disk for the faststart remux, thumbnail
+                # and width/height/duration that make them stream well in Telegram
+                return None
+            file_size = relay.total_size
+            print(f"🔀 Relaying {filename} ({self.format_file_size(file_size)}) straight to Telegram")
+            
+            if self.is_audio_file(filename):
+                method, field, extra = 'sendAudio', 'audio', {}
+            else:
+                # Photos over the photo limit would be rejected; send everything else as a document
+                method, field, extra = 'sendDocument', 'document', {}
+            caption = f"✅ فایل با موفقیت دانلود شد!\n📁 نام فایل: {filename}\n📊 حجم: {self.format_file_size(file_size)}"
+            
+            reporter = None
+            if progress_msg:
+                reporter = asyncio.create_task(
+                    self.report_download_progress(relay, progress_msg, user_name)
+                )
+            transfer = TransferProgress(file_size)
+            try:
+                result = await relay.send(
+                    f"{BOT_API_BASE_URL}{BOT_TOKEN}/{method}",
+                    dict(chat_id=update.effective_chat.id, caption=caption, **extra),
+                    field, filename,
+                )
+            except (RelayError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # Source or Bot API server dropped mid-stream: fall back to a regular
+                # (resumable, retried) download and upload
+                print(f"⚠️ Relay of {filename} failed at {self.format_file_size(relay.downloaded)}, downloading instead: {e}")
+                metrics.uploads.inc(path='relay', result='error')
+                return None
+            finally:
+                if reporter:
+                    reporter.cancel()
+            self.record_upload('relay', file_size, transfer)
+            self.record_download('relay', file_size, transfer.elapsed)
+        finally:
+            relay.close()
+        
+        delivered = self.delivered_media(Message.de_json(result, context.bot)) or {}
+        delivered.update(filename=filename, file_size=file_size)
+        return delivered
+    
+    async def report_download_progress(self, download, progress_msg, user_name: str = ""):
+        """Edit the progress message every 2 seconds while a download is running"""
+        start_time = time.time()
+        try:
+            await self._report_download_progress(download, progress_msg, user_name, start_time)
+        finally:
+            # Don't let a queued progress edit overwrite whatever the message says next
+            self.progress.discard(progress_msg)
+    
+    async def _report_download_progress(self, download, progress_msg, user_name: str, start_time: float):
+        while True:
+            await asyncio.sleep(2)
+            downloaded = download.downloaded
+            total_size = download.total_size
+            elapsed_time = time.time() - start_time
+            speed = downloaded / elapsed_time if elapsed_time > 0 else 0
+            
+            if total_size > 0:
+                percentage = (downloaded / total_size) * 100
+                progress_text = self.create_progress_text(
+                    "📥 دانلود", percentage, speed, downloaded, total_size
+                )
+            else:
+                # Show progress without percentage for unknown size
+                progress_text = f"""📥 دانلود در حال انجام...
 
 📊 دانلود شده: {self.format_file_size(downloaded)}
 🚀 سرعت: {self.format_speed(speed)}
 
 لطفاً صبر کنید..."""
-                            
-                            try:
-                                await progress_msg.edit_text(progress_text)
-                                last_update = current_time
-                                print(f"📊 Download progress for {user_name}: {self.format_file_size(downloaded)} - {self.format_speed(speed)}")
-                            except:
-                                pass  # Ignore edit errors
-                
-                return file_path, filename, downloaded
+            
+            self.progress.submit(progress_msg, progress_text)
+            print(f"📊 Download progress for {user_name}: {self.format_file_size(downloaded)} - {self.format_speed(speed)}")
     
-    async def download_video_with_ytdlp(self, url: str, progress_msg=None, user_name: str = "") -> tuple:
-        """Download video from video sites using yt-dlp"""
+    async def send_cached(self, update, context, cache_key: str, processing_msg):
+        """Deliver a cached file by file_id or bridge copy; returns the entry, or None on a miss"""
+        entry = self.media_cache.get(cache_key)
+        if not entry:
+            return None
+        
+        filename = entry.get('filename') or ''
+        caption = f"✅ فایل با موفقیت دانلود شد!\n📁 نام فایل: {filename}\n📊 حجم: {self.format_file_size(entry.get('file_size') or 0)}"
+        try:
+            file_id = entry.get('file_id')
+            media_type = entry.get('media_type')
+            if file_id and media_type == 'video':
+                await update.message.reply_video(video=file_id, caption=caption, supports_streaming=True)
+            elif file_id and media_type == 'audio':
+                await update.message.reply_audio(audio=file_id, caption=caption)
+            elif file_id and media_type == 'photo':
+                await update.message.reply_photo(photo=file_id, caption=caption)
+            elif file_id:
+                await update.message.reply_document(document=file_id, caption=caption)
+            elif entry.get('bridge_message_id'):
+                await context.bot.copy_message(
+                    chat_id=update.effective_chat.id,
+                    from_chat_id=entry['bridge_chat_id'],
+                    message_id=entry['bridge_message_id']
+                )
+            else:
+                return None
+        except (BadRequest, Forbidden) as e:
+            # file_id no longer valid or bridge message deleted: forget it and download again
+            print(f"⚠️ Cached media unusable ({e}), downloading again")
+            self.media_cache.delete(cache_key)
+            return None
+        
+        print(f"⚡ Served from cache: {cache_key}")
+        try:
+            await processing_msg.delete()
+        except:
+            pass
+        return entry
+    
+    def ytdlp_options(self) -> dict:
+        """Base yt-dlp options shared by extraction and download"""
         temp_dir = tempfile.gettempdir()
+        return {
+            # yt-dlp sanitizes and truncates the title itself; id and format keep
+            # concurrent downloads of one video at different qualities apart
+            'outtmpl': os.path.join(temp_dir, '%(title).100s [%(id)s].%(format_id)s.%(ext)s'),
+            'windowsfilenames': True,
+            'format': 'best[height<=720]/best',  # Limit to 720p for faster download
+            'noplaylist': True,
+            'quiet': True,
+            'no_warnings': True,
+            'socket_timeout': 30,
+            'retries': 3,
+            # Resume from yt-dlp's own .part/.ytdl state when the same video is retried
+            'continuedl': True,
+            'fragment_retries': 10,
+            # HLS/DASH: fetch several fragments at once instead of one by one
+            'concurrent_fragment_downloads': max(1, YTDLP_CONCURRENT_FRAGMENTS),
+        }
+    
+    def ytdlp_download_options(self) -> dict:
+        """yt-dlp options for downloading (adds the external downloader, if any)"""
+        opts = self.ytdlp_options()
+        if self.external_downloader:
+            opts['external_downloader'] = {'default': self.external_downloader}
+            if self.external_downloader == 'aria2c':
+                connections = str(max(1, YTDLP_ARIA2C_CONNECTIONS))
+                opts['external_downloader_args'] = {
+                    'aria2c': ['-x', connections, '-s', connections, '-k', '1M', '--summary-interval=1']
+                }
+        return opts
+    
+    async def measure_extraction(self, source: str, extraction):
+        """Await an extraction (a cache miss), recording its latency or failure"""
+        started = time.monotonic()
+        try:
+            result = await extraction
+        except BaseException:
+            metrics.extract_errors.inc(source=source)
+            raise
+        metrics.extract_seconds.observe(time.monotonic() - started, source=source)
+        return result
+    
+    async def extract_video_info(self, url: str) -> dict:
+        """Resolve a video page to its yt-dlp info dict (no download), reusing recent results"""
+        opts = self.ytdlp_options()
+        key = f"ytdlp:{media_cache.normalize_url(url)}:{opts['format']}"
+        try:
+            return await self.extraction_cache.get_or_compute(
+                key,
+                lambda: self.measure_extraction('ytdlp', asyncio.wait_for(
+                    self.ytdlp_pool.run(ytdlp_pool.extract_info, url, opts),
+                    timeout=120
+                )),
+                urls=info_media_urls,
+            )
+        except asyncio.TimeoutError:
+            raise Exception("استخراج اطلاعات ویدیو بیش از حد طول کشید")
+        except Exception as e:
+            raise Exception(f"خطا در دانلود ویدیو: {str(e)}")
+    
+    async def download_video_with_ytdlp(self, url: str, progress_msg=None, user_name: str = "", info: dict = None,
+                                        format_spec: str = None, expected_size: int = 0) -> tuple:
+        """Download video from video sites using yt-dlp (pass info to skip extraction, format_spec from the planner)"""
+        # Time limit that follows the download's progress instead of a fixed 5 minutes
+        watchdog = DownloadWatchdog(
+            expected_size,
+            min_timeout=YTDLP_MIN_TIMEOUT,
+            max_timeout=YTDLP_MAX_TIMEOUT,
+            stall_timeout=YTDLP_STALL_TIMEOUT,
+            min_speed=YTDLP_MIN_SPEED_KBPS * 1024,
+        )
         
         # Progress hook for yt-dlp
         last_update = 0
         def progress_hook(d):
             nonlocal last_update
+            watchdog.update(d)
             current_time = time.time()
             
             if d['status'] == 'downloading' and progress_msg and current_time - last_update >= 2:
@@ -887,76 +1488,52 @@ https://example.com/image.jpg
 
 لطفاً صبر کنید..."""
                     
-                    # Run in event loop
-                    loop = asyncio.get_event_loop()
-                    loop.create_task(progress_msg.edit_text(progress_text))
+                    # Called on the event loop thread by the yt-dlp pool
+                    self.progress.submit(progress_msg, progress_text)
                     last_update = current_time
                     print(f"📊 Video download progress for {user_name}: {self.format_file_size(downloaded)} - {self.format_speed(speed)}")
                 except Exception as e:
                     pass  # Ignore progress update errors
         
         # yt-dlp options
-        ydl_opts = {
-            'outtmpl': os.path.join(temp_dir, '%(title)s.%(ext)s'),
-            'format': 'best[height<=720]/best',  # Limit to 720p for faster download
-            'noplaylist': True,
-            'progress_hooks': [progress_hook],
-            'quiet': True,
-            'no_warnings': True,
-            'socket_timeout': 30,
-            'retries': 3,
-        }
+        ydl_opts = self.ytdlp_download_options()
+        started = time.monotonic()
+        if format_spec:
+            # Planned format first; the default selection if it can't be downloaded
+            ydl_opts['format'] = f"{format_spec}/{ydl_opts['format']}"
+        
+        async def extract_and_download():
+            nonlocal info
+            if info is None:
+                info = await self.ytdlp_pool.run(ytdlp_pool.extract_info, url, ydl_opts)
+            # Reuse the info dict: no second page fetch or player resolution
+            return await self.ytdlp_pool.run(
+                ytdlp_pool.download_info, info, ydl_opts,
+                progress=progress_hook,
+            )
         
         try:
-            # Run yt-dlp in executor to avoid blocking
-            loop = asyncio.get_event_loop()
-            
-            def download_sync():
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    # Extract info first
-                    info = ydl.extract_info(url, download=False)
-                    title = info.get('title', 'video')
-                    
-                    # Clean filename
-                    safe_title = re.sub(r'[<>:"/\\|?*]', '_', title)
-                    if len(safe_title) > 100:
-                        safe_title = safe_title[:100]
-                    
-                    # Update template with safe title
-                    ydl_opts['outtmpl'] = os.path.join(temp_dir, f'{safe_title}.%(ext)s')
-                    
-                    # Download
-                    with yt_dlp.YoutubeDL(ydl_opts) as ydl_download:
-                        ydl_download.download([url])
-                    
-                    return safe_title, info.get('filesize', 0)
-            
-            # Execute download with timeout
+            # Run yt-dlp in the process pool to keep it off the event loop
             try:
-                safe_title, estimated_size = await asyncio.wait_for(
-                    loop.run_in_executor(None, download_sync), 
-                    timeout=300  # 5 minutes timeout
-                )
+                file_path = await watchdog.watch(extract_and_download())
             except asyncio.TimeoutError:
-                raise Exception("دانلود ویدیو بیش از حد طول کشید (5 دقیقه)")
-            
-            # Find the downloaded file
-            downloaded_files = []
-            for file in os.listdir(temp_dir):
-                if safe_title in file and not file.endswith('.part'):
-                    downloaded_files.append(file)
+                raise Exception("دانلود ویدیو بیش از حد طول کشید")
+            except DownloadStalled as e:
+                print(f"⚠️ yt-dlp download stalled for {user_name}: {e}")
+                raise Exception("دانلود ویدیو متوقف شد (پیشرفتی نداشت)")
+            finally:
+                if progress_msg:
+                    self.progress.discard(progress_msg)
             
-            if not downloaded_files:
+            if not os.path.exists(file_path):
                 raise Exception("فایل دانلود شده پیدا نشد")
             
-            # Get the most recent file
-            downloaded_file = max(downloaded_files, key=lambda f: os.path.getctime(os.path.join(temp_dir, f)))
-            file_path = os.path.join(temp_dir, downloaded_file)
             file_size = os.path.getsize(file_path)
-            
-            return file_path, downloaded_file, file_size
+            self.record_download('ytdlp', file_size, time.monotonic() - started)
+            return file_path, os.path.basename(file_path), file_size
             
         except Exception as e:
+            metrics.downloads.inc(kind='ytdlp', result='error')
             raise Exception(f"خطا در دانلود ویدیو: {str(e)}")
     
     def get_filename_from_response(self, response, url: str) -> str:
@@ -1015,41 +1592,9 @@ https://example.com/image.jpg
         }
         return any(filename.lower().endswith(ext) for ext in photo_extensions)
     
-    def get_video_info(self, file_path: str) -> dict:
-        """Extract video information using ffprobe"""
-        try:
-            cmd = [
-                'ffprobe', '-v', 'quiet', '-print_format', 'json', 
-                '-show_format', '-show_streams', file_path
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-            
-            if result.returncode == 0:
-                data = json.loads(result.stdout)
-                
-                # Find video stream
-                video_stream = None
-                for stream in data.get('streams', []):
-                    if stream.get('codec_type') == 'video':
-                        video_stream = stream
-                        break
-                
-                if video_stream:
-                    width = int(video_stream.get('width', 0))
-                    height = int(video_stream.get('height', 0))
-                    duration = float(video_stream.get('duration', 0))
-                    
-                    return {
-                        'width': width,
-                        'height': height,
-                        'duration': int(duration) if duration > 0 else None
-                    }
-            
-        except Exception as e:
-            print(f"⚠️ Could not extract video info: {e}")
-        
-        # Return default values if extraction fails
-        return {'width': None, 'height': None, 'duration': None}
+    async def get_video_info(self, file_path: str) -> dict:
+        """Extract video information (MP4 header parse, else async ffprobe; cached)"""
+        return await self.media_probe.video_info(file_path)
     
     def create_progress_text(self, action: str, percentage: float, speed: float, current: int, total: int) -> str:
         """Create progress text with bar and stats"""
@@ -1086,14 +1631,146 @@ https://example.com/image.jpg
         s = round(bytes_per_second / p, 1)
         return f"{s} {speed_names[i]}"
     
+    def upload_ceiling(self) -> int:
+        """Largest single file the configured upload route can carry"""
+        if MAX_UPLOAD_SIZE_MB:
+            return MAX_UPLOAD_SIZE_MB * 1024 * 1024
+        bridge_configured = bool(TG_SESSION_STRING) and BRIDGE_CHANNEL_ID != 0 and upload_to_bridge is not None
+        if BOT_API_BASE_URL or bridge_configured:
+            return 2000 * 1024 * 1024
+        return 50 * 1024 * 1024
+    
+    def expected_video_size(self, info: dict) -> int:
+        """Size yt-dlp expects the selected format(s) to have (exact or approximate), 0 if unknown"""
+        formats = info.get('requested_formats') or [info]
+        return sum(int(f.get('filesize') or f.get('filesize_approx') or 0) for f in formats)
+    
+    async def preflight_size(self, expected_size: int, progress_msg=None):
+        """Check a download's size before fetching it: refuse what can't fit on disk, announce splits"""
+        if not expected_size:
+            return
+        ceiling = self.upload_ceiling()
+        # Splitting needs room for the parts next to the original
+        needed = expected_size * 2 if expected_size > ceiling else expected_size
+        free = shutil.disk_usage(tempfile.gettempdir()).free
+        if needed > free:
+            raise Exception(
+                f"حجم فایل ({self.format_file_size(expected_size)}) بیشتر از فضای خالی سرور "
+                f"({self.format_file_size(free)}) است"
+            )
+        if expected_size > ceiling:
+            parts = file_splitter.part_count(expected_size, ceiling)
+            print(f"📦 {self.format_file_size(expected_size)} is over the {self.format_file_size(ceiling)} upload limit; "
+                  f"planning {parts} parts")
+            if progress_msg:
+                try:
+                    await progress_msg.edit_text(
+                        f"📦 حجم فایل {self.format_file_size(expected_size)} است و از سقف آپلود "
+                        f"({self.format_file_size(ceiling)}) بیشتر است.\n"
+                        f"پس از دانلود در حدود {parts} بخش ارسال می‌شود."
+                    )
+                except:
+                    pass
+    
+    async def upload_in_parts(self, update, context, progress_msg, file_path: str, filename: str, file_size: int, user_name: str):
+        """Split a file over the upload limit and send the parts one after another"""
+        ceiling = self.upload_ceiling()
+        try:
+            await progress_msg.edit_text(
+                f"✂️ حجم فایل ({self.format_file_size(file_size)}) بیشتر از سقف آپلود "
+                f"({self.format_file_size(ceiling)}) است؛ در حال تقسیم فایل..."
+            )
+        except:
+            pass
+        
+        # Videos are cut at keyframes so every part plays; anything else is cut by bytes
+        parts, playable = [], False
+        if self.is_video_file(filename):
+            video_info = await self.get_video_info(file_path)
+            parts = await file_splitter.split_video(self.video_prep, file_path, ceiling, video_info['duration'])
+            playable = bool(parts)
+        if not parts:
+            parts = await file_splitter.split_bytes(file_path, ceiling)
+        
+        try:
+            root, ext = os.path.splitext(filename)
+            for index, part_path in enumerate(parts, start=1):
+                if playable:
+                    part_name = f"{root}.part{index}of{len(parts)}{ext}"
+                else:
+                    part_name = f"{filename}.{index:03d}"
+                part_size = os.path.getsize(part_path)
+                print(f"📤 Uploading part {index}/{len(parts)} for {user_name}: {part_name}")
+                await self.upload_with_progress(update, context, progress_msg, part_path, part_name, part_size, user_name)
+            
+            if not playable:
+                await update.message.reply_text(
+                    f"🧩 فایل در {len(parts)} بخش ارسال شد. برای یکی کردن بخش‌ها:\n"
+                    f"Linux/macOS: cat \"{filename}\".0* > \"{filename}\"\n"
+                    f"Windows: copy /b \"{filename}.001\"+\"{filename}.002\"+... \"{filename}\""
+                )
+        finally:
+            for part_path in parts:
+                if os.path.exists(part_path):
+                    os.unlink(part_path)
+        return None
+    
     async def upload_with_progress(self, update, context, progress_msg, file_path: str, filename: str, file_size: int, user_name: str):
         """Upload file with progress tracking"""
-        start_time = time.time()
+        # Bytes sent so far, counted by the file wrapper (Bot API) or Pyrogram's callback (bridge)
+        progress = TransferProgress(file_size)
+        if self.local_uploads():
+            # The server reads the file itself: there are no bytes to count
+            await progress_msg.edit_text(
+                f"📤 در حال ارسال فایل از دیسک سرور...\n📊 حجم: {self.format_file_size(file_size)}"
+            )
+            return await self._upload_counted(update, context, progress_msg, progress, file_path, filename, file_size)
         
         # Show initial upload message
         progress_text = self.create_progress_text("📤 آپلود", 0, 0, 0, file_size)
         await progress_msg.edit_text(progress_text)
         
+        reporter = asyncio.create_task(self.report_upload_progress(progress, progress_msg, user_name))
+        try:
+            return await self._upload_counted(update, context, progress_msg, progress, file_path, filename, file_size)
+        finally:
+            reporter.cancel()
+    
+    async def _upload_counted(self, update, context, progress_msg, progress, file_path: str, filename: str, file_size: int):
+        try:
+            return await self._upload(update, context, progress_msg, progress, file_path, filename, file_size)
+        except Exception:
+            # Bridge failures are counted where they fall back; this is the final path
+            metrics.uploads.inc(path='local' if self.local_uploads() else 'bot_api', result='error')
+            raise
+    
+    def local_uploads(self) -> bool:
+        """Files are handed to a --local Bot API server by path instead of uploaded"""
+        return bool(BOT_API_BASE_URL) and BOT_API_LOCAL_MODE
+    
+    async def _upload(self, update, context, progress_msg, progress, file_path: str, filename: str, file_size: int):
+        video_info, thumb_path = None, None
+        if self.is_video_file(filename):
+            video_info, thumb_path = await self.prepare_video(file_path)
+        try:
+            return await self._send_file(update, context, progress_msg, progress, file_path, filename, file_size,
+                                         video_info, thumb_path)
+        finally:
+            if thumb_path and os.path.exists(thumb_path):
+                os.unlink(thumb_path)
+    
+    async def prepare_video(self, file_path: str):
+        """Remux for streaming if needed, then read dimensions and grab a thumbnail"""
+        if VIDEO_FASTSTART and await self.video_prep.faststart(file_path):
+            print(f"🎞️ Remuxed for streaming (faststart): {os.path.basename(file_path)}")
+        video_info = await self.get_video_info(file_path)
+        thumb_path = None
+        if VIDEO_THUMBNAILS:
+            thumb_path = await self.video_prep.thumbnail(file_path, video_info['duration'])
+        return video_info, thumb_path
+    
+    async def _send_file(self, update, context, progress_msg, progress, file_path: str, filename: str, file_size: int,
+                         video_info: dict = None, thumb_path: str = None):
         # If Local Bot API not configured and file > 50MB and bridge is configured, use user-account bridge
         bridge_configured = bool(TG_SESSION_STRING) and BRIDGE_CHANNEL_ID != 0 and upload_to_bridge is not None
         if not BOT_API_BASE_URL and file_size > 50 * 1024 * 1024 and bridge_configured:
@@ -1103,72 +1780,93 @@ https://example.com/image.jpg
                 pass
             try:
                 caption = f"✅ فایل آپلود شد (Bridge)\n📁 {filename}\n📊 {self.format_file_size(file_size)}"
-                bridge_chat_id, message_id = await upload_to_bridge(file_path, filename, caption)
+                video_meta = dict(video_info, thumb=thumb_path) if video_info else {}
+                bridge_chat_id, message_id = await upload_to_bridge(
+                    file_path, filename, caption, progress=progress.set, **video_meta
+                )
+                self.record_upload('bridge', file_size, progress)
                 await context.bot.copy_message(
                     chat_id=update.effective_chat.id,
                     from_chat_id=bridge_chat_id,
                     message_id=message_id
                 )
-                try:
-                    await progress_msg.delete()
-                except:
-                    pass
-                return
+                return {'bridge_chat_id': bridge_chat_id, 'bridge_message_id': message_id}
             except (BadRequest, Forbidden) as e:
                 await update.message.reply_text(
                     "⚠️ دسترسی ربات به کانال Bridge مشکل دارد. ربات را ادمین کانال خصوصی قرار دهید و دوباره تلاش کنید."
                 )
                 raise e
             except Exception as e:
+                metrics.uploads.inc(path='bridge', result='error')
                 await update.message.reply_text(
                     f"⚠️ ارسال از طریق Bridge با خطا مواجه شد: {e}\nتلاش برای ارسال مستقیم از طریق Bot API..."
                 )
                 # continue to direct upload fallback
+                progress.restart()
 
-        # Note: To avoid truncated uploads, we stream the real file handle via InputFile
-        # and let HTTPX handle chunking. This prevents calling read(-1) on a wrapper.
-        
         # Upload the file based on its type with fallback for large files
         caption = f"✅ فایل با موفقیت دانلود شد!\n📁 نام فایل: {filename}\n📊 حجم: {self.format_file_size(file_size)}"
+        
+        if self.local_uploads():
+            try:
+                sent = await self._send_local(update, file_path, filename, caption, video_info, thumb_path)
+                self.record_upload('local', file_size, progress)
+                return self.delivered_media(sent)
+            except BadRequest as e:
+                # e.g. the server can't see our files (different machine/volume)
+                print(f"⚠️ Local-mode send failed ({e}), uploading over HTTP instead")
+                progress.restart()
+        
+        # Note: To avoid truncated uploads, we stream the real file handle via InputFile
+        # and let HTTPX handle chunking. ProgressReader only counts the chunks HTTPX reads.
         try:
             with open(file_path, 'rb') as file:
-                media_file = InputFile(file, filename=filename, read_file_handle=False)
+                media_file = InputFile(ProgressReader(file, progress), filename=filename, read_file_handle=False)
                 if self.is_video_file(filename):
-                    # Get video dimensions to maintain aspect ratio
-                    video_info = self.get_video_info(file_path)
-                    await update.message.reply_video(
+                    # Video dimensions (to maintain aspect ratio) and thumbnail from prepare_video
+                    thumbnail = None
+                    if thumb_path:
+                        with open(thumb_path, 'rb') as thumb:
+                            thumbnail = thumb.read()
+                    sent = await update.message.reply_video(
                         video=media_file,
                         caption=caption,
                         supports_streaming=True,
                         width=video_info['width'],
                         height=video_info['height'],
-                        duration=video_info['duration']
+                        duration=video_info['duration'],
+                        thumbnail=thumbnail
                     )
                 elif self.is_audio_file(filename):
-                    await update.message.reply_audio(
+                    sent = await update.message.reply_audio(
                         audio=media_file,
                         caption=caption
                     )
                 elif self.is_photo_file(filename):
-                    await update.message.reply_photo(
+                    sent = await update.message.reply_photo(
                         photo=media_file,
                         caption=caption
                     )
                 else:
-                    await update.message.reply_document(
+                    sent = await update.message.reply_document(
                         document=media_file,
                         caption=caption
                     )
+            self.record_upload('bot_api', file_size, progress)
+            return self.delivered_media(sent)
         except Exception as e:
             # If sending as media fails (413 error), fallback to document
             if "413" in str(e) or "Request Entity Too Large" in str(e):
                 print(f"⚠️ Media upload failed due to size limit, falling back to document: {filename}")
                 try:
+                    progress.restart()
                     with open(file_path, 'rb') as file:
-                        await update.message.reply_document(
-                            document=InputFile(file, filename=filename, read_file_handle=False),
+                        sent = await update.message.reply_document(
+                            document=InputFile(ProgressReader(file, progress), filename=filename, read_file_handle=False),
                             caption=f"📄 فایل به صورت سند ارسال شد (حجم بزرگ)\n📁 نام فایل: {filename}\n📊 حجم: {self.format_file_size(file_size)}"
                         )
+                    self.record_upload('bot_api', file_size, progress)
+                    return self.delivered_media(sent)
                 except Exception as e2:
                     if "413" in str(e2) or "Request Entity Too Large" in str(e2):
                         if not BOT_API_BASE_URL:
@@ -1184,8 +1882,86 @@ https://example.com/image.jpg
             else:
                 raise e
     
-
-
+    async def _send_local(self, update, file_path: str, filename: str, caption: str,
+                          video_info: dict = None, thumb_path: str = None):
+        """Send by path: in local mode PTB passes Path objects as file:// URIs the server reads in place"""
+        # The server names the file after the path, so hard-link it under its real name (no copy)
+        link_dir = None
+        path = Path(file_path).resolve()
+        if path.name != filename:
+            try:
+                link_dir = tempfile.mkdtemp(dir=path.parent)
+                os.link(path, os.path.join(link_dir, filename))
+                path = Path(link_dir, filename)
+            except OSError:
+                pass  # no hard links here: the temp name will show
+        try:
+            return await self._send_local_media(update, path, filename, caption, video_info, thumb_path)
+        finally:
+            if link_dir:
+                shutil.rmtree(link_dir, ignore_errors=True)
+    
+    async def _send_local_media(self, update, path: Path, filename: str, caption: str,
+                                video_info: dict = None, thumb_path: str = None):
+        if self.is_video_file(filename):
+            return await update.message.reply_video(
+                video=path,
+                caption=caption,
+                supports_streaming=True,
+                width=video_info['width'],
+                height=video_info['height'],
+                duration=video_info['duration'],
+                thumbnail=Path(thumb_path).resolve() if thumb_path else None
+            )
+        if self.is_audio_file(filename):
+            return await update.message.reply_audio(audio=path, caption=caption)
+        if self.is_photo_file(filename):
+            return await update.message.reply_photo(photo=path, caption=caption)
+        return await update.message.reply_document(document=path, caption=caption)
+    
+    async def report_upload_progress(self, progress, progress_msg, user_name: str = ""):
+        """Edit the progress message every 2 seconds while an upload is running"""
+        try:
+            while True:
+                await asyncio.sleep(2)
+                sent = progress.done
+                total_size = progress.total
+                speed = progress.speed
+                percentage = (sent / total_size) * 100 if total_size > 0 else 0
+                progress_text = self.create_progress_text("📤 آپلود", percentage, speed, sent, total_size)
+                self.progress.submit(progress_msg, progress_text)
+                print(f"📊 Upload progress for {user_name}: {self.format_file_size(sent)} - {self.format_speed(speed)}")
+        finally:
+            self.progress.discard(progress_msg)
+    
+    def record_upload(self, path: str, file_size: int, progress):
+        """Log and record the measured throughput of a finished upload"""
+        upload_throughput[path].record(file_size, progress.elapsed)
+        metrics.uploads.inc(path=path, result='ok')
+        metrics.upload_bytes.inc(file_size, path=path)
+        metrics.upload_seconds.observe(progress.elapsed, path=path)
+        print(f"📤 Uploaded {self.format_file_size(file_size)} via {path} in {progress.elapsed:.1f}s "
+              f"({self.format_speed(file_size / max(progress.elapsed, 0.001))})")
+    
+    def record_download(self, kind: str, nbytes: int, seconds: float):
+        metrics.downloads.inc(kind=kind, result='ok')
+        metrics.download_bytes.inc(nbytes, kind=kind)
+        metrics.download_seconds.observe(seconds, kind=kind)
+    
+    def delivered_media(self, message) -> dict:
+        """file_id and media type of a sent message, for the media cache"""
+        if message is None:
+            return None
+        if message.video:
+            return {'file_id': message.video.file_id, 'media_type': 'video'}
+        if message.audio:
+            return {'file_id': message.audio.file_id, 'media_type': 'audio'}
+        if message.photo:
+            return {'file_id': message.photo[-1].file_id, 'media_type': 'photo'}
+        if message.document:
+            return {'file_id': message.document.file_id, 'media_type': 'document'}
+        return None
+    
     async def delayed_file_cleanup(self, file_path: str, delay_seconds: int):
         """Delete file after specified delay"""
         try:
@@ -20,6 +20,13 @@ if not BOT_TOKEN:
 BOT_API_BASE_URL = os.getenv("BOT_API_BASE_URL")
 BOT_API_BASE_FILE_URL = os.getenv("BOT_API_BASE_FILE_URL")
 
+# The Local Bot API server runs with --local on the same machine: send
+# uploads as file:// paths it reads in place instead of HTTP multipart.
+# Downloads go to BOT_API_SHARED_DIR (default: system temp dir), which the
+# server must be able to read.
+BOT_API_LOCAL_MODE = os.getenv("BOT_API_LOCAL_MODE", "false").lower() in {'1', 'true', 'yes', 'on'}
+BOT_API_SHARED_DIR = os.getenv("BOT_API_SHARED_DIR", "")
+
 # Optional: Free large-file workaround without Local Bot API
 # Generate a Pyrogram session string locally and set TG_SESSION_STRING,
 # and create a private channel, add both your user and the bot as admins,
@@ -27,6 +34,28 @@ BOT_API_BASE_FILE_URL = os.getenv("BOT_API_BASE_FILE_URL")
 TG_SESSION_STRING = os.getenv("TG_SESSION_STRING")
 BRIDGE_CHANNEL_ID = os.getenv("BRIDGE_CHANNEL_ID")
 
+# Optional: more bridge accounts (comma-separated session strings, each
+# account an admin of the bridge channel). Uploads are spread over all of
+# them; an account hit by FloodWait rests until it is allowed again, and
+# waits longer than BRIDGE_MAX_FLOOD_WAIT seconds fail over to the Bot API.
+TG_SESSION_STRINGS = [s.strip() for s in os.getenv("TG_SESSION_STRINGS", "").split(",") if s.strip()]
+if TG_SESSION_STRING and TG_SESSION_STRING not in TG_SESSION_STRINGS:
+    TG_SESSION_STRINGS.insert(0, TG_SESSION_STRING)
+TG_SESSION_STRING = TG_SESSION_STRING or (TG_SESSION_STRINGS[0] if TG_SESSION_STRINGS else None)
+BRIDGE_MAX_FLOOD_WAIT = int(os.getenv("BRIDGE_MAX_FLOOD_WAIT", "300"))
+
+# Connect the bridge accounts at startup instead of on the first large
+# upload, and ping idle ones every BRIDGE_KEEPALIVE_INTERVAL seconds
+# (reconnecting any that fail; 0 disables the pings)
+BRIDGE_WARMUP = os.getenv("BRIDGE_WARMUP", "true").lower() in {'1', 'true', 'yes', 'on'}
+BRIDGE_KEEPALIVE_INTERVAL = int(os.getenv("BRIDGE_KEEPALIVE_INTERVAL", "60"))
+
+# Bridge uploads of files over 10 MB: parts are sent in parallel over this
+# many MTProto media connections, with this many parts in flight on each
+# (1 session = Pyrogram's own single-connection upload)
+BRIDGE_UPLOAD_SESSIONS = int(os.getenv("BRIDGE_UPLOAD_SESSIONS", "4"))
+BRIDGE_UPLOAD_PARTS_IN_FLIGHT = int(os.getenv("BRIDGE_UPLOAD_PARTS_IN_FLIGHT", "2"))
+
 # Reddit OAuth credentials
 REDDIT_CLIENT_ID = os.getenv("REDDIT_CLIENT_ID")
 REDDIT_CLIENT_SECRET = os.getenv("REDDIT_CLIENT_SECRET")
@@ -43,3 +72,80 @@ else:
     AUTHORIZED_USERS = []
 
 ALLOW_ALL = os.getenv("ALLOW_ALL", "false").lower() in {'1', 'true', 'yes', 'on'}
+
+# Direct-link downloads: number of parallel Range connections per file
+# and how many times a failed segment is retried before giving up
+DOWNLOAD_CONNECTIONS = int(os.getenv("DOWNLOAD_CONNECTIONS", "4"))
+DOWNLOAD_SEGMENT_RETRIES = int(os.getenv("DOWNLOAD_SEGMENT_RETRIES", "3"))
+# Hours an interrupted download's partial file and journal are kept for a resend
+PARTIAL_DOWNLOAD_TTL_HOURS = float(os.getenv("PARTIAL_DOWNLOAD_TTL_HOURS", "24"))
+
+# Shared HTTP connection pool (one connector reused by all aiohttp sessions)
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "32"))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+
+# Download scheduler: global and per-user concurrency, and how many links
+# one user may have waiting in the queue
+MAX_CONCURRENT_DOWNLOADS = int(os.getenv("MAX_CONCURRENT_DOWNLOADS", "3"))
+MAX_DOWNLOADS_PER_USER = int(os.getenv("MAX_DOWNLOADS_PER_USER", "1"))
+MAX_QUEUED_PER_USER = int(os.getenv("MAX_QUEUED_PER_USER", "5"))
+
+# yt-dlp worker processes, and how many jobs each runs before being replaced
+YTDLP_WORKERS = int(os.getenv("YTDLP_WORKERS", "2"))
+YTDLP_RECYCLE_AFTER = int(os.getenv("YTDLP_RECYCLE_AFTER", "20"))
+
+# Cache of already-sent media (Telegram file_id / bridge message per URL or video)
+MEDIA_CACHE_PATH = os.getenv("MEDIA_CACHE_PATH", "data/media_cache.db")
+MEDIA_CACHE_TTL_DAYS = int(os.getenv("MEDIA_CACHE_TTL_DAYS", "30"))
+MEDIA_CACHE_MAX_ENTRIES = int(os.getenv("MEDIA_CACHE_MAX_ENTRIES", "5000"))
+
+# Cache of page extraction results (yt-dlp info dicts, scraped video URLs).
+# Set EXTRACTION_CACHE_PATH to also keep them on disk across restarts.
+# An info dict with its formats list can still be a few hundred KB.
+EXTRACTION_CACHE_TTL = int(os.getenv("EXTRACTION_CACHE_TTL", "1800"))
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "128"))
+EXTRACTION_CACHE_PATH = os.getenv("EXTRACTION_CACHE_PATH", "")
+
+# How many candidate CDN URLs are probed at once when resolving a mediadelivery embed
+MEDIADELIVERY_PROBE_CONCURRENCY = int(os.getenv("MEDIADELIVERY_PROBE_CONCURRENCY", "4"))
+
+# Streaming relay (Local Bot API only): pipe direct downloads into the upload
+# instead of saving them to disk first (videos still go through disk for the
+# faststart remux and metadata); buffer size is in 256KB chunks
+STREAM_RELAY = os.getenv("STREAM_RELAY", "false").lower() in {'1', 'true', 'yes', 'on'}
+STREAM_RELAY_BUFFER_CHUNKS = int(os.getenv("STREAM_RELAY_BUFFER_CHUNKS", "16"))
+
+# Progress message edits: global budget across all chats, and the minimum
+# gap between two edits of the same message (seconds)
+PROGRESS_EDITS_PER_SECOND = float(os.getenv("PROGRESS_EDITS_PER_SECOND", "10"))
+PROGRESS_EDIT_INTERVAL = float(os.getenv("PROGRESS_EDIT_INTERVAL", "2"))
+
+# How many ffprobe processes may run at once (MP4/MOV headers are parsed in-process)
+FFPROBE_CONCURRENCY = int(os.getenv("FFPROBE_CONCURRENCY", "2"))
+
+# Video preparation with ffmpeg before upload: move the moov atom to the
+# front (stream copy) so playback starts early, and attach a thumbnail
+VIDEO_FASTSTART = os.getenv("VIDEO_FASTSTART", "true").lower() in {'1', 'true', 'yes', 'on'}
+VIDEO_THUMBNAILS = os.getenv("VIDEO_THUMBNAILS", "true").lower() in {'1', 'true', 'yes', 'on'}
+FFMPEG_CONCURRENCY = int(os.getenv("FFMPEG_CONCURRENCY", "2"))
+
+# Upload ceiling per file in MB (0 = pick from the route: 2000 with a Local
+# Bot API server or the bridge, 50 otherwise). Larger files are split.
+MAX_UPLOAD_SIZE_MB = int(os.getenv("MAX_UPLOAD_SIZE_MB", "0"))
+
+# Default maximum video height for yt-dlp downloads (0 = best that fits the
+# upload limit); users can change theirs with /quality
+DEFAULT_VIDEO_HEIGHT = int(os.getenv("DEFAULT_VIDEO_HEIGHT", "720"))
+
+# yt-dlp downloads: HLS/DASH fragments fetched in parallel, an optional
+# external downloader (e.g. aria2c, used only if installed), and a timeout
+# that grows with the expected size / measured speed instead of a fixed one
+YTDLP_CONCURRENT_FRAGMENTS = int(os.getenv("YTDLP_CONCURRENT_FRAGMENTS", "4"))
+YTDLP_EXTERNAL_DOWNLOADER = os.getenv("YTDLP_EXTERNAL_DOWNLOADER", "")
+YTDLP_ARIA2C_CONNECTIONS = int(os.getenv("YTDLP_ARIA2C_CONNECTIONS", "8"))
+YTDLP_MIN_TIMEOUT = int(os.getenv("YTDLP_MIN_TIMEOUT", "300"))
+YTDLP_MAX_TIMEOUT = int(os.getenv("YTDLP_MAX_TIMEOUT", "10800"))
+YTDLP_STALL_TIMEOUT = int(os.getenv("YTDLP_STALL_TIMEOUT", "120"))
+YTDLP_MIN_SPEED_KBPS = int(os.getenv("YTDLP_MIN_SPEED_KBPS", "256"))
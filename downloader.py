@@ -0,0 +1,356 @@
+"""
+Segmented HTTP downloader
+Fetches a file over several parallel Range requests into a preallocated
+file, falling back to a single stream when the server has no range support.
+Completed byte ranges are journaled next to the file so an interrupted
+download can be resumed later instead of starting over; journals nobody
+came back for are swept after a TTL.
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+
+import aiohttp
+
+# Don't bother splitting files smaller than this per connection
+MIN_SEGMENT_SIZE = 4 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+JOURNAL_SUFFIX = '.journal'
+JOURNAL_FLUSH_INTERVAL = 2
+
+_CONTENT_RANGE_RE = re.compile(r'bytes\s+\d+-\d+/(\d+)', re.IGNORECASE)
+
+
+def partial_path(temp_dir: str, url: str, filename: str) -> str:
+    """Stable per-URL temp path, so a resent link finds its partial file and journal"""
+    digest = hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(temp_dir, f"{digest}_{filename}")
+
+
+def remove_partial(file_path: str):
+    """Delete a partial file and its journal"""
+    for path in (file_path, file_path + JOURNAL_SUFFIX, file_path + JOURNAL_SUFFIX + '.tmp'):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def clean_stale_partials(temp_dir: str, max_age: float) -> int:
+    """Remove journaled partial downloads not touched for max_age seconds; returns how many
+
+    Only files with a journal are considered, so other temp files are left alone.
+    """
+    cutoff = time.time() - max_age
+    removed = 0
+    try:
+        entries = list(os.scandir(temp_dir))
+    except OSError:
+        return 0
+    for entry in entries:
+        if not entry.name.endswith(JOURNAL_SUFFIX):
+            continue
+        file_path = entry.path[:-len(JOURNAL_SUFFIX)]
+        try:
+            # Either one being written to means the download is alive
+            mtimes = [entry.stat().st_mtime]
+            if os.path.exists(file_path):
+                mtimes.append(os.path.getmtime(file_path))
+            if max(mtimes) > cutoff:
+                continue
+            remove_partial(file_path)
+            removed += 1
+        except OSError as e:
+            print(f"⚠️ Could not remove stale partial download {file_path}: {e}")
+    return removed
+
+
+class DownloadJournal:
+    """Completed byte ranges and validators for a partial file, stored as JSON"""
+
+    def __init__(self, file_path: str):
+        self.path = file_path + JOURNAL_SUFFIX
+        self.url = None
+        self.etag = None
+        self.last_modified = None
+        self.total_size = 0
+        self.ranges = []  # merged, inclusive [start, end] pairs
+        self._last_flush = 0
+
+    def load(self) -> bool:
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        self.url = data.get('url')
+        self.etag = data.get('etag')
+        self.last_modified = data.get('last_modified')
+        self.total_size = data.get('total_size', 0)
+        self.ranges = [tuple(r) for r in data.get('ranges', [])]
+        return True
+
+    def matches(self, url: str, etag, last_modified, total_size: int) -> bool:
+        """True if the journal describes the same remote file"""
+        if self.url != url or self.total_size != total_size:
+            return False
+        # When the server offers validators they must agree, otherwise the file changed
+        if etag and self.etag and etag != self.etag:
+            return False
+        if last_modified and self.last_modified and last_modified != self.last_modified:
+            return False
+        return True
+
+    def reset(self, url: str, etag, last_modified, total_size: int):
+        self.url = url
+        self.etag = etag
+        self.last_modified = last_modified
+        self.total_size = total_size
+        self.ranges = []
+
+    def add(self, start: int, end: int):
+        """Record [start, end] as written and merge it into the range list"""
+        if end < start:
+            return
+        merged = []
+        for r_start, r_end in sorted(self.ranges + [(start, end)]):
+            if merged and r_start <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], r_end))
+            else:
+                merged.append((r_start, r_end))
+        self.ranges = merged
+
+    def completed_bytes(self) -> int:
+        return sum(end - start + 1 for start, end in self.ranges)
+
+    def missing(self) -> list:
+        """Byte ranges not yet written"""
+        gaps = []
+        position = 0
+        for start, end in self.ranges:
+            if start > position:
+                gaps.append((position, start - 1))
+            position = end + 1
+        if position < self.total_size:
+            gaps.append((position, self.total_size - 1))
+        return gaps
+
+    def flush(self, force: bool = False):
+        """Atomically write the journal; throttled unless forced"""
+        now = time.time()
+        if not force and now - self._last_flush < JOURNAL_FLUSH_INTERVAL:
+            return
+        self._last_flush = now
+        data = {
+            'url': self.url,
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'total_size': self.total_size,
+            'ranges': [list(r) for r in self.ranges],
+        }
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️ Could not write download journal {self.path}: {e}")
+
+    def remove(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class RangedDownload:
+    """Download a single URL using N byte-range connections"""
+
+    def __init__(self, session: aiohttp.ClientSession, url: str, connections: int = 4,
+                 retries: int = 3, chunk_size: int = CHUNK_SIZE):
+        self.session = session
+        self.url = url
+        self.connections = max(1, connections)
+        self.retries = max(0, retries)
+        self.chunk_size = chunk_size
+
+        # Filled in by probe()
+        self.source_url = url
+        self.status = None
+        self.headers = {}
+        self.total_size = 0
+        self.accept_ranges = False
+        self.etag = None
+        self.last_modified = None
+
+        # Updated while fetching; read by progress reporters
+        self.downloaded = 0
+
+        self._response = None
+
+    async def probe(self):
+        """Ask for the first byte to learn size and range support in one request"""
+        response = await self.session.get(
+            self.url, headers={'Range': 'bytes=0-0'}, allow_redirects=True
+        )
+        self.status = response.status
+        self.headers = response.headers
+        # Reuse the post-redirect URL so segments don't each follow the redirect chain
+        self.url = str(response.url)
+        self.etag = response.headers.get('ETag')
+        self.last_modified = response.headers.get('Last-Modified')
+
+        if response.status == 206:
+            match = _CONTENT_RANGE_RE.search(response.headers.get('Content-Range', ''))
+            self.total_size = int(match.group(1)) if match else 0
+            self.accept_ranges = self.total_size > 0
+            response.release()
+            if not self.accept_ranges:
+                # Ranges served but the length is unknown ('bytes 0-0/*'): stream it
+                # whole, the 206 only carried the first byte
+                response = await self.session.get(self.url, allow_redirects=True)
+                self.status = response.status
+                self.total_size = int(response.headers.get('content-length', 0))
+                self._response = response
+        else:
+            # Server ignored the Range header: keep the body for a single stream
+            self.total_size = int(response.headers.get('content-length', 0))
+            self.accept_ranges = False
+            self._response = response
+
+        return self
+
+    def segments(self, missing: list) -> list:
+        """Split the missing byte ranges into roughly one piece per connection"""
+        remaining = sum(end - start + 1 for start, end in missing)
+        count = min(self.connections, max(1, remaining // MIN_SEGMENT_SIZE))
+        target = max(1, -(-remaining // count))
+        ranges = []
+        for start, end in missing:
+            while start <= end:
+                piece_end = min(end, start + target - 1)
+                # Don't leave a tiny tail as its own connection
+                if end - piece_end < MIN_SEGMENT_SIZE // 4:
+                    piece_end = end
+                ranges.append((start, piece_end))
+                start = piece_end + 1
+        return ranges
+
+    async def fetch(self, file_path: str) -> int:
+        """Download the probed URL into file_path and return the number of bytes written"""
+        if self.status not in (200, 206):
+            raise Exception(f"HTTP {self.status}")
+
+        if not self.accept_ranges:
+            return await self._fetch_stream(file_path)
+
+        journal = DownloadJournal(file_path)
+        resumable = (
+            journal.load()
+            and journal.matches(self.source_url, self.etag, self.last_modified, self.total_size)
+            and os.path.exists(file_path)
+            and os.path.getsize(file_path) == self.total_size
+        )
+        if resumable:
+            self.downloaded = journal.completed_bytes()
+            print(f"♻️ Resuming download at {self.downloaded}/{self.total_size} bytes: {file_path}")
+            fd = os.open(file_path, os.O_WRONLY)
+        else:
+            journal.reset(self.source_url, self.etag, self.last_modified, self.total_size)
+            fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+
+        try:
+            if not resumable:
+                _preallocate(fd, self.total_size)
+                journal.flush(force=True)
+            tasks = [
+                asyncio.create_task(self._fetch_segment(fd, start, end, journal))
+                for start, end in self.segments(journal.missing())
+            ]
+            print(f"🧩 Downloading in {len(tasks)} segments: {self.url}")
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            finally:
+                journal.flush(force=True)
+        finally:
+            os.close(fd)
+
+        journal.remove()
+        return self.total_size
+
+    async def _fetch_stream(self, file_path: str) -> int:
+        """Plain sequential download from the response kept by probe()"""
+        response = self._response
+        self._response = None
+        try:
+            with open(file_path, 'wb') as file:
+                async for chunk in response.content.iter_chunked(self.chunk_size):
+                    file.write(chunk)
+                    self.downloaded += len(chunk)
+        finally:
+            response.release()
+        return self.downloaded
+
+    async def _fetch_segment(self, fd: int, start: int, end: int, journal: DownloadJournal):
+        """Fetch bytes [start, end] with positional writes, retrying from the last offset"""
+        offset = start
+        failures = 0
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+
+        while offset <= end:
+            progress_at_attempt = offset
+            try:
+                headers = {'Range': f'bytes={offset}-{end}'}
+                # If the file changed since the probe, the server sends 200 and we bail out
+                # (weak ETags are not allowed in If-Range)
+                etag = self.etag if self.etag and not self.etag.startswith('W/') else None
+                validator = etag or self.last_modified
+                if validator:
+                    headers['If-Range'] = validator
+                async with self.session.get(self.url, headers=headers, timeout=timeout) as response:
+                    if response.status != 206:
+                        raise Exception(f"HTTP {response.status} for range {offset}-{end}")
+                    async for chunk in response.content.iter_chunked(self.chunk_size):
+                        chunk = chunk[:end - offset + 1]
+                        os.pwrite(fd, chunk, offset)
+                        journal.add(offset, offset + len(chunk) - 1)
+                        journal.flush()
+                        offset += len(chunk)
+                        self.downloaded += len(chunk)
+                        if offset > end:
+                            break
+                if offset <= end:
+                    raise Exception(f"connection closed at byte {offset}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # A retry that made progress resets the budget
+                failures = 1 if offset > progress_at_attempt else failures + 1
+                if failures > self.retries:
+                    raise Exception(f"segment {start}-{end} failed: {e}")
+                print(f"⚠️ Segment {start}-{end} failed at byte {offset} ({e}), retry {failures}/{self.retries}")
+                await asyncio.sleep(min(2 ** failures, 10))
+
+    def close(self):
+        """Release the probe response if fetch() never consumed it"""
+        if self._response is not None:
+            self._response.release()
+            self._response = None
+
+
+def _preallocate(fd: int, size: int):
+    """Reserve disk space up front so parallel writes don't fragment the file"""
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except (AttributeError, OSError):
+        os.ftruncate(fd, size)
@@ -0,0 +1,177 @@
+"""
+Extraction result cache
+Remembers what a page resolved to (yt-dlp info dicts, scraped media URLs)
+so repeat requests skip extraction. Entries live in an in-memory LRU with
+an optional SQLite tier that survives restarts. Lifetimes are capped by the
+expiry embedded in signed media URLs, and concurrent lookups of the same
+key share one extraction.
+"""
+
+import json
+import time
+import calendar
+import sqlite3
+import asyncio
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qsl
+
+# Query parameters that carry an absolute expiry timestamp (epoch seconds)
+_EXPIRY_PARAMS = ('expires', 'expire', 'exp', 'expiry', 'token_expires', 'validto')
+
+# Refresh this long before a signed URL actually expires
+_EXPIRY_MARGIN = 60
+
+
+def signed_url_expiry(url: str):
+    """Epoch seconds at which a signed URL stops working, or None if it isn't signed"""
+    try:
+        params = {k.lower(): v for k, v in parse_qsl(urlsplit(url).query)}
+    except ValueError:
+        return None
+
+    for name in _EXPIRY_PARAMS:
+        value = params.get(name)
+        if value and value.isdigit() and int(value) > 1_000_000_000:
+            return int(value)
+
+    # AWS SigV4: X-Amz-Date=20240101T000000Z & X-Amz-Expires=<seconds>
+    amz_date = params.get('x-amz-date')
+    amz_expires = params.get('x-amz-expires')
+    if amz_date and amz_expires and amz_expires.isdigit():
+        try:
+            signed_at = calendar.timegm(time.strptime(amz_date, '%Y%m%dT%H%M%SZ'))
+            return int(signed_at) + int(amz_expires)
+        except ValueError:
+            return None
+    return None
+
+
+def info_media_urls(info: dict) -> list:
+    """Media URLs inside a yt-dlp info dict (top level, requested and listed formats)"""
+    urls = []
+    if info.get('url'):
+        urls.append(info['url'])
+    for key in ('requested_formats', 'formats'):
+        for fmt in info.get(key) or []:
+            if fmt.get('url'):
+                urls.append(fmt['url'])
+    return urls
+
+
+class ExtractionCache:
+    """TTL + LRU cache with an optional on-disk tier and single-flight lookups"""
+
+    def __init__(self, max_entries: int = 128, default_ttl: int = 1800, disk_path: str = None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}            # key -> Future shared by concurrent callers
+        self.hits = 0
+        self.misses = 0
+
+        self._db = None
+        if disk_path:
+            self._db = sqlite3.connect(disk_path)
+            self._db.execute('''
+                CREATE TABLE IF NOT EXISTS extraction (
+                    cache_key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+            self._db.execute('DELETE FROM extraction WHERE expires_at < ?', (time.time(),))
+            self._db.commit()
+
+    def ttl_for(self, urls=(), ttl: int = None) -> float:
+        """Default TTL, shortened so no signed URL in the value is served after it expires"""
+        ttl = self.default_ttl if ttl is None else ttl
+        now = time.time()
+        for url in urls:
+            expiry = signed_url_expiry(url)
+            if expiry:
+                ttl = min(ttl, expiry - now - _EXPIRY_MARGIN)
+        return ttl
+
+    def get(self, key: str):
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry and entry[0] > now:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if entry:
+            del self._entries[key]
+
+        if self._db is not None:
+            row = self._db.execute(
+                'SELECT value, expires_at FROM extraction WHERE cache_key = ?', (key,)
+            ).fetchone()
+            if row and row[1] > now:
+                value = json.loads(row[0])
+                self._remember(key, value, row[1])
+                self.hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value, urls=(), ttl: int = None):
+        """Cache value; urls are the media URLs inside it whose signatures bound the TTL"""
+        ttl = self.ttl_for(urls, ttl)
+        if ttl <= 0:
+            return
+        expires_at = time.time() + ttl
+        self._remember(key, value, expires_at)
+        if self._db is not None:
+            try:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO extraction VALUES (?, ?, ?)',
+                    (key, json.dumps(value), expires_at),
+                )
+                self._db.commit()
+            except (TypeError, ValueError, sqlite3.Error) as e:
+                print(f"⚠️ Could not persist extraction result for {key}: {e}")
+
+    def _remember(self, key: str, value, expires_at: float):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(self, key: str, compute, urls=None, ttl: int = None):
+        """Return the cached value or run compute() once for all concurrent callers
+
+        urls(value) lists the media URLs in a fresh value (for signed-URL expiry).
+        None results are not cached.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+            if value is not None:
+                self.set(key, value, urls(value) if urls else (), ttl)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody else may be waiting; don't let asyncio warn about it
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,81 @@
+"""
+Splitting files that exceed the upload limit
+Videos are cut at keyframes with ffmpeg's segment muxer (stream copy, so
+every part plays on its own); anything else, or a video that can't be
+segmented small enough, is cut into fixed-size byte parts that can be
+joined back with cat / copy /b.
+"""
+
+import os
+import asyncio
+
+# Segment durations are estimated from the average bitrate; aim this far
+# below the limit so keyframe spacing and bitrate peaks still fit
+_VIDEO_HEADROOM = 0.9
+
+# Give up on keyframe splitting after this many attempts with shorter segments
+_VIDEO_ATTEMPTS = 3
+
+_COPY_CHUNK = 4 * 1024 * 1024
+
+
+def part_count(file_size: int, part_size: int) -> int:
+    return max(1, -(-file_size // part_size))
+
+
+def _split_bytes(file_path: str, part_size: int) -> list:
+    parts = []
+    with open(file_path, 'rb') as source:
+        index = 1
+        while True:
+            part_path = f"{file_path}.{index:03d}"
+            written = 0
+            with open(part_path, 'wb') as part:
+                while written < part_size:
+                    chunk = source.read(min(_COPY_CHUNK, part_size - written))
+                    if not chunk:
+                        break
+                    part.write(chunk)
+                    written += len(chunk)
+            if not written:
+                os.unlink(part_path)
+                break
+            parts.append(part_path)
+            index += 1
+    return parts
+
+
+async def split_bytes(file_path: str, part_size: int) -> list:
+    """Cut a file into <=part_size pieces (name.001, name.002...) in a worker thread"""
+    return await asyncio.to_thread(_split_bytes, file_path, part_size)
+
+
+async def split_video(video_prep, file_path: str, part_size: int, duration: int) -> list:
+    """Cut a video at keyframes into playable parts of at most part_size; [] if it can't"""
+    if not duration:
+        return []
+    file_size = os.path.getsize(file_path)
+    root, ext = os.path.splitext(file_path)
+    segment_time = duration * part_size * _VIDEO_HEADROOM / file_size
+
+    for attempt in range(_VIDEO_ATTEMPTS):
+        pattern = f"{root}.part%03d{ext}"
+        ok = await video_prep.run(
+            '-i', file_path, '-map', '0', '-c', 'copy',
+            '-f', 'segment', '-segment_time', f"{segment_time:.2f}", '-reset_timestamps', '1',
+            pattern,
+        )
+        parts = sorted(
+            os.path.join(os.path.dirname(file_path), name)
+            for name in os.listdir(os.path.dirname(file_path) or '.')
+            if name.startswith(os.path.basename(root) + '.part') and name.endswith(ext)
+        )
+        if ok and parts and all(os.path.getsize(part) <= part_size for part in parts):
+            return parts
+        for part in parts:
+            os.unlink(part)
+        if not ok:
+            return []
+        # A part came out too big (long GOPs, bitrate spike): try shorter segments
+        segment_time *= 0.7
+    return []
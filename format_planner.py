@@ -0,0 +1,106 @@
+"""
+yt-dlp format planning
+Picks what to download from an info dict's formats list instead of a fixed
+format string: the best progressive format or video+audio pair whose
+(known or bitrate-estimated) size fits the upload ceiling, up to the
+user's maximum height. H.264/AAC in MP4 is preferred at equal height,
+since Telegram streams it as is and no remux is needed.
+"""
+
+# Heights offered in the /quality keyboard (0 = best that fits)
+QUALITY_CHOICES = (360, 480, 720, 1080, 0)
+
+
+# A missing codec field means unknown (many sites only list URLs); only 'none' rules a stream out
+def _has_video(fmt: dict) -> bool:
+    return fmt.get('vcodec') != 'none'
+
+
+def _has_audio(fmt: dict) -> bool:
+    return fmt.get('acodec') != 'none'
+
+
+def _is_h264(fmt: dict) -> bool:
+    return (fmt.get('vcodec') or '').startswith(('avc1', 'h264'))
+
+
+def _is_aac(fmt: dict) -> bool:
+    return (fmt.get('acodec') or '').startswith(('mp4a', 'aac'))
+
+
+def _size(fmt: dict, duration) -> int:
+    """Exact size, yt-dlp's approximation, or bitrate x duration; 0 if unknown"""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if not size and fmt.get('tbr') and duration:
+        size = fmt['tbr'] * 1000 / 8 * duration
+    return int(size or 0)
+
+
+class Plan:
+    """One downloadable choice: a format spec for yt-dlp plus what it is expected to be"""
+
+    def __init__(self, spec: str, height: int, size: int, native: bool, bitrate: float):
+        self.spec = spec        # yt-dlp format string ('137+140' or '18')
+        self.height = height
+        self.size = size        # bytes, 0 if unknown
+        self.native = native    # H.264/AAC MP4: Telegram streams it without a remux
+        self.bitrate = bitrate
+
+    def __repr__(self):
+        return f"<Plan {self.spec} {self.height}p {self.size}B native={self.native}>"
+
+
+def _candidates(formats: list, duration, can_merge: bool):
+    progressive = [f for f in formats if _has_video(f) and _has_audio(f)]
+    video_only = [f for f in formats if _has_video(f) and not _has_audio(f)]
+    audio_only = [f for f in formats if _has_audio(f) and not _has_video(f)]
+
+    for f in progressive:
+        native = f.get('ext') == 'mp4' and _is_h264(f) and _is_aac(f)
+        yield Plan(str(f['format_id']), f.get('height') or 0, _size(f, duration), native, f.get('tbr') or 0)
+
+    if not (can_merge and audio_only):
+        return
+    # Best audio per container: m4a pairs with mp4 video, anything else ends up in mkv
+    by_quality = sorted(audio_only, key=lambda f: f.get('abr') or f.get('tbr') or 0, reverse=True)
+    best_m4a = next((f for f in by_quality if f.get('ext') == 'm4a' or _is_aac(f)), None)
+    best_any = by_quality[0]
+    for video in video_only:
+        audio = best_m4a if (video.get('ext') == 'mp4' and best_m4a) else best_any
+        native = video.get('ext') == 'mp4' and _is_h264(video) and _is_aac(audio)
+        size = _size(video, duration) + _size(audio, duration)
+        if not (_size(video, duration) and _size(audio, duration)):
+            size = 0
+        bitrate = (video.get('tbr') or 0) + (audio.get('tbr') or audio.get('abr') or 0)
+        yield Plan(f"{video['format_id']}+{audio['format_id']}", video.get('height') or 0, size, native, bitrate)
+
+
+def plan_format(info: dict, max_bytes: int, max_height: int = 0, can_merge: bool = True):
+    """Best Plan for info within max_bytes and max_height (0 = no limit), or None if there's no choice to make
+
+    Candidates of unknown size are only taken when no known size fits. When
+    nothing fits max_bytes at all the smallest candidate is returned, so the
+    file has to be split into as few parts as possible.
+    """
+    formats = [f for f in info.get('formats') or () if f.get('format_id')]
+    if not formats:
+        return None
+    candidates = list(_candidates(formats, info.get('duration'), can_merge))
+    if max_height:
+        capped = [c for c in candidates if c.height <= max_height]
+        # A site with nothing that small: take its lowest height rather than nothing
+        candidates = capped or [c for c in candidates if c.height == min(x.height for x in candidates)]
+    if not candidates:
+        return None
+
+    # Sizes known to fit first; an unknown size is only a guess, used when nothing known fits
+    fitting = [c for c in candidates if c.size and c.size <= max_bytes]
+    if not fitting:
+        fitting = [c for c in candidates if not c.size]
+    if fitting:
+        return max(fitting, key=lambda c: (c.height, c.native, c.bitrate))
+    return min(candidates, key=lambda c: (c.size, -c.height))
+
+
+def quality_label(height: int) -> str:
+    return f"{height}p" if height else "best"
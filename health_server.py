@@ -6,15 +6,18 @@ Runs alongside the Telegram bot
 
 import threading
 import time
-from flask import Flask, jsonify
+from flask import Flask, jsonify, Response
 from datetime import datetime
 
+import metrics
+
 class HealthServer:
     def __init__(self, port=8080):
         self.app = Flask(__name__)
         self.port = port
         self.start_time = datetime.now()
         self.bot_status = "starting"
+        self.status_providers = {}
         self.setup_routes()
     
     def setup_routes(self):
@@ -37,11 +40,31 @@ class HealthServer:
         @self.app.route('/ping')
         def ping():
             return "pong"
+        
+        @self.app.route('/metrics')
+        def metrics_endpoint():
+            uptime = datetime.now() - self.start_time
+            metrics.uptime_seconds.set(int(uptime.total_seconds()))
+            return Response(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+        
+        @self.app.route('/status')
+        def status():
+            report = {"bot_status": self.bot_status}
+            for name, provider in self.status_providers.items():
+                try:
+                    report[name] = provider()
+                except Exception as e:
+                    report[name] = {"error": str(e)}
+            return jsonify(report)
     
     def update_bot_status(self, status):
         """Update bot status for health checks"""
         self.bot_status = status
     
+    def add_status_provider(self, name, provider):
+        """Include provider() (a JSON-serializable dict) under name in /status"""
+        self.status_providers[name] = provider
+    
     def start(self):
         """Start the health server in a separate thread"""
         def run_server():
@@ -0,0 +1,112 @@
+"""
+Shared aiohttp sessions
+One long-lived connector for the whole process so DNS lookups, TCP
+connections and TLS handshakes are reused across downloads, page
+extraction and Reddit API calls. Each profile is a ClientSession with its
+own default headers and timeout, all sharing that connector.
+"""
+
+import aiohttp
+
+from config import (
+    HTTP_POOL_LIMIT,
+    HTTP_POOL_LIMIT_PER_HOST,
+    HTTP_DNS_CACHE_TTL,
+    HTTP_KEEPALIVE_TIMEOUT,
+)
+
+BROWSER_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+BOT_USER_AGENT = 'TelegramDownloadBot/1.0'
+
+# profile name -> session defaults
+PROFILES = {
+    # Direct file downloads: no overall deadline, big files can take hours
+    'download': {
+        'headers': {},
+        'timeout': aiohttp.ClientTimeout(total=None, connect=30),
+    },
+    # HTML pages we scrape for video URLs
+    'browser': {
+        'headers': {
+            'User-Agent': BROWSER_USER_AGENT,
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+            'Accept-Language': 'en-US,en;q=0.5',
+            'Accept-Encoding': 'gzip, deflate',
+            'Upgrade-Insecure-Requests': '1',
+        },
+        'timeout': aiohttp.ClientTimeout(total=30, connect=10),
+    },
+    # Probing CDN media URLs the way an embedded player would
+    'media': {
+        'headers': {
+            'User-Agent': BROWSER_USER_AGENT,
+            'Accept': '*/*',
+            'Accept-Language': 'en-US,en;q=0.9',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'Sec-Fetch-Dest': 'video',
+            'Sec-Fetch-Mode': 'cors',
+            'Sec-Fetch-Site': 'cross-site',
+        },
+        'timeout': aiohttp.ClientTimeout(total=10, connect=5),
+    },
+    # Reddit API and share links; per-user tokens are passed per request,
+    # and cookies are not kept so one user's session never leaks into another's
+    'reddit': {
+        'headers': {'User-Agent': BOT_USER_AGENT},
+        'timeout': aiohttp.ClientTimeout(total=30, connect=10),
+        'cookie_jar': aiohttp.DummyCookieJar,
+    },
+}
+
+
+class SessionRegistry:
+    """Application-scoped ClientSessions sharing one tuned TCPConnector"""
+
+    def __init__(self):
+        self._connector = None
+        self._sessions = {}
+
+    def _get_connector(self) -> aiohttp.TCPConnector:
+        if self._connector is None or self._connector.closed:
+            self._connector = aiohttp.TCPConnector(
+                limit=HTTP_POOL_LIMIT,
+                limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+                ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+                keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            )
+        return self._connector
+
+    def get(self, profile: str = 'download') -> aiohttp.ClientSession:
+        """Return the shared session for a profile, creating it on first use"""
+        session = self._sessions.get(profile)
+        if session is None or session.closed:
+            options = PROFILES[profile]
+            cookie_jar = options.get('cookie_jar')
+            session = aiohttp.ClientSession(
+                connector=self._get_connector(),
+                connector_owner=False,
+                headers=options['headers'],
+                timeout=options['timeout'],
+                cookie_jar=cookie_jar() if cookie_jar else None,
+            )
+            self._sessions[profile] = session
+        return session
+
+    async def open(self):
+        """Create every profile up front (call from inside the running event loop)"""
+        for profile in PROFILES:
+            self.get(profile)
+
+    async def close(self):
+        """Close all sessions and the shared connector"""
+        for session in self._sessions.values():
+            if not session.closed:
+                await session.close()
+        self._sessions.clear()
+        if self._connector is not None and not self._connector.closed:
+            await self._connector.close()
+        self._connector = None
+
+
+# Global session registry instance
+session_registry = SessionRegistry()
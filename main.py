@@ -44,6 +44,7 @@ def main():
         bot = TelegramDownloadBot()
         logger.info("Bot instance created successfully")
         health_server.update_bot_status("created")
+        health_server.add_status_provider("bridge", bot.bridge_status)
         
         # Start the bot
         logger.info("Starting bot polling...")
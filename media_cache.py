@@ -0,0 +1,130 @@
+"""
+Persistent cache of already-delivered media
+Maps a normalized URL (or a yt-dlp video ID + format) to the Telegram
+file_id the bot got back from its first upload, or to the bridge channel
+message it was copied from. A repeat request is then answered with the
+file_id / copy_message instead of downloading and uploading again.
+Entries expire after a TTL and the least recently used ones are evicted
+once the table grows past its limit.
+"""
+
+import os
+import time
+import sqlite3
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Query parameters that never change what is served
+_TRACKING_PARAMS = {
+    'fbclid', 'gclid', 'igshid', 'si', 'feature', 'ref', 'ref_src', 'share_id',
+}
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form of a URL for cache lookups"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    port = parts.port
+    netloc = host if not port or (scheme, port) in (('http', 80), ('https', 443)) else f"{host}:{port}"
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in _TRACKING_PARAMS and not k.lower().startswith('utm_')
+    )
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((scheme, netloc, path, urlencode(query), ''))
+
+
+def url_key(url: str) -> str:
+    return f"url:{normalize_url(url)}"
+
+
+def video_key(info: dict, format_id: str = None) -> str:
+    """Key for a yt-dlp result: same video in the same format is the same file"""
+    extractor = info.get('extractor_key') or info.get('extractor') or 'generic'
+    return f"ytdlp:{extractor}:{info.get('id')}:{format_id or info.get('format_id') or ''}"
+
+
+class MediaCache:
+    """SQLite-backed cache_key -> delivered media (file_id or bridge message)"""
+
+    def __init__(self, path: str, ttl_seconds: int = 30 * 86400, max_entries: int = 5000):
+        self.path = path
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS media (
+                cache_key TEXT PRIMARY KEY,
+                file_id TEXT,
+                media_type TEXT,
+                bridge_chat_id INTEGER,
+                bridge_message_id INTEGER,
+                filename TEXT,
+                file_size INTEGER,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS media_last_used ON media (last_used)')
+        self._db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, cache_key: str):
+        """Return the cached entry as a dict, or None if missing or expired"""
+        row = self._db.execute('SELECT * FROM media WHERE cache_key = ?', (cache_key,)).fetchone()
+        now = time.time()
+        if row is None or (self.ttl and now - row['created_at'] > self.ttl):
+            if row is not None:
+                self.delete(cache_key)
+            self.misses += 1
+            return None
+        self._db.execute('UPDATE media SET last_used = ? WHERE cache_key = ?', (now, cache_key))
+        self._db.commit()
+        self.hits += 1
+        return dict(row)
+
+    def put(self, cache_keys, entry: dict):
+        """Store one delivered media entry under every key that identifies it"""
+        now = time.time()
+        rows = [
+            (
+                key,
+                entry.get('file_id'),
+                entry.get('media_type'),
+                entry.get('bridge_chat_id'),
+                entry.get('bridge_message_id'),
+                entry.get('filename'),
+                entry.get('file_size'),
+                now,
+                now,
+            )
+            for key in cache_keys if key
+        ]
+        self._db.executemany('INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        self._db.commit()
+        self._evict()
+
+    def delete(self, cache_key: str):
+        self._db.execute('DELETE FROM media WHERE cache_key = ?', (cache_key,))
+        self._db.commit()
+
+    def _evict(self):
+        """Drop expired rows, then the least recently used ones beyond max_entries"""
+        if self.ttl:
+            self._db.execute('DELETE FROM media WHERE created_at < ?', (time.time() - self.ttl,))
+        if self.max_entries:
+            self._db.execute('''
+                DELETE FROM media WHERE cache_key IN (
+                    SELECT cache_key FROM media ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_entries,))
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,216 @@
+"""
+Video metadata probing
+Width, height and duration for uploads. MP4/MOV files are read directly:
+only the box headers plus mvhd/tkhd/hdlr are parsed, no process spawned.
+Anything else (or an MP4 the parser can't handle, e.g. fragmented) goes to
+ffprobe, run asynchronously with a concurrency limit. Results are cached
+by path, size and mtime.
+"""
+
+import os
+import json
+import struct
+import asyncio
+from collections import OrderedDict
+
+MP4_EXTENSIONS = ('.mp4', '.m4v', '.mov')
+
+_EMPTY = {'width': None, 'height': None, 'duration': None}
+
+
+def _boxes(f, start: int, end: int):
+    """Yield (type, payload_offset, payload_size) for the boxes in [start, end)"""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack('>I4s', header)
+        header_size = 8
+        if size == 1:
+            large = f.read(8)
+            if len(large) < 8:
+                return
+            size = struct.unpack('>Q', large)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size:
+            return
+        yield box_type, offset + header_size, size - header_size
+        offset += size
+
+
+def _read(f, offset: int, size: int) -> bytes:
+    f.seek(offset)
+    return f.read(size)
+
+
+def _parse_mvhd(data: bytes):
+    """(timescale, duration) from a movie header"""
+    if data[0] == 1:
+        timescale, duration = struct.unpack_from('>IQ', data, 20)
+    else:
+        timescale, duration = struct.unpack_from('>II', data, 12)
+    return timescale, duration
+
+
+def _parse_tkhd(data: bytes):
+    """(width, height) from a track header, as displayed (90/270 degree rotation applied); None if truncated"""
+    if not data:
+        return None
+    base = 4 + (32 if data[0] == 1 else 20)  # version/flags + times, track id, duration
+    base += 8 + 2 + 2 + 2 + 2                # reserved, layer, alternate group, volume, reserved
+    if len(data) < base + 44:                # matrix (36) + width/height (8)
+        return None
+    a, b = struct.unpack_from('>ii', data, base)
+    width, height = struct.unpack_from('>II', data, base + 36)
+    width, height = width >> 16, height >> 16
+    if a == 0 and b != 0:
+        width, height = height, width
+    return width, height
+
+
+def _parse_trak(f, start: int, end: int):
+    """(handler type, displayed dimensions) of one track"""
+    handler = dimensions = None
+    for box_type, offset, size in _boxes(f, start, end):
+        if box_type == b'tkhd':
+            dimensions = _parse_tkhd(_read(f, offset, min(size, 96)))  # 84 bytes in v0, 96 in v1
+        elif box_type == b'mdia':
+            for child_type, child_offset, child_size in _boxes(f, offset, offset + size):
+                if child_type == b'hdlr':
+                    handler = _read(f, child_offset, min(child_size, 12))[8:12]
+    return handler, dimensions
+
+
+def parse_mp4(path: str):
+    """Video metadata from MP4/MOV box headers, or None if not found"""
+    timescale = duration = dimensions = None
+    with open(path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        for box_type, offset, size in _boxes(f, 0, file_size):
+            if box_type != b'moov':
+                continue  # mdat and friends are skipped with a single seek
+            for child_type, child_offset, child_size in _boxes(f, offset, offset + size):
+                if child_type == b'mvhd':
+                    timescale, duration = _parse_mvhd(_read(f, child_offset, min(child_size, 32)))
+                elif child_type == b'trak' and dimensions is None:
+                    handler, track_dimensions = _parse_trak(f, child_offset, child_offset + child_size)
+                    if handler == b'vide':
+                        dimensions = track_dimensions
+            break
+
+    # Fragmented MP4s keep a zero duration here; let ffprobe handle those
+    if not dimensions or not all(dimensions) or not timescale or not duration:
+        return None
+    width, height = dimensions
+    return {'width': width, 'height': height, 'duration': int(duration / timescale) or None}
+
+
+def mp4_is_faststart(path: str):
+    """True if moov comes before mdat (streamable), False if after, None if not an MP4 we can read"""
+    try:
+        with open(path, 'rb') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            for box_type, _, _ in _boxes(f, 0, file_size):
+                if box_type == b'moov':
+                    return True
+                if box_type == b'mdat':
+                    return False
+    except (OSError, struct.error):
+        pass
+    return None
+
+
+class MediaProbe:
+    """MP4 header fast path, async ffprobe fallback, cached per file version"""
+
+    def __init__(self, concurrency: int = 2, timeout: float = 30, cache_size: int = 256):
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._cache = OrderedDict()  # (path, size, mtime_ns) -> info
+        self.fast_path_hits = 0
+        self.ffprobe_runs = 0
+
+    async def video_info(self, file_path: str) -> dict:
+        """{'width', 'height', 'duration'}; values are None when unknown"""
+        try:
+            st = os.stat(file_path)
+        except OSError as e:
+            print(f"⚠️ Could not extract video info: {e}")
+            return dict(_EMPTY)
+
+        key = (os.path.abspath(file_path), st.st_size, st.st_mtime_ns)
+        info = self._cache.get(key)
+        if info is not None:
+            self._cache.move_to_end(key)
+            return dict(info)
+
+        info = None
+        if file_path.lower().endswith(MP4_EXTENSIONS):
+            try:
+                info = parse_mp4(file_path)
+            except (OSError, struct.error, IndexError) as e:
+                print(f"⚠️ MP4 header parse failed, using ffprobe: {e}")
+            if info:
+                self.fast_path_hits += 1
+        if not info:
+            info = await self.ffprobe(file_path)
+        if not info:
+            return dict(_EMPTY)
+
+        self._cache[key] = info
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return dict(info)
+
+    async def ffprobe(self, file_path: str):
+        """Run ffprobe without blocking the event loop; None if it fails"""
+        cmd = [
+            'ffprobe', '-v', 'quiet', '-print_format', 'json',
+            '-show_format', '-show_streams', file_path
+        ]
+        async with self._semaphore:
+            self.ffprobe_runs += 1
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+                )
+            except OSError as e:
+                print(f"⚠️ Could not extract video info: {e}")
+                return None
+            try:
+                stdout, _ = await asyncio.wait_for(process.communicate(), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                print(f"⚠️ ffprobe timed out on {file_path}")
+                return None
+
+        if process.returncode != 0:
+            return None
+        try:
+            data = json.loads(stdout)
+        except ValueError:
+            return None
+
+        # Find video stream
+        video_stream = None
+        for stream in data.get('streams', []):
+            if stream.get('codec_type') == 'video':
+                video_stream = stream
+                break
+        if not video_stream:
+            return None
+
+        width = int(video_stream.get('width', 0))
+        height = int(video_stream.get('height', 0))
+        duration = float(video_stream.get('duration') or data.get('format', {}).get('duration') or 0)
+        return {
+            'width': width or None,
+            'height': height or None,
+            'duration': int(duration) if duration > 0 else None,
+        }
@@ -0,0 +1,205 @@
+"""
+In-process metrics
+A small counter/gauge/histogram registry rendered in the Prometheus text
+exposition format for the health server's /metrics route. Hot paths record
+into module-level metrics (cheap: one lock and a dict update); state the
+bot already tracks (queue depth, cache hit counts, throughput trackers) is
+read by collectors at scrape time instead of being duplicated.
+"""
+
+import math
+import threading
+
+# Seconds: from cache hits and page scrapes up to multi-GB transfers
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label values tuple -> value
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def samples(self):
+        """(suffix, labels, value) tuples for rendering"""
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield '', tuple(zip(self.labelnames, key)), value
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = state[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        for key, (counts, total, count) in items:
+            labels = tuple(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield '_bucket', labels + (('le', _format_value(float(bound))),), cumulative
+            yield '_sum', labels, total
+            yield '_count', labels, count
+
+
+class MetricsRegistry:
+    """Named metrics plus scrape-time collectors, rendered as Prometheus text"""
+
+    def __init__(self, prefix: str = 'tgbot'):
+        self.prefix = prefix
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        metric.name = f"{self.prefix}_{metric.name}"
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collect):
+        """collect() -> iterable of (name, kind, documentation, [(labels dict, value), ...]), called per scrape"""
+        with self._lock:
+            self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines = []
+
+        def family(name, kind, documentation, samples):
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, labels, value in samples:
+                lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        for metric in metrics:
+            family(metric.name, metric.kind, metric.documentation, metric.samples())
+        for collect in collectors:
+            try:
+                collected = list(collect())
+            except Exception as e:
+                lines.append(f"# collector failed: {_escape(e)}")
+                continue
+            for name, kind, documentation, samples in collected:
+                family(
+                    f"{self.prefix}_{name}", kind, documentation,
+                    (('', tuple(sorted(labels.items())), value) for labels, value in samples),
+                )
+        return '\n'.join(lines) + '\n'
+
+
+# Global metrics registry instance
+registry = MetricsRegistry()
+
+uptime_seconds = registry.gauge('uptime_seconds', 'Seconds since the health server started')
+
+# Downloads (kind: direct, ytdlp, relay)
+downloads = registry.counter('downloads_total', 'Finished downloads by kind and result', ('kind', 'result'))
+download_bytes = registry.counter('download_bytes_total', 'Bytes downloaded', ('kind',))
+download_seconds = registry.histogram('download_seconds', 'Download duration', ('kind',))
+
+# Page/format extraction (source: ytdlp, qombol, mediadelivery...)
+extract_seconds = registry.histogram('extract_seconds', 'Extraction latency, cache misses only', ('source',))
+extract_errors = registry.counter('extract_errors_total', 'Failed extractions', ('source',))
+
+# Uploads (path: bot_api, relay, bridge, local)
+uploads = registry.counter('uploads_total', 'Finished uploads by path and result', ('path', 'result'))
+upload_bytes = registry.counter('upload_bytes_total', 'Bytes uploaded', ('path',))
+upload_seconds = registry.histogram('upload_seconds', 'Upload duration', ('path',))
+
+# Whole jobs as seen by the user
+jobs = registry.counter('jobs_total', 'Download jobs by result', ('result',))
+job_seconds = registry.histogram('job_seconds', 'Job duration from start of processing to delivery')
+
+# Bridge accounts
+bridge_part_retries = registry.counter('bridge_part_retries_total', 'Bridge upload parts sent again after a failure')
+bridge_flood_waits = registry.counter('bridge_flood_waits_total', 'FloodWaits that rested a bridge account', ('account',))
+
+# Reddit API
+reddit_requests = registry.counter('reddit_requests_total', 'Authenticated Reddit API requests', ('status',))
+reddit_token_exchanges = registry.counter('reddit_token_exchanges_total', 'OAuth code exchanges', ('result',))
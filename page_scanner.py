@@ -0,0 +1,152 @@
+"""
+Page scanning engine
+Finds media URLs in scraped HTML with prioritized regex sets. Patterns are
+compiled once at import and run case-sensitively over a lowercased copy of
+the page (much faster than re.IGNORECASE), with the match sliced back out
+of the original text so URLs keep their case. Each pattern can name
+literals it needs, so patterns that can't match are skipped without
+scanning, and lookups stop at the first pattern that matches. Large pages
+are scanned in a worker thread to keep the event loop responsive.
+"""
+
+import re
+import asyncio
+
+# Pages larger than this are scanned off the event loop thread
+OFFLOAD_THRESHOLD = 256 * 1024
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm')
+
+
+def _lower_pattern(regex: str) -> str:
+    """Lowercase a regex's literals but not its escapes (\\S, \\W, \\D keep their meaning)"""
+    return re.sub(r'\\.|[^\\]+', lambda m: m.group(0) if m.group(0).startswith('\\') else m.group(0).lower(), regex)
+
+
+class Page:
+    """HTML text plus the lowercased copy patterns are matched against"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.lower = text.lower()
+        # A few characters lowercase to more than one; offsets are only shared when lengths agree
+        self.aligned = len(self.lower) == len(text)
+
+
+class PatternSet:
+    """Ordered regexes, highest priority first, with findall()[0]-style results"""
+
+    def __init__(self, patterns):
+        """patterns: regex strings, or (regex, literals) where one of the literals must be present"""
+        self._patterns = []
+        for pattern in patterns:
+            regex, literals = (pattern, ()) if isinstance(pattern, str) else pattern
+            self._patterns.append((
+                re.compile(_lower_pattern(regex)),
+                re.compile(regex, re.IGNORECASE),
+                tuple(literal.lower() for literal in literals),
+            ))
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def _match(self, index: int, page: Page):
+        lowered, fallback, literals = self._patterns[index]
+        if literals and not any(literal in page.lower for literal in literals):
+            return None
+        if page.aligned:
+            match = lowered.search(page.lower)
+        else:
+            match = fallback.search(page.text)
+        if match is None:
+            return None
+        # Like re.findall: the single group if the pattern has one, else the whole match
+        start, end = match.span(1 if match.re.groups else 0)
+        return page.text[start:end]
+
+    def first(self, page: Page):
+        """(index, match) of the highest-priority pattern that matches, or (None, None)"""
+        for index in range(len(self._patterns)):
+            value = self._match(index, page)
+            if value is not None:
+                return index, value
+        return None, None
+
+    def each_first(self, page: Page) -> list:
+        """[(index, match)] with the first match of every pattern that matches, in priority order"""
+        results = []
+        for index in range(len(self._patterns)):
+            value = self._match(index, page)
+            if value is not None:
+                results.append((index, value))
+        return results
+
+
+async def scan(func, text: str):
+    """Run func(Page(text)), in a worker thread if the page is large"""
+    if len(text) > OFFLOAD_THRESHOLD:
+        return await asyncio.to_thread(lambda: func(Page(text)))
+    return func(Page(text))
+
+
+# ----- pattern sets used by the scrapers -----
+
+_EXT = r'\.(?:mp4|avi|mkv|mov|wmv|flv|webm)'
+_EXT_HLS = r'\.(?:mp4|avi|mkv|mov|wmv|flv|webm|m3u8)'
+
+# Video URLs on a qombol.com page, most specific first
+QOMBOL_VIDEO = PatternSet([
+    # Direct video tags
+    (r'<video[^>]*src=["\']([^"\']+)["\']', ('<video',)),
+    (r'<source[^>]*src=["\']([^"\']+)["\']', ('<source',)),
+    # JavaScript video URLs
+    (r'file:\s*["\']([^"\']+' + _EXT_HLS + r')["\']', ('file:',)),
+    (r'src:\s*["\']([^"\']+' + _EXT_HLS + r')["\']', ('src:',)),
+    (r'video_url["\']?\s*:\s*["\']([^"\']+)["\']', ('video_url',)),
+    (r'videoUrl["\']?\s*:\s*["\']([^"\']+)["\']', ('videourl',)),
+    (r'mp4["\']?\s*:\s*["\']([^"\']+)["\']', ('mp4',)),
+    # CDN patterns common in adult sites
+    (r'https?://[^"\'\s]*\.b-cdn\.net/[^"\'\s]*' + _EXT, ('.b-cdn.net/',)),
+    (r'https?://[^"\'\s]*cdn[^"\'\s]*' + _EXT, VIDEO_EXTENSIONS),
+    # Generic video file URLs
+    (r'https?://[^"\'\s]+' + _EXT_HLS, VIDEO_EXTENSIONS + ('.m3u8',)),
+    # WordPress media URLs
+    (r'wp-content/uploads/[^"\'\s]*' + _EXT, ('wp-content/uploads/',)),
+])
+
+# Embedded players on a qombol.com page
+QOMBOL_EMBED = PatternSet([
+    (r'<iframe[^>]*src=["\']([^"\']+)["\']', ('<iframe',)),
+    (r'<embed[^>]*src=["\']([^"\']+)["\']', ('<embed',)),
+    (r'embed_url["\']?\s*:\s*["\']([^"\']+)["\']', ('embed_url',)),
+    # Look for player URLs
+    (r'player["\']?\s*:\s*["\']([^"\']+)["\']', ('player',)),
+])
+
+# Last resort: any media-looking URL
+QOMBOL_MEDIA = PatternSet([
+    (r'(https?://[^"\'\s]*(?:video|media|stream)[^"\'\s]*' + _EXT + r')', VIDEO_EXTENSIONS),
+    (r'(https?://[^"\'\s]*' + _EXT + r'[^"\'\s]*)', VIDEO_EXTENSIONS),
+])
+
+# Video URLs inside a mediadelivery.net embed page
+MEDIADELIVERY_VIDEO = PatternSet([
+    (r'"src":\s*"([^"]*\.mp4[^"]*)"', ('"src":',)),
+    (r'"file":\s*"([^"]*\.mp4[^"]*)"', ('"file":',)),
+    (r'"url":\s*"([^"]*\.mp4[^"]*)"', ('"url":',)),
+    (r'src:\s*"([^"]*\.mp4[^"]*)"', ('src:',)),
+    (r'file:\s*"([^"]*\.mp4[^"]*)"', ('file:',)),
+    (r'https://[^"\s]*\.b-cdn\.net/[^"\s]*\.mp4', ('.b-cdn.net/',)),
+    (r'https://[^"\s]*bunnycdn[^"\s]*\.mp4', ('bunnycdn',)),
+    (r'https://[^"\s]*mediadelivery[^"\s]*\.mp4', ('mediadelivery',)),
+])
+
+
+def scan_qombol_page(page: Page) -> dict:
+    """Everything resolve_qombol_page needs from one page, in a single call"""
+    video_index, video_url = QOMBOL_VIDEO.first(page)
+    return {
+        'video': (video_index, video_url),
+        'embeds': QOMBOL_EMBED.each_first(page) if video_url is None else [],
+        'media': QOMBOL_MEDIA.first(page) if video_url is None else (None, None),
+    }
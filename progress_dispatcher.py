@@ -0,0 +1,159 @@
+"""
+Progress message dispatcher
+All periodic progress edits go through one service instead of each job
+calling edit_text itself. Only the latest text per message is kept, edits
+whose text hasn't changed are dropped, a global edits-per-second budget
+is shared by every chat, and a RetryAfter from Telegram pauses all edits
+for the requested time.
+"""
+
+import time
+import asyncio
+from collections import OrderedDict
+
+from telegram.error import BadRequest, RetryAfter
+
+
+class ProgressDispatcher:
+    """Coalescing, rate-limited edit_text queue"""
+
+    def __init__(self, edits_per_second: float = 10, min_interval: float = 2):
+        self.rate = max(0.1, edits_per_second)
+        self.burst = max(1.0, self.rate)
+        self.min_interval = min_interval  # between two edits of the same message
+
+        self._pending = OrderedDict()  # key -> (message, text), oldest first
+        self._sent = {}                # key -> (text, sent_at)
+        self._tokens = self.burst
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.edits = 0
+        self.skipped = 0
+
+    @staticmethod
+    def _key(message):
+        return (message.chat_id, message.message_id)
+
+    # ----- producers -----
+
+    def submit(self, message, text: str):
+        """Queue text as the next state of message (call on the event loop thread)"""
+        key = self._key(message)
+        sent = self._sent.get(key)
+        if sent and sent[0] == text:
+            self._pending.pop(key, None)
+            self.skipped += 1
+            return
+        if key in self._pending:
+            self.skipped += 1  # an older state that never got sent
+        self._pending[key] = (message, text)
+        self._wakeup.set()
+
+    def discard(self, message):
+        """Drop any queued edit for a message that is finished or about to be replaced/deleted"""
+        key = self._key(message)
+        self._pending.pop(key, None)
+        self._sent.pop(key, None)
+
+    # ----- dispatch -----
+
+    def _take_token(self) -> float:
+        """Consume one edit from the budget; returns seconds to wait if none is left"""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.rate
+
+    def _next_ready(self):
+        """Oldest pending message whose own min_interval has passed, or (None, delay)"""
+        now = time.monotonic()
+        soonest = None
+        for key in self._pending:
+            sent = self._sent.get(key)
+            ready_at = sent[1] + self.min_interval if sent else 0
+            if ready_at <= now:
+                return key, 0
+            soonest = ready_at - now if soonest is None else min(soonest, ready_at - now)
+        return None, soonest
+
+    def _forget_stale(self):
+        """Drop sent-state for messages nobody discarded (jobs that ended without cleanup)"""
+        cutoff = time.monotonic() - 600
+        for key in [key for key, (_, sent_at) in self._sent.items() if sent_at < cutoff]:
+            del self._sent[key]
+
+    async def _run(self):
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+
+            key, delay = self._next_ready()
+            if key is None:
+                # Everything pending was edited too recently; wait for the first to cool down
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            wait = self._take_token()
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+
+            message, text = self._pending.pop(key)
+            if len(self._sent) > 1000:
+                self._forget_stale()
+            try:
+                await message.edit_text(text)
+                self.edits += 1
+                self._sent[key] = (text, time.monotonic())
+            except RetryAfter as e:
+                retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+                print(f"⏳ Progress edits rate limited, pausing {retry_after}s")
+                self._paused_until = time.monotonic() + retry_after
+                # Retry unless a newer state arrived meanwhile
+                if key not in self._pending:
+                    self._pending[key] = (message, text)
+                    self._pending.move_to_end(key, last=False)
+            except BadRequest as e:
+                # "Message is not modified" or the message is gone: nothing to retry
+                if 'not modified' in str(e).lower():
+                    self._sent[key] = (text, time.monotonic())
+                else:
+                    self._sent.pop(key, None)
+            except Exception as e:
+                print(f"⚠️ Progress edit failed: {e}")
+
+    async def start(self):
+        """Start the dispatcher task (call from inside the running event loop)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._pending.clear()
+
+    def stats(self) -> dict:
+        return {
+            'pending': len(self._pending),
+            'edits': self.edits,
+            'skipped': self.skipped,
+            'edits_per_second': self.rate,
+        }
@@ -6,6 +6,8 @@ import os
 import secrets
 import urllib.parse
 from datetime import datetime, timedelta
+from http_sessions import session_registry
+import metrics
 
 class RedditAuthManager:
     def __init__(self):
@@ -108,17 +110,19 @@ class RedditAuthManager:
             }
             
             auth = aiohttp.BasicAuth(self.client_id, self.client_secret)
-            headers = {'User-Agent': 'TelegramDownloadBot/1.0'}
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(token_url, data=data, auth=auth, headers=headers) as response:
-                    if response.status == 200:
-                        return await response.json()
-                    else:
-                        print(f"❌ Token exchange failed: {response.status}")
-                        return None
+            session = session_registry.get('reddit')
+            async with session.post(token_url, data=data, auth=auth) as response:
+                if response.status == 200:
+                    metrics.reddit_token_exchanges.inc(result='ok')
+                    return await response.json()
+                else:
+                    metrics.reddit_token_exchanges.inc(result=str(response.status))
+                    print(f"❌ Token exchange failed: {response.status}")
+                    return None
                         
         except Exception as e:
+            metrics.reddit_token_exchanges.inc(result='error')
             print(f"❌ Error exchanging code for token: {e}")
             return None
     
@@ -150,17 +154,17 @@ class RedditAuthManager:
         headers = kwargs.get('headers', {})
         headers.update({
             'Authorization': f'Bearer {token}',
-            'User-Agent': 'TelegramDownloadBot/1.0'
         })
         kwargs['headers'] = headers
         
-        async with aiohttp.ClientSession() as session:
-            async with session.request(method, url, **kwargs) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    print(f"❌ Reddit API request failed: {response.status}")
-                    return None
+        session = session_registry.get('reddit')
+        async with session.request(method, url, **kwargs) as response:
+            metrics.reddit_requests.inc(status=response.status)
+            if response.status == 200:
+                return await response.json()
+            else:
+                print(f"❌ Reddit API request failed: {response.status}")
+                return None
 
 # Global auth manager instance
 reddit_auth = RedditAuthManager()
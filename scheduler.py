@@ -0,0 +1,205 @@
+"""
+Download job scheduler
+Runs download jobs from a fixed pool of workers with a global concurrency
+cap, a per-user concurrency cap and round-robin fairness across users, so
+one user pasting many links can't starve everyone else.
+"""
+
+import time
+import asyncio
+import itertools
+from collections import deque
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+_job_ids = itertools.count(1)
+
+
+class QueueFull(Exception):
+    """Raised when a user already has too many jobs waiting"""
+
+
+class DownloadJob:
+    """One unit of work submitted by a user"""
+
+    def __init__(self, user_id: int, run, label: str = ""):
+        self.id = next(_job_ids)
+        self.user_id = user_id
+        self.run = run  # zero-argument coroutine function
+        self.label = label
+        self.state = QUEUED
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def __repr__(self):
+        return f"<DownloadJob #{self.id} user={self.user_id} {self.state}>"
+
+
+class DownloadScheduler:
+    """FIFO-per-user, round-robin-across-users job queue with bounded workers"""
+
+    def __init__(self, max_concurrent: int = 3, max_per_user: int = 1, max_queued_per_user: int = 10):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_per_user = max(1, max_per_user)
+        self.max_queued_per_user = max_queued_per_user
+
+        self._queues = {}        # user_id -> deque of queued jobs
+        self._order = deque()    # users with queued jobs, in round-robin order
+        self._running = {}       # user_id -> number of running jobs
+        self._workers = []
+        self._wakeup = asyncio.Event()
+        self.on_change = None    # called after a job starts or finishes (queue positions moved)
+
+    # ----- submission -----
+
+    def submit(self, user_id: int, run, label: str = "") -> DownloadJob:
+        """Queue a job; raises QueueFull when the user's backlog is at its limit"""
+        queue = self._queues.get(user_id)
+        if queue and self.max_queued_per_user and len(queue) >= self.max_queued_per_user:
+            raise QueueFull(f"user {user_id} already has {len(queue)} queued jobs")
+
+        job = DownloadJob(user_id, run, label)
+        if queue is None:
+            queue = self._queues[user_id] = deque()
+        if not queue:
+            self._order.append(user_id)
+        queue.append(job)
+        self._wakeup.set()
+        return job
+
+    def will_wait(self, job: DownloadJob) -> bool:
+        """True if the job can't start right away (global or per-user cap reached)"""
+        if job.state != QUEUED:
+            return False
+        if self._running.get(job.user_id, 0) >= self.max_per_user:
+            return True
+        return self.position(job) > self.max_concurrent - self.running_count()
+
+    def position(self, job: DownloadJob) -> int:
+        """1-based position of a queued job in the fair dispatch order (0 if not queued)
+
+        Only jobs that can actually start ahead of it count: the job's own
+        earlier jobs, and other users' jobs that fit under their per-user cap.
+        Jobs of a user already at the cap wait for that user's running jobs,
+        not in front of this one.
+        """
+        ahead = 0
+        for round_index, queued in self._fair_order():
+            if queued is job:
+                return ahead + 1
+            free = self.max_per_user - self._running.get(queued.user_id, 0)
+            if queued.user_id == job.user_id or round_index < free:
+                ahead += 1
+        return 0
+
+    def _fair_order(self):
+        """Interleave each user's FIFO queue: first job of every user, then second...
+
+        Yields (index in the user's queue, job).
+        """
+        queues = [self._queues[user_id] for user_id in self._order]
+        for round_index in itertools.count():
+            emitted = False
+            for queue in queues:
+                if round_index < len(queue):
+                    emitted = True
+                    yield round_index, queue[round_index]
+            if not emitted:
+                return
+
+    # ----- stats -----
+
+    def running_count(self) -> int:
+        return sum(self._running.values())
+
+    def queued_count(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def stats(self) -> dict:
+        return {
+            'running': self.running_count(),
+            'queued': self.queued_count(),
+            'users_waiting': len(self._order),
+            'max_concurrent': self.max_concurrent,
+            'max_per_user': self.max_per_user,
+        }
+
+    # ----- dispatch -----
+
+    def _take(self):
+        """Pop the next eligible job and move its user to the back of the rotation"""
+        for user_id in self._order:
+            if self._running.get(user_id, 0) >= self.max_per_user:
+                continue
+            queue = self._queues[user_id]
+            job = queue.popleft()
+            self._order.remove(user_id)
+            if queue:
+                self._order.append(user_id)
+            else:
+                del self._queues[user_id]
+            return job
+        return None
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job = self._take()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            self._running[job.user_id] = self._running.get(job.user_id, 0) + 1
+            job.state = RUNNING
+            job.started_at = time.time()
+            print(f"▶️ Worker {worker_id} started job #{job.id} for user {job.user_id} "
+                  f"(waited {job.started_at - job.created_at:.1f}s)")
+            self._notify()
+            try:
+                await job.run()
+                job.state = DONE
+            except asyncio.CancelledError:
+                job.state = FAILED
+                raise
+            except Exception as e:
+                job.state = FAILED
+                job.error = e
+                print(f"❌ Job #{job.id} failed: {e}")
+            finally:
+                job.finished_at = time.time()
+                self._running[job.user_id] -= 1
+                if not self._running[job.user_id]:
+                    del self._running[job.user_id]
+                # A finished job may unblock a user that was at its cap
+                self._wakeup.set()
+                self._notify()
+
+    def _notify(self):
+        if self.on_change is None:
+            return
+        try:
+            self.on_change()
+        except Exception as e:
+            print(f"⚠️ Scheduler change hook failed: {e}")
+
+    async def start(self):
+        """Spawn the worker pool (call from inside the running event loop)"""
+        if self._workers:
+            return
+        self._workers = [
+            asyncio.create_task(self._worker(i + 1)) for i in range(self.max_concurrent)
+        ]
+        print(f"👷 Download scheduler started: {self.max_concurrent} workers, "
+              f"{self.max_per_user} per user")
+
+    async def stop(self):
+        """Cancel workers; running jobs are interrupted"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
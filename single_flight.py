@@ -0,0 +1,88 @@
+"""
+Request coalescing for identical downloads
+While a link is being downloaded, later requests for the same (normalized)
+URL attach to the running job instead of starting their own download. The
+followers' status messages mirror the leader's progress, and when the job
+finishes each follower is sent the result by file_id / bridge copy.
+"""
+
+import asyncio
+
+
+class ProgressFanout:
+    """Stands in for the leader's status message and mirrors its edits to the followers'"""
+
+    def __init__(self, message, followers: list):
+        self._message = message
+        self._followers = followers  # shared with the Flight, so late joiners are included
+
+    async def edit_text(self, text, *args, **kwargs):
+        if self._followers:
+            # Buttons act on the leader's job (and chat); followers only get the text
+            mirrored = {k: v for k, v in kwargs.items() if k != 'reply_markup'}
+            await asyncio.gather(
+                *(follower.edit_text(text, *args, **mirrored) for follower in list(self._followers)),
+                return_exceptions=True,
+            )
+        return await self._message.edit_text(text, *args, **kwargs)
+
+    def __getattr__(self, name):
+        # Everything else (delete, chat, message_id...) is the leader's own message
+        return getattr(self._message, name)
+
+
+class Flight:
+    """One in-progress download that other requests can wait on"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.followers = []  # status messages of requests waiting on this download
+        self.fanout = None
+        self._future = asyncio.get_running_loop().create_future()
+
+    def attach(self, message):
+        """Add a follower's status message to the progress mirror"""
+        self.followers.append(message)
+
+    def detach(self, message):
+        if message in self.followers:
+            self.followers.remove(message)
+
+    def progress(self, message) -> ProgressFanout:
+        """Wrap the leader's status message so its edits reach every follower"""
+        self.fanout = ProgressFanout(message, self.followers)
+        return self.fanout
+
+    async def wait(self):
+        """Result of the leader's job (the delivered media entry, or None); re-raises its error"""
+        return await asyncio.shield(self._future)
+
+
+class SingleFlight:
+    """Registry of in-flight downloads keyed on normalized URL"""
+
+    def __init__(self):
+        self._flights = {}
+
+    def get(self, key: str):
+        return self._flights.get(key)
+
+    def begin(self, key: str) -> Flight:
+        flight = self._flights[key] = Flight(key)
+        return flight
+
+    def finish(self, flight: Flight, result=None, error: BaseException = None):
+        """Resolve a flight for its followers and stop new requests from joining it"""
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+        if flight._future.done():
+            return
+        if error is not None:
+            flight._future.set_exception(error)
+            # Nobody may be waiting; don't let asyncio warn about it
+            flight._future.exception()
+        else:
+            flight._future.set_result(result)
+
+    def __len__(self):
+        return len(self._flights)
@@ -0,0 +1,104 @@
+"""
+Site handler registry
+Maps a link to the handler that downloads it. Handlers are registered by
+domain and looked up by walking the host's labels from the longest suffix
+down (so m.youtube.com and youtube.com hit the same entry) with one dict
+lookup per label. Each handler declares how its links are fetched:
+directly, through yt-dlp, or with a custom extractor on the bot. The
+decision is cached per host.
+"""
+
+from urllib.parse import urlsplit
+
+# Capabilities
+DIRECT = 'direct'  # plain HTTP download of the URL itself
+YTDLP = 'ytdlp'    # resolve and download with yt-dlp
+CUSTOM = 'custom'  # a bot method scrapes the page (see SiteHandler.extractor)
+
+# Stop caching routes for new hosts beyond this many
+_ROUTE_CACHE_LIMIT = 4096
+
+
+class SiteHandler:
+    """How links for a set of domains are downloaded"""
+
+    def __init__(self, name: str, domains, capability: str, extractor: str = None,
+                 needs_user: bool = False, emoji: str = "📥"):
+        self.name = name
+        self.domains = tuple(domain.lower() for domain in domains)
+        self.capability = capability
+        self.extractor = extractor    # name of the bot method for CUSTOM handlers
+        self.needs_user = needs_user  # extractor takes user_id= (per-user auth)
+        self.emoji = emoji
+
+    def __repr__(self):
+        return f"<SiteHandler {self.name} {self.capability}>"
+
+
+# Anything not registered is downloaded as a direct file link
+DEFAULT_HANDLER = SiteHandler('direct', (), DIRECT)
+
+
+class SiteRegistry:
+    """Registered domain -> SiteHandler, with a per-host routing cache"""
+
+    def __init__(self):
+        self._domains = {}
+        self._routes = {}
+
+    def register(self, handler: SiteHandler) -> SiteHandler:
+        for domain in handler.domains:
+            self._domains[domain] = handler
+        # Earlier decisions may now route elsewhere
+        self._routes.clear()
+        return handler
+
+    def resolve(self, url: str) -> SiteHandler:
+        """Handler for a URL (DEFAULT_HANDLER if its domain isn't registered)"""
+        try:
+            host = (urlsplit(url).hostname or '').rstrip('.')
+        except ValueError:
+            return DEFAULT_HANDLER
+
+        handler = self._routes.get(host)
+        if handler is None:
+            handler = self._lookup(host)
+            if len(self._routes) < _ROUTE_CACHE_LIMIT:
+                self._routes[host] = handler
+        return handler
+
+    def _lookup(self, host: str) -> SiteHandler:
+        labels = host.split('.')
+        for i in range(len(labels) - 1):
+            handler = self._domains.get('.'.join(labels[i:]))
+            if handler is not None:
+                return handler
+        return DEFAULT_HANDLER
+
+
+# Global site registry instance
+site_registry = SiteRegistry()
+
+site_registry.register(SiteHandler(
+    'qombol.com', ['qombol.com'], CUSTOM, extractor='download_qombol_content', emoji="🎬",
+))
+site_registry.register(SiteHandler(
+    'Instagram', ['instagram.com'], CUSTOM, extractor='download_instagram_content', emoji="📸",
+))
+site_registry.register(SiteHandler(
+    'Reddit', ['reddit.com'], CUSTOM, extractor='download_reddit_content', needs_user=True, emoji="🔴",
+))
+site_registry.register(SiteHandler(
+    'video site',
+    [
+        'pornhub.com',
+        'youtube.com', 'youtu.be',
+        'xvideos.com',
+        'xnxx.com',
+        'porn300.com',
+        'xvv1deos.com',
+        'motherless.com',
+    ],
+    YTDLP,
+    emoji="📹",
+))
@@ -22,13 +22,25 @@ if [ "$HEALTH_PORT" = "$PORT" ]; then
   HEALTH_PORT="$NEW_HEALTH"
 fi
 
-# Start Telegram Bot API server (listens on Render PORT)
+# Local mode (opt-in): the server shares our filesystem, so the bot hands it
+# file:// paths to read in place instead of uploading every byte over HTTP.
+# A --local server sends any file:// path it is given, so it must not be
+# reachable from outside: bind it to loopback (the bot uses 127.0.0.1).
+BOT_API_LOCAL_MODE="${BOT_API_LOCAL_MODE:-false}"
+LOCAL_FLAGS=()
+if [[ "${BOT_API_LOCAL_MODE,,}" =~ ^(1|true|yes|on)$ ]]; then
+  LOCAL_FLAGS=(--local --http-ip-address=127.0.0.1)
+  echo "Starting Bot API server in --local mode on 127.0.0.1 only."
+fi
+
+# Start Telegram Bot API server (listens on Render PORT; loopback only in local mode)
 telegram-bot-api \
   --api-id="${TELEGRAM_API_ID}" \
   --api-hash="${TELEGRAM_API_HASH}" \
   --http-port="${PORT}" \
   --dir=/var/lib/telegram-bot-api \
-  --temp-dir=/tmp/telegram-bot-api &
+  --temp-dir=/tmp/telegram-bot-api \
+  "${LOCAL_FLAGS[@]}" &
 
 # Wait for the Bot API server to become ready (max ~60s)
 echo "Waiting for Bot API server on 127.0.0.1:${PORT}..."
@@ -52,6 +64,7 @@ done
 # Point our Python bot to the local Bot API server inside the container, unless already set
 export BOT_API_BASE_URL="${BOT_API_BASE_URL:-http://127.0.0.1:${PORT}/bot}"
 export BOT_API_BASE_FILE_URL="${BOT_API_BASE_FILE_URL:-http://127.0.0.1:${PORT}/file/bot}"
+export BOT_API_LOCAL_MODE
 
 # Launch the Python bot (health server will bind to HEALTH_PORT)
 exec python3 main.py
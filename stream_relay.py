@@ -0,0 +1,117 @@
+"""
+Streaming relay to a Local Bot API server
+Pipes a direct download straight into the multipart upload of a
+send* request instead of writing the whole file to disk first. The source
+response body is read into a bounded queue and the upload drains it, so
+download and upload overlap and only a few chunks are ever held in
+memory. Only sources with a known Content-Length are relayed: the
+multipart body is sent with an exact Content-Length, never chunked.
+"""
+
+import uuid
+import asyncio
+
+# End of the source stream (or an error) in the relay queue
+_EOF = object()
+
+
+class RelayError(Exception):
+    """The source or the Bot API server broke the relay"""
+
+
+class StreamRelay:
+    """GET a URL and stream its body into one Bot API upload"""
+
+    def __init__(self, session, url: str, buffer_chunks: int = 16, chunk_size: int = 256 * 1024):
+        self.session = session
+        self.url = url
+        self.buffer_chunks = max(1, buffer_chunks)
+        self.chunk_size = chunk_size
+        self.response = None
+        self.status = None
+        self.headers = {}
+        self.total_size = 0
+        self.downloaded = 0
+
+    async def open(self):
+        """Start the source request and read its status and headers"""
+        self.response = await self.session.get(self.url)
+        self.status = self.response.status
+        self.headers = self.response.headers
+        if self.status == 200 and 'Content-Encoding' not in self.headers:
+            self.total_size = int(self.headers.get('Content-Length') or 0)
+
+    @property
+    def relayable(self) -> bool:
+        """Only a plain 200 with a known length can be relayed"""
+        return self.status == 200 and self.total_size > 0
+
+    async def _pump(self, queue: asyncio.Queue):
+        """Producer: source body -> bounded queue"""
+        try:
+            async for chunk in self.response.content.iter_chunked(self.chunk_size):
+                self.downloaded += len(chunk)
+                await queue.put(chunk)
+            if self.downloaded != self.total_size:
+                raise RelayError(f"source sent {self.downloaded} of {self.total_size} bytes")
+            await queue.put(_EOF)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(e)
+
+    async def send(self, api_url: str, fields: dict, file_field: str, filename: str,
+                   content_type: str = 'application/octet-stream') -> dict:
+        """POST a multipart send* request whose file part is the source body; returns the result"""
+        boundary = uuid.uuid4().hex
+        safe_name = filename.replace('"', "'").replace('\r', ' ').replace('\n', ' ')
+
+        head = b''.join(
+            (
+                f'--{boundary}\r\n'
+                f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+                f'{value}\r\n'
+            ).encode('utf-8')
+            for name, value in fields.items() if value is not None
+        )
+        head += (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{file_field}"; filename="{safe_name}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'
+        ).encode('utf-8')
+        tail = f'\r\n--{boundary}--\r\n'.encode('utf-8')
+
+        queue = asyncio.Queue(maxsize=self.buffer_chunks)
+        pump = asyncio.create_task(self._pump(queue))
+
+        async def body():
+            yield head
+            while True:
+                item = await queue.get()
+                if item is _EOF:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+            yield tail
+
+        headers = {
+            'Content-Type': f'multipart/form-data; boundary={boundary}',
+            # Exact length so the upload isn't sent with chunked transfer encoding
+            'Content-Length': str(len(head) + self.total_size + len(tail)),
+        }
+        try:
+            async with self.session.post(api_url, data=body(), headers=headers) as response:
+                result = await response.json(content_type=None)
+        finally:
+            pump.cancel()
+            await asyncio.gather(pump, return_exceptions=True)
+
+        if not result.get('ok'):
+            raise RelayError(result.get('description') or f"HTTP {response.status}")
+        return result['result']
+
+    def close(self):
+        if self.response is not None:
+            self.response.release()
+            self.response = None
@@ -0,0 +1,54 @@
+from format_planner import plan_format
+
+MB = 1024 * 1024
+
+
+def _info(*formats, duration=600):
+    return {'duration': duration, 'formats': list(formats)}
+
+
+def _video(format_id, height, size=None, ext='mp4', vcodec='avc1.640028'):
+    return {'format_id': format_id, 'height': height, 'filesize': size, 'ext': ext,
+            'vcodec': vcodec, 'acodec': 'none'}
+
+
+def _audio(format_id, size=None, ext='m4a', acodec='mp4a.40.2'):
+    return {'format_id': format_id, 'filesize': size, 'ext': ext, 'vcodec': 'none',
+            'acodec': acodec, 'abr': 128}
+
+
+def _progressive(format_id, height, size=None):
+    return {'format_id': format_id, 'height': height, 'filesize': size, 'ext': 'mp4',
+            'vcodec': 'avc1.42001E', 'acodec': 'mp4a.40.2'}
+
+
+MIXED = _info(
+    _video('313', 2160, ext='webm', vcodec='vp9'),  # size unknown
+    _video('137', 1080, 40 * MB),
+    _audio('251', 3 * MB, ext='webm', acodec='opus'),
+    _audio('140', 3 * MB),
+    _progressive('22', 720),  # size unknown
+    _progressive('18', 360, 10 * MB),
+)
+
+
+def test_known_size_that_fits_beats_unknown_size():
+    plan = plan_format(MIXED, 50 * MB)
+    assert plan.spec == '137+140'
+    assert plan.size == 43 * MB
+
+
+def test_height_cap_still_prefers_known_size():
+    plan = plan_format(MIXED, 50 * MB, max_height=1080)
+    assert plan.spec == '137+140'
+
+
+def test_unknown_size_used_when_no_known_size_fits():
+    plan = plan_format(MIXED, 5 * MB)
+    assert plan.spec == '313+251'
+    assert plan.size == 0
+
+
+def test_smallest_when_nothing_fits():
+    info = _info(_progressive('18', 360, 10 * MB), _progressive('22', 720, 30 * MB))
+    assert plan_format(info, 5 * MB).spec == '18'
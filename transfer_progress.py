@@ -0,0 +1,104 @@
+"""
+Upload progress and throughput
+TransferProgress counts bytes moved by an upload; ProgressReader wraps the
+file handle given to HTTPX so every read() is counted, and Pyrogram's
+progress= callback can update the same counter. Finished uploads are
+recorded in a ThroughputTracker so measured upload speed can be reported.
+"""
+
+import time
+import threading
+
+
+class TransferProgress:
+    """Byte counter for one transfer"""
+
+    def __init__(self, total: int = 0):
+        self.total = total
+        self.done = 0
+        self.started_at = time.time()
+
+    def restart(self):
+        """Start counting again (e.g. a fallback upload after a failed one)"""
+        self.done = 0
+        self.started_at = time.time()
+
+    def add(self, nbytes: int):
+        self.done += nbytes
+
+    def set(self, current: int, total: int = None):
+        """Pyrogram-style progress(current, total) callback"""
+        self.done = current
+        if total:
+            self.total = total
+
+    @property
+    def elapsed(self) -> float:
+        return time.time() - self.started_at
+
+    @property
+    def speed(self) -> float:
+        elapsed = self.elapsed
+        return self.done / elapsed if elapsed > 0 else 0
+
+
+class ProgressReader:
+    """Read-only file wrapper that reports bytes read to a TransferProgress
+
+    fileno/seek/tell are passed through so HTTPX can still size the file,
+    and a rewind (seek) on retry resets the count.
+    """
+
+    def __init__(self, file, progress: TransferProgress):
+        self._file = file
+        self._progress = progress
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._file.read(size)
+        self._progress.add(len(chunk))
+        return chunk
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        position = self._file.seek(offset, whence)
+        self._progress.done = position
+        return position
+
+    def __getattr__(self, name):
+        # tell, fileno, name, close...
+        return getattr(self._file, name)
+
+
+class ThroughputTracker:
+    """Totals and a moving average of measured transfer speed"""
+
+    def __init__(self, smoothing: float = 0.3):
+        self.smoothing = smoothing
+        self.count = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.last_rate = 0.0
+        self.average_rate = 0.0  # exponentially weighted, bytes/second
+        self._lock = threading.Lock()
+
+    def record(self, nbytes: int, seconds: float):
+        if seconds <= 0:
+            return
+        rate = nbytes / seconds
+        with self._lock:
+            self.count += 1
+            self.bytes += nbytes
+            self.seconds += seconds
+            self.last_rate = rate
+            if self.count == 1:
+                self.average_rate = rate
+            else:
+                self.average_rate += self.smoothing * (rate - self.average_rate)
+
+
+# Global upload throughput, per upload path
+upload_throughput = {
+    'bot_api': ThroughputTracker(),  # multipart upload from a temp file
+    'relay': ThroughputTracker(),    # streamed straight from the source (stream_relay)
+    'bridge': ThroughputTracker(),   # Pyrogram user-account upload
+    'local': ThroughputTracker(),    # file:// path read in place by a --local Bot API server
+}
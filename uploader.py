@@ -1,38 +1,418 @@
 import os
+import math
+import time
 import asyncio
+import mimetypes
 from typing import Tuple
 
-from pyrogram import Client
+from pyrogram import Client, raw
+from pyrogram.errors import FilePartMissing, FloodWait, Unauthorized
+from pyrogram.session import Session
 
-from config import API_ID, API_HASH, TG_SESSION_STRING, BRIDGE_CHANNEL_ID
+import metrics
+from config import (
+    API_ID,
+    API_HASH,
+    TG_SESSION_STRINGS,
+    BRIDGE_CHANNEL_ID,
+    BRIDGE_MAX_FLOOD_WAIT,
+    BRIDGE_UPLOAD_SESSIONS,
+    BRIDGE_UPLOAD_PARTS_IN_FLIGHT,
+)
 
-_pyro_client: Client | None = None
-_started = False
-_lock = asyncio.Lock()
+# MTProto upload parts: 512 KB each; files over 10 MB use SaveBigFilePart
+PART_SIZE = 512 * 1024
+BIG_FILE_SIZE = 10 * 1024 * 1024
+
+# Attempts per part before the whole upload fails
+PART_RETRIES = 5
+
+# FloodWaits up to this long are slept through per part; longer ones rest the account
+PART_FLOOD_SLEEP_MAX = 30
+
+# A client that failed to start is retried after this long
+START_RETRY_DELAY = 60
+
+
+class BridgeClient:
+    """One bridge account: a lazily started Pyrogram client plus its load and FloodWait state"""
+
+    def __init__(self, index: int, session_string: str):
+        self.index = index
+        self.name = f"bridge{index}"
+        # name can be anything; session_string is used
+        self.client = Client(
+            name=self.name,
+            api_id=API_ID,
+            api_hash=API_HASH,
+            session_string=session_string,
+            no_updates=True,
+            in_memory=True,
+        )
+        self.started = False
+        self.disabled = False   # session revoked/unauthorized: never used again
+        self.active = 0         # uploads running on this account
+        self.uploads = 0
+        self.flood_waits = 0
+        self.available_at = 0.0  # time.monotonic() before which the account rests
+        self.last_error = None
+        # Connection lifecycle, for the health server
+        self.connected_at = None
+        self.reconnects = 0
+        self.last_ping_ms = None
+        self.last_ping_at = None
+        self._lock = asyncio.Lock()
+
+    def cooling(self, now: float) -> bool:
+        return self.available_at > now
+
+    def rest(self, seconds: float, reason: str):
+        self.available_at = max(self.available_at, time.monotonic() + seconds)
+        self.last_error = reason
+
+    @property
+    def state(self) -> str:
+        if self.disabled:
+            return 'disabled'
+        if self.cooling(time.monotonic()):
+            return 'resting'
+        return 'connected' if self.started else 'disconnected'
+
+    async def ensure_started(self) -> Client:
+        async with self._lock:
+            if not self.started:
+                try:
+                    await self.client.start()
+                except Unauthorized as e:
+                    self.disabled = True
+                    self.last_error = str(e)
+                    print(f"❌ {self.name}: session not authorized, disabled ({e})")
+                    raise
+                except Exception as e:
+                    self.rest(START_RETRY_DELAY, str(e))
+                    print(f"⚠️ {self.name}: could not start ({e}), retrying in {START_RETRY_DELAY}s")
+                    raise
+                self.started = True
+                self.connected_at = time.time()
+                print(f"🔌 {self.name} connected")
+                await self._resolve_channel()
+        return self.client
+
+    async def _resolve_channel(self):
+        """Cache the bridge channel's access hash now instead of on the first upload"""
+        try:
+            await self.client.get_chat(BRIDGE_CHANNEL_ID)
+        except Exception:
+            # Not resolvable by ID alone: the dialog list carries the access hash
+            try:
+                async for _ in self.client.get_dialogs(limit=200):
+                    pass
+            except Exception as e:
+                print(f"⚠️ {self.name}: could not resolve the bridge channel ({e})")
+
+    async def reconnect(self):
+        self.reconnects += 1
+        print(f"🔄 {self.name}: reconnecting ({self.last_error})")
+        try:
+            await self.stop()
+        except Exception:
+            pass
+        try:
+            await self.ensure_started()
+        except Exception:
+            pass  # already logged; it rests and the next keepalive tries again
+
+    async def keepalive(self):
+        """Ping an idle account; reconnect it if the ping fails or it dropped out"""
+        if self.disabled or self.active or self.cooling(time.monotonic()):
+            return  # running uploads prove the connection; resting accounts wait
+        if not self.started:
+            await self.reconnect()
+            return
+        if not await self.check() and not self.disabled:
+            await self.reconnect()
+
+    async def check(self) -> bool:
+        """Health check: a cheap API call on a started client"""
+        if not self.started:
+            return False
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self.client.get_me(), timeout=30)
+            self.last_ping_ms = round((time.monotonic() - started) * 1000)
+            self.last_ping_at = time.time()
+            return True
+        except FloodWait as e:
+            self.rest(e.value, f"FloodWait {e.value}s")
+            return True
+        except Unauthorized as e:
+            self.disabled = True
+            self.last_error = str(e)
+            return False
+        except Exception as e:
+            self.last_error = str(e)
+            return False
+
+    async def stop(self):
+        async with self._lock:
+            if self.started:
+                try:
+                    await self.client.stop()
+                finally:
+                    self.started = False
+                    self.connected_at = None
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            'name': self.name,
+            'state': self.state,
+            'connected_seconds': round(time.time() - self.connected_at) if self.connected_at else 0,
+            'reconnects': self.reconnects,
+            'last_ping_ms': self.last_ping_ms,
+            'last_ping_age': round(time.time() - self.last_ping_at) if self.last_ping_at else None,
+            'active': self.active,
+            'uploads': self.uploads,
+            'flood_waits': self.flood_waits,
+            'resting_for': max(0, round(self.available_at - now)),
+            'last_error': self.last_error,
+        }
+
+
+class BridgePool:
+    """Least-loaded dispatch over several bridge accounts
+
+    acquire() hands out the usable account with the fewest running
+    uploads (ties go round-robin). Accounts resting after a FloodWait are
+    skipped; if every account rests, the caller waits for the first to come
+    back, unless that is more than max_flood_wait away.
+    """
+
+    def __init__(self, session_strings, max_flood_wait: float = 300):
+        self.clients = [BridgeClient(i + 1, session) for i, session in enumerate(session_strings)]
+        self.max_flood_wait = max_flood_wait
+        self._turn = 0
+        self._keepalive = None
+
+    async def acquire(self, exclude=()) -> BridgeClient:
+        exclude = set(exclude)
+        while True:
+            now = time.monotonic()
+            usable = [c for c in self.clients if not c.disabled and c not in exclude]
+            if not usable:
+                raise RuntimeError("No usable bridge account")
+            ready = [c for c in usable if not c.cooling(now)]
+            if ready:
+                self._turn += 1
+                bridge = min(ready, key=lambda c: (c.active, (c.index - self._turn) % len(self.clients)))
+                bridge.active += 1
+                try:
+                    await bridge.ensure_started()
+                except Exception:
+                    bridge.active -= 1
+                    exclude.add(bridge)  # now resting or disabled; try the others
+                    continue
+                return bridge
+            wait = min(c.available_at for c in usable) - now
+            if wait > self.max_flood_wait:
+                raise RuntimeError(f"All bridge accounts are rate limited for {wait:.0f}s")
+            await asyncio.sleep(wait)
+
+    def release(self, bridge: BridgeClient):
+        bridge.active -= 1
+
+    async def start(self, keepalive_interval: float = 60):
+        """Connect every account up front (handshake, auth, channel lookup), then keep them alive"""
+        results = await asyncio.gather(*(c.ensure_started() for c in self.clients), return_exceptions=True)
+        ready = sum(1 for result in results if not isinstance(result, BaseException))
+        print(f"🌉 Bridge warmed up: {ready}/{len(self.clients)} account(s) connected")
+        if keepalive_interval > 0 and self._keepalive is None:
+            self._keepalive = asyncio.create_task(self._run_keepalive(keepalive_interval))
+
+    async def _run_keepalive(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.gather(*(c.keepalive() for c in self.clients), return_exceptions=True)
+
+    async def stop(self):
+        if self._keepalive is not None:
+            self._keepalive.cancel()
+            await asyncio.gather(self._keepalive, return_exceptions=True)
+            self._keepalive = None
+        await asyncio.gather(*(c.stop() for c in self.clients), return_exceptions=True)
+        print("🔌 Bridge accounts disconnected")
+
+    def stats(self) -> dict:
+        clients = [c.stats() for c in self.clients]
+        return {
+            'accounts': len(clients),
+            'connected': sum(1 for c in clients if c['state'] == 'connected'),
+            'clients': clients,
+        }
+
+
+_pool: BridgePool | None = None
 
 
 def _ensure_bridge_config():
-    if not TG_SESSION_STRING or BRIDGE_CHANNEL_ID == 0:
+    if not TG_SESSION_STRINGS or BRIDGE_CHANNEL_ID == 0:
         raise RuntimeError("Bridge not configured: set TG_SESSION_STRING and BRIDGE_CHANNEL_ID in .env")
 
 
-async def _get_client() -> Client:
-    global _pyro_client, _started
+def get_pool() -> BridgePool:
+    global _pool
     _ensure_bridge_config()
-    async with _lock:
-        if _pyro_client is None:
-            # name can be anything; session_string is used
-            _pyro_client = Client(
-                name="bridge",
-                api_id=API_ID,
-                api_hash=API_HASH,
-                session_string=TG_SESSION_STRING,
-                no_updates=True,
+    if _pool is None:
+        _pool = BridgePool(TG_SESSION_STRINGS, max_flood_wait=BRIDGE_MAX_FLOOD_WAIT)
+        print(f"🌉 Bridge pool: {len(_pool.clients)} account(s)")
+    return _pool
+
+
+class ParallelUpload:
+    """Upload one big file as SaveBigFilePart calls spread over several media sessions
+
+    Pyrogram's save_file pushes every part through a single media
+    connection. Here the parts go to a shared queue drained by
+    sessions x parts_in_flight workers, each session being its own MTProto
+    connection to the account's DC. A failed part is retried on its own
+    (FloodWait is honoured); the server assembles the file from part
+    indices, so completion order doesn't matter.
+    """
+
+    def __init__(self, client: Client, file_path: str, sessions: int = 4, parts_in_flight: int = 2, progress=None):
+        self.client = client
+        self.file_path = file_path
+        self.sessions = max(1, sessions)
+        self.parts_in_flight = max(1, parts_in_flight)
+        self.progress = progress
+        self.file_size = os.path.getsize(file_path)
+        self.total_parts = math.ceil(self.file_size / PART_SIZE)
+        self.file_id = client.rnd_id()
+        self.uploaded = 0
+
+    async def _open_session(self) -> Session:
+        session = Session(
+            self.client, await self.client.storage.dc_id(), await self.client.storage.auth_key(),
+            await self.client.storage.test_mode(), is_media=True
+        )
+        await session.start()
+        return session
+
+    async def save_part(self, session: Session, fd: int, part: int):
+        """Send one part, retrying it alone on failure"""
+        data = os.pread(fd, PART_SIZE, part * PART_SIZE)
+        error = None
+        for attempt in range(PART_RETRIES):
+            try:
+                ok = await session.invoke(raw.functions.upload.SaveBigFilePart(
+                    file_id=self.file_id,
+                    file_part=part,
+                    file_total_parts=self.total_parts,
+                    bytes=data
+                ))
+                if ok:
+                    return len(data)
+                error = RuntimeError(f"part {part} not saved")
+            except FloodWait as e:
+                if e.value > PART_FLOOD_SLEEP_MAX:
+                    raise  # the pool rests this account and moves to another
+                error = e
+                await asyncio.sleep(e.value)
+                continue
+            except Exception as e:
+                error = e
+            if attempt < PART_RETRIES - 1:
+                metrics.bridge_part_retries.inc()
+                await asyncio.sleep(2 ** attempt)
+        raise RuntimeError(f"Bridge upload failed at part {part}/{self.total_parts}: {error}")
+
+    async def _worker(self, session: Session, fd: int, queue: asyncio.Queue):
+        while True:
+            try:
+                part = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            sent = await self.save_part(session, fd, part)
+            self.uploaded += sent
+            if self.progress:
+                self.progress(min(self.uploaded, self.file_size), self.file_size)
+
+    async def upload(self) -> raw.types.InputFileBig:
+        queue = asyncio.Queue()
+        for part in range(self.total_parts):
+            queue.put_nowait(part)
+
+        session_count = min(self.sessions, self.total_parts)
+        sessions = await asyncio.gather(*(self._open_session() for _ in range(session_count)))
+        fd = os.open(self.file_path, os.O_RDONLY)
+        workers = [
+            asyncio.create_task(self._worker(session, fd, queue))
+            for session in sessions for _ in range(self.parts_in_flight)
+        ]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await asyncio.gather(*(session.stop() for session in sessions), return_exceptions=True)
+            os.close(fd)
+
+        return raw.types.InputFileBig(
+            id=self.file_id,
+            parts=self.total_parts,
+            name=os.path.basename(self.file_path)
+        )
+
+    async def resend_part(self, part: int):
+        """Re-upload a part the server reports missing when the file is used"""
+        session = await self._open_session()
+        fd = os.open(self.file_path, os.O_RDONLY)
+        try:
+            await self.save_part(session, fd, part)
+        finally:
+            os.close(fd)
+            await session.stop()
+
+
+async def _send_uploaded(client: Client, upload: ParallelUpload, filename: str, caption: str | None,
+                         thumb: str | None, video: bool, width: int, height: int, duration: int) -> int:
+    """Post an uploaded file to the bridge channel (what send_video/send_document do after save_file)"""
+    file = await upload.upload()
+    attributes = [raw.types.DocumentAttributeFilename(file_name=filename)]
+    if video:
+        attributes.insert(0, raw.types.DocumentAttributeVideo(
+            supports_streaming=True,
+            duration=duration or 0,
+            w=width or 0,
+            h=height or 0
+        ))
+    default_mime = "video/mp4" if video else "application/octet-stream"
+    media = raw.types.InputMediaUploadedDocument(
+        mime_type=mimetypes.guess_type(filename)[0] or default_mime,
+        file=file,
+        thumb=await client.save_file(thumb) if thumb else None,
+        attributes=attributes
+    )
+
+    for _ in range(PART_RETRIES):
+        try:
+            r = await client.invoke(
+                raw.functions.messages.SendMedia(
+                    peer=await client.resolve_peer(BRIDGE_CHANNEL_ID),
+                    media=media,
+                    message=caption or "",
+                    random_id=client.rnd_id()
+                )
             )
-        if not _started:
-            await _pyro_client.start()
-            _started = True
-    return _pyro_client
+        except FilePartMissing as e:
+            await upload.resend_part(e.value)
+            continue
+        for update in r.updates:
+            if isinstance(update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+                return update.message.id
+        raise RuntimeError("Bridge upload sent but no message came back")
+    raise RuntimeError("Bridge upload kept missing parts")
 
 
 def _is_video(filename: str) -> bool:
@@ -42,12 +422,54 @@ def _is_video(filename: str) -> bool:
     ))
 
 
-async def upload_to_bridge(file_path: str, filename: str, caption: str | None = None) -> Tuple[int, int]:
+async def upload_to_bridge(file_path: str, filename: str, caption: str | None = None, progress=None,
+                           thumb: str | None = None, width: int = 0, height: int = 0, duration: int = 0) -> Tuple[int, int]:
     """
-    Uploads the file to the bridge channel using the user account (Pyrogram)
-    and returns (chat_id, message_id) of the uploaded message.
+    Uploads the file to the bridge channel using one of the bridge accounts
+    (Pyrogram) and returns (chat_id, message_id) of the uploaded message.
+    progress(current, total) is called as parts are sent; thumb/width/height/duration
+    describe videos. An account hit by FloodWait rests and the upload moves
+    to another one.
     """
-    client = await _get_client()
+    pool = get_pool()
+    flooded = set()
+    while True:
+        # Prefer accounts that haven't flooded on this file; all flooded: wait for the first back
+        try:
+            bridge = await pool.acquire(exclude=flooded)
+        except RuntimeError:
+            if not flooded:
+                raise
+            flooded.clear()
+            continue
+        try:
+            message_id = await _upload_with(bridge.client, file_path, filename, caption, progress,
+                                            thumb, width, height, duration)
+            bridge.uploads += 1
+            return BRIDGE_CHANNEL_ID, message_id
+        except FloodWait as e:
+            bridge.flood_waits += 1
+            metrics.bridge_flood_waits.inc(account=bridge.name)
+            bridge.rest(e.value, f"FloodWait {e.value}s")
+            flooded.add(bridge)
+            print(f"⏳ {bridge.name}: FloodWait {e.value}s, moving the upload to another account")
+        finally:
+            pool.release(bridge)
+
+
+async def _upload_with(client: Client, file_path: str, filename: str, caption: str | None, progress,
+                       thumb: str | None, width: int, height: int, duration: int) -> int:
+    # Big files: parts in parallel over several media sessions
+    if BRIDGE_UPLOAD_SESSIONS > 1 and os.path.getsize(file_path) > BIG_FILE_SIZE:
+        upload = ParallelUpload(
+            client, file_path,
+            sessions=BRIDGE_UPLOAD_SESSIONS,
+            parts_in_flight=BRIDGE_UPLOAD_PARTS_IN_FLIGHT,
+            progress=progress,
+        )
+        return await _send_uploaded(
+            client, upload, filename, caption, thumb, _is_video(filename), width, height, duration
+        )
 
     if _is_video(filename):
         msg = await client.send_video(
@@ -55,12 +477,18 @@ async def upload_to_bridge(file_path: str, filename: str, caption: str | None =
             video=file_path,
             caption=caption,
             supports_streaming=True,
+            thumb=thumb,
+            width=width or 0,
+            height=height or 0,
+            duration=duration or 0,
+            progress=progress,
         )
     else:
         msg = await client.send_document(
             chat_id=BRIDGE_CHANNEL_ID,
             document=file_path,
             caption=caption,
+            progress=progress,
         )
 
-    return BRIDGE_CHANNEL_ID, msg.id
+    return msg.id
@@ -0,0 +1,95 @@
+"""
+Post-download video preparation
+Before a video is uploaded: remux MP4/MOV files whose moov atom sits after
+the media data with ffmpeg -movflags +faststart (stream copy, no
+re-encode), so Telegram clients can start playback before the whole file
+has arrived, and grab a JPEG thumbnail frame. ffmpeg runs as an async
+subprocess with a concurrency limit; files that are already fast-start are
+left alone.
+"""
+
+import os
+import asyncio
+
+from media_probe import MP4_EXTENSIONS, mp4_is_faststart
+
+# Telegram thumbnails: JPEG, at most 320px on the long side
+THUMBNAIL_SIZE = 320
+
+
+class VideoPrep:
+    """Bounded ffmpeg runner for fast-start remuxes and thumbnails"""
+
+    def __init__(self, concurrency: int = 2, timeout: float = 600):
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._ffmpeg_missing = False
+        self.remuxed = 0
+        self.skipped = 0
+
+    async def run(self, *args) -> bool:
+        """Run ffmpeg with args; True on success"""
+        if self._ffmpeg_missing:
+            return False
+        async with self._semaphore:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', *args,
+                    stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+                )
+            except FileNotFoundError:
+                print("⚠️ ffmpeg not found; skipping video preparation")
+                self._ffmpeg_missing = True
+                return False
+            try:
+                _, stderr = await asyncio.wait_for(process.communicate(), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                print("⚠️ ffmpeg timed out")
+                return False
+            except asyncio.CancelledError:
+                process.kill()
+                await process.wait()
+                raise
+        if process.returncode != 0:
+            print(f"⚠️ ffmpeg failed: {stderr.decode(errors='replace').strip()[:300]}")
+            return False
+        return True
+
+    async def faststart(self, file_path: str) -> bool:
+        """Move the moov atom to the front in place; True if the file was rewritten"""
+        if not file_path.lower().endswith(MP4_EXTENSIONS):
+            return False
+        if mp4_is_faststart(file_path) is not False:
+            self.skipped += 1
+            return False
+
+        root, ext = os.path.splitext(file_path)
+        temp_path = f"{root}.faststart{ext}"
+        try:
+            ok = await self.run(
+                '-i', file_path, '-map', '0', '-c', 'copy', '-movflags', '+faststart', temp_path,
+            )
+            if not ok:
+                return False
+            os.replace(temp_path, file_path)
+            self.remuxed += 1
+            return True
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+    async def thumbnail(self, file_path: str, duration: int = None) -> str:
+        """Extract a JPEG frame for the upload thumbnail; returns its path or None"""
+        thumb_path = os.path.splitext(file_path)[0] + '.thumb.jpg'
+        # A frame a little way in is more representative than the (often black) first one
+        position = min(duration * 0.1, 10) if duration else 0
+        ok = await self.run(
+            '-ss', f"{position:.2f}", '-i', file_path, '-frames:v', '1',
+            '-vf', f"scale='if(gt(iw,ih),min({THUMBNAIL_SIZE},iw),-2)':'if(gt(iw,ih),-2,min({THUMBNAIL_SIZE},ih))'",
+            '-q:v', '5', thumb_path,
+        )
+        if ok and os.path.exists(thumb_path) and os.path.getsize(thumb_path) > 0:
+            return thumb_path
+        return None
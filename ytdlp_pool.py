@@ -0,0 +1,332 @@
+"""
+yt-dlp process pool
+Runs yt-dlp extraction and downloads in worker processes so its CPU- and
+GIL-heavy work doesn't compete with the bot's event loop. Progress events
+are sent back over a multiprocessing queue and delivered to the caller's
+progress hook on the event loop thread. Workers are recycled after a fixed
+number of jobs to bound memory growth. A cancelled job is asked to stop
+from its progress hook; a worker that doesn't stop in time is killed and
+the pool rebuilt, and the other jobs that pool was running are resubmitted
+to the new one. DownloadWatchdog replaces a fixed timeout with a
+deadline that follows the download's measured progress.
+"""
+
+import os
+import sys
+import time
+import signal
+import asyncio
+import weakref
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import yt_dlp
+
+# Keys copied from yt-dlp progress dicts; the rest (info dicts etc.) isn't picklable or needed
+_PROGRESS_FIELDS = (
+    'status', 'downloaded_bytes', 'total_bytes', 'total_bytes_estimate',
+    'speed', 'eta', 'elapsed', 'filename', 'fragment_index', 'fragment_count',
+)
+
+# Ring of recently cancelled job ids shared with the workers
+CANCEL_SLOTS = 64
+
+# Seconds a cancelled job gets to stop on its own before its worker is killed
+CANCEL_GRACE = 10
+
+# Info dict keys the bot never reads and downloads don't need; on big sites
+# (automatic captions in every language, dozens of thumbnails) they are most of the dict
+_UNUSED_INFO_FIELDS = (
+    'automatic_captions', 'subtitles', 'thumbnails', 'heatmap', 'chapters',
+    'description', 'comments', 'tags', 'categories',
+)
+
+# Set in each worker process by _init_worker
+_progress_queue = None
+_cancelled = None
+
+
+def _init_worker(queue, cancelled):
+    global _progress_queue, _cancelled
+    _progress_queue = queue
+    _cancelled = cancelled
+
+
+def _invoke(job_id: int, report_progress: bool, func, args):
+    """Worker-side entry point: run func with a hook that forwards progress to the parent"""
+    # Tells the parent which process owns the job, so a stuck job can be killed
+    _progress_queue.put((job_id, {'status': 'started', 'pid': os.getpid()}))
+
+    def hook(d):
+        if job_id in _cancelled[:]:
+            raise yt_dlp.utils.DownloadCancelled('cancelled by the bot')
+        if report_progress:
+            _progress_queue.put((job_id, {k: d[k] for k in _PROGRESS_FIELDS if k in d}))
+    return func(hook, *args)
+
+
+# ----- jobs (run inside worker processes) -----
+
+def extract_info(progress_hook, url: str, ydl_opts: dict) -> dict:
+    """Resolve a page to its (picklable) info dict without downloading anything
+
+    Fields nothing uses are dropped: the dict is pickled back to the bot and
+    kept in the extraction cache.
+    """
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+        info = ydl.sanitize_info(info)
+    for entry in [info] + list(info.get('entries') or ()):
+        if isinstance(entry, dict):
+            for key in _UNUSED_INFO_FIELDS:
+                entry.pop(key, None)
+    return info
+
+
+def download_info(progress_hook, info: dict, ydl_opts: dict) -> str:
+    """Download from an already-extracted info dict and return the final file path
+
+    Re-processing the info dict (like --load-info-json does) selects formats
+    and downloads without fetching the page or resolving the player again.
+    """
+    ydl_opts = dict(ydl_opts, progress_hooks=[progress_hook])
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        result = ydl.process_ie_result(info, download=True)
+        downloads = result.get('requested_downloads') or []
+        if downloads and downloads[-1].get('filepath'):
+            return downloads[-1]['filepath']
+        return ydl.prepare_filename(result)
+
+
+# ----- parent side -----
+
+class DownloadStalled(Exception):
+    """A yt-dlp download stopped making progress"""
+
+
+class DownloadWatchdog:
+    """Deadline for one yt-dlp download that follows its measured progress
+
+    The initial budget comes from the expected size at a pessimistic speed
+    (never less than min_timeout). Progress events push the deadline out to
+    the projected finish at the measured speed, with slack; max_timeout caps
+    it. A download whose byte count doesn't move for stall_timeout fails
+    early instead of waiting out the deadline. Either way the download is
+    cancelled and its worker stopped before the error is raised.
+    """
+
+    def __init__(self, expected_size: int = 0, min_timeout: float = 300, max_timeout: float = 3 * 3600,
+                 stall_timeout: float = 120, min_speed: float = 256 * 1024):
+        now = time.monotonic()
+        self.min_timeout = min_timeout
+        self.stall_timeout = stall_timeout
+        self.max_deadline = now + max(min_timeout, max_timeout)
+        self.deadline = min(now + max(min_timeout, expected_size / max(1, min_speed)), self.max_deadline)
+        self.downloaded = 0
+        self.last_progress = now
+        self.downloading = False  # stall detection only applies while bytes are expected
+
+    def _extend(self, deadline: float):
+        self.deadline = min(max(self.deadline, deadline), self.max_deadline)
+
+    def update(self, d: dict):
+        """Feed a yt-dlp progress dict (on the event loop thread)"""
+        now = time.monotonic()
+        status = d.get('status')
+        if status == 'finished':
+            # Merging/post-processing follows and reports no progress
+            self.downloading = False
+            self._extend(now + self.min_timeout)
+            return
+        if status != 'downloading':
+            return
+        if not self.downloading:
+            self.downloading = True
+            self.last_progress = now
+        downloaded = d.get('downloaded_bytes') or 0
+        if downloaded != self.downloaded:
+            self.downloaded = downloaded
+            self.last_progress = now
+        total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+        speed = d.get('speed') or 0
+        if total > downloaded and speed > 0:
+            self._extend(now + (total - downloaded) / speed * 1.5 + 60)
+
+    @property
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    async def watch(self, awaitable, poll: float = 5):
+        """Await a download; TimeoutError past the deadline, DownloadStalled if it stops moving"""
+        task = asyncio.ensure_future(awaitable)
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=min(poll, max(0.1, self.remaining)))
+                if done:
+                    return task.result()
+                if self.downloading and time.monotonic() - self.last_progress > self.stall_timeout:
+                    raise DownloadStalled(f"no progress for {self.stall_timeout:.0f}s")
+                if self.remaining <= 0:
+                    raise asyncio.TimeoutError()
+        finally:
+            if not task.done():
+                # Wait for the cancellation to reach the pool, which stops (or kills)
+                # the worker before the caller can retry into the same files
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+
+class YtdlpPool:
+    """ProcessPoolExecutor wrapper with progress forwarding and worker recycling"""
+
+    def __init__(self, workers: int = 2, recycle_after: int = 20):
+        self.workers = max(1, workers)
+        self.recycle_after = recycle_after
+        self._context = multiprocessing.get_context('spawn')
+        self._executor = None
+        self._queue = None
+        self._pump_thread = None
+        self._listeners = {}  # job_id -> (loop, callback)
+        self._pids = {}  # job_id -> worker pid, for running jobs
+        self._cancelled = self._context.Array('q', CANCEL_SLOTS)
+        self._cancel_slot = 0
+        self._killed = weakref.WeakSet()  # executors broken on purpose by _reap
+        self._job_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._executor is not None:
+                return
+            if self._queue is None:
+                self._queue = self._context.Queue()
+                self._pump_thread = threading.Thread(target=self._pump, name='ytdlp-progress', daemon=True)
+                self._pump_thread.start()
+            options = {}
+            # Recycling needs Python 3.11+ (and a non-fork start method)
+            if self.recycle_after and sys.version_info >= (3, 11):
+                options['max_tasks_per_child'] = self.recycle_after
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=self._context,
+                initializer=_init_worker,
+                initargs=(self._queue, self._cancelled),
+                **options,
+            )
+            print(f"🧵 yt-dlp process pool started: {self.workers} workers")
+
+    def _pump(self):
+        """Forward progress events from workers to their listener's event loop"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            job_id, event = item
+            if event.get('status') == 'started':
+                with self._lock:
+                    if job_id in self._pids:
+                        self._pids[job_id] = event['pid']
+                continue
+            listener = self._listeners.get(job_id)
+            if listener:
+                loop, callback = listener
+                try:
+                    loop.call_soon_threadsafe(callback, event)
+                except RuntimeError:
+                    pass  # loop already closed
+
+    async def run(self, func, *args, progress=None):
+        """Run a module-level job function in a worker; progress(d) gets yt-dlp progress dicts"""
+        job_id = next(self._job_ids)
+        if progress:
+            self._listeners[job_id] = (asyncio.get_running_loop(), progress)
+        self._pids[job_id] = None
+        future = None
+        try:
+            while True:
+                self._ensure_started()
+                executor = self._executor
+                future = executor.submit(_invoke, job_id, bool(progress), func, args)
+                try:
+                    return await asyncio.wrap_future(future)
+                except BrokenProcessPool:
+                    if executor in self._killed:
+                        # Another job's stuck worker was killed and took this one down with it
+                        print(f"🔁 Resubmitting yt-dlp job {job_id} to the rebuilt pool")
+                        continue
+                    raise
+        except BrokenProcessPool:
+            # A worker died (OOM, segfault); start a fresh pool for the next job
+            print("⚠️ yt-dlp process pool broke, restarting it")
+            self._reset(executor)
+            raise Exception("پردازش yt-dlp به طور غیرمنتظره متوقف شد")
+        except asyncio.CancelledError:
+            # Cancelling the asyncio side doesn't stop a job that already runs in a worker
+            if future is not None and not future.done():
+                self._cancel(job_id)
+                # Return only once the worker has let go of the job's files (a retry
+                # would otherwise share its .part file); shielded so a second cancel
+                # doesn't abandon the reaping
+                reap = asyncio.get_running_loop().create_task(self._reap(job_id, future, executor))
+                await asyncio.shield(reap)
+            raise
+        finally:
+            self._listeners.pop(job_id, None)
+            if future is None or future.done():
+                self._forget(job_id)
+
+    def _forget(self, job_id: int):
+        with self._lock:
+            self._pids.pop(job_id, None)
+
+    def _cancel(self, job_id: int):
+        """Flag job_id so its worker's progress hook aborts the download"""
+        with self._cancelled.get_lock():
+            self._cancelled[self._cancel_slot] = job_id
+            self._cancel_slot = (self._cancel_slot + 1) % CANCEL_SLOTS
+
+    async def _reap(self, job_id: int, future, executor):
+        """Kill a cancelled job's worker if it doesn't stop within CANCEL_GRACE
+
+        Extraction and stalled downloads report no progress, so the hook never
+        gets to abort them. Killing a worker breaks the whole executor, so the
+        pool is rebuilt; run() resubmits the other jobs it held (their workers
+        are terminated with it, and downloads resume from their .part files).
+        """
+        deadline = time.monotonic() + CANCEL_GRACE
+        while not future.done() and time.monotonic() < deadline:
+            await asyncio.sleep(0.5)
+        try:
+            if future.done():
+                return
+            pid = self._pids.get(job_id)
+            print(f"⚠️ cancelled yt-dlp job {job_id} is still running, killing worker {pid}")
+            self._killed.add(executor)
+            if pid:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            # Queued jobs must fail with BrokenProcessPool (and be resubmitted), not be cancelled
+            self._reset(executor, cancel_futures=False)
+        finally:
+            self._forget(job_id)
+
+    def _reset(self, executor=None, cancel_futures: bool = True):
+        """Drop the current executor (or only executor, if it is still the current one)"""
+        with self._lock:
+            if executor is not None and executor is not self._executor:
+                return  # already replaced
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=cancel_futures)
+
+    def shutdown(self):
+        """Stop workers and the progress pump"""
+        self._reset()
+        if self._queue is not None:
+            self._queue.put(None)
+            self._queue = None